@@ -0,0 +1,153 @@
+# archivos_productos.py
+"""
+Lectura y escritura de listas de productos en CSV o XLSX, fila por fila.
+
+Las filas se leen en el orden de COLUMNAS_ARCHIVO como texto (o None si la
+columna no está en el archivo): la validación y conversión se hacen en la
+base al importar. Para XLSX hace falta openpyxl.
+"""
+import csv
+import io
+import os
+import unicodedata
+
+COLUMNAS_ARCHIVO = ('codigo_barras', 'nombre', 'precio_costo', 'precio_venta',
+                    'margen_ganancia', 'disponible', 'venta_por_peso')
+
+# Encabezados aceptados (sin tildes ni mayúsculas) para cada columna
+_ALIAS = {
+    'codigo_barras': ('codigo_barras', 'codigo', 'cod', 'codigo de barras', 'ean', 'barcode'),
+    'nombre': ('nombre', 'descripcion', 'producto', 'articulo'),
+    'precio_costo': ('precio_costo', 'costo', 'precio costo', 'precio de costo'),
+    'precio_venta': ('precio_venta', 'venta', 'precio', 'precio venta', 'precio de venta'),
+    'margen_ganancia': ('margen_ganancia', 'margen', 'margen %', 'ganancia'),
+    'disponible': ('disponible', 'stock', 'cantidad'),
+    'venta_por_peso': ('venta_por_peso', 'por peso', 'pesable'),
+}
+
+
+def _normalizar_encabezado(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.strip().lower().replace('_', ' ').split())
+
+
+def _mapear_encabezados(encabezados):
+    """Devuelve, para cada columna de COLUMNAS_ARCHIVO, su posición en el archivo (o None)."""
+    normalizados = [_normalizar_encabezado(e) for e in encabezados]
+    posiciones = []
+    for columna in COLUMNAS_ARCHIVO:
+        alias = {_normalizar_encabezado(a) for a in _ALIAS[columna]}
+        posiciones.append(next((i for i, e in enumerate(normalizados) if e in alias), None))
+    if posiciones[0] is None:
+        raise ValueError("El archivo no tiene una columna de código de barras")
+    return posiciones
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # Excel guarda los códigos numéricos como float
+    texto = str(valor).strip()
+    return texto or None
+
+
+def _leer_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        muestra = archivo.read(4096)
+        archivo.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(archivo, dialecto)
+
+
+def _leer_xlsx(ruta):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Para importar archivos .xlsx instale openpyxl (pip install openpyxl)")
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(ruta):
+    """
+    Recorre un archivo de productos sin cargarlo entero en memoria.
+
+    Yields:
+        (numero_de_linea, tupla de textos en el orden de COLUMNAS_ARCHIVO)
+    """
+    lector = _leer_xlsx(ruta) if es_xlsx(ruta) else _leer_csv(ruta)
+    posiciones = None
+    for linea, fila in enumerate(lector, start=1):
+        if posiciones is None:
+            posiciones = _mapear_encabezados(fila)
+            continue
+        if not any(_texto(valor) for valor in fila):
+            continue  # Fila vacía
+        yield linea, tuple(
+            _texto(fila[i]) if i is not None and i < len(fila) else None
+            for i in posiciones
+        )
+
+
+class ArchivoCopy(io.TextIOBase):
+    """
+    Adaptador de solo lectura para COPY ... FROM STDIN (formato CSV).
+
+    Convierte las filas de leer_filas a líneas CSV a medida que psycopg2
+    las pide, así el archivo nunca se carga completo.
+    """
+
+    def __init__(self, filas):
+        self._filas = iter(filas)
+        self._buffer = ''
+        self._salida = io.StringIO()
+        self._escritor = csv.writer(self._salida, lineterminator='\n')
+        self.filas_leidas = 0
+
+    def readable(self):
+        return True
+
+    def read(self, tamano=-1):
+        while tamano < 0 or len(self._buffer) < tamano:
+            try:
+                linea, valores = next(self._filas)
+            except StopIteration:
+                break
+            self._escritor.writerow((linea,) + valores)
+            self._buffer += self._salida.getvalue()
+            self._salida.seek(0)
+            self._salida.truncate()
+            self.filas_leidas += 1
+        if tamano < 0:
+            datos, self._buffer = self._buffer, ''
+        else:
+            datos, self._buffer = self._buffer[:tamano], self._buffer[tamano:]
+        return datos
+
+
+def escribir_xlsx(ruta, encabezados, filas):
+    """Escribe filas en un XLSX en modo streaming (write_only)."""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("Para exportar archivos .xlsx instale openpyxl (pip install openpyxl)")
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Productos")
+    hoja.append(list(encabezados))
+    cantidad = 0
+    for fila in filas:
+        hoja.append(list(fila))
+        cantidad += 1
+    libro.save(ruta)
+    return cantidad
+
+
+def es_xlsx(ruta):
+    return os.path.splitext(ruta)[1].lower() == '.xlsx'
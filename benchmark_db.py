@@ -0,0 +1,621 @@
+"""
+Benchmarks de acceso a datos contra una base PostgreSQL de pruebas.
+
+Nunca ejecutar contra la base de producción: el script exige que la conexión
+se indique con variables de entorno GESTION_DB_* (ver config_postgres.py).
+
+Uso:
+    set GESTION_DB_HOST=localhost
+    set GESTION_DB_PORT=5432
+    set GESTION_DB_DATABASE=mydb
+    set GESTION_DB_USER=...
+    set GESTION_DB_PASSWORD=...
+    python benchmark_db.py reporte-ventas --ventas 1000 10000 100000
+    python benchmark_db.py stress-venta --hilos 8 --stock 200
+    python benchmark_db.py pago-deudas --deudas 100 1000 5000
+    python benchmark_db.py stress-lotes --hilos 8 --lotes 200
+    python benchmark_db.py asignacion-lotes --lotes 10 100 1000
+    python benchmark_db.py etiquetas-lotes
+    python benchmark_db.py importacion --filas 1000 100000
+    python benchmark_db.py arranque --modulos 15
+"""
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+if not os.environ.get("GESTION_DB_HOST"):
+    sys.exit("Defina GESTION_DB_HOST (y demás GESTION_DB_*) apuntando a una base de pruebas.")
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+import db_postgres
+
+PREFIJO = "BENCH "
+FECHA_BASE = "2001-01-01"
+
+
+class CursorContador(psycopg2.extensions.cursor):
+    """Cursor que cuenta las sentencias enviadas al servidor."""
+    consultas = 0
+    conexiones = 0  # Conexiones pedidas al pool
+
+    def execute(self, query, vars=None):
+        CursorContador.consultas += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        CursorContador.consultas += 1
+        return super().executemany(query, vars_list)
+
+
+def instrumentar_pool():
+    getconn_original = db_postgres.pool_manager.getconn
+
+    def getconn(*args, **kwargs):
+        conn = getconn_original(*args, **kwargs)
+        CursorContador.conexiones += 1
+        conn.cursor_factory = CursorContador
+        return conn
+
+    db_postgres.pool_manager.getconn = getconn
+
+
+def medir(funcion, *args, **kwargs):
+    CursorContador.consultas = CursorContador.conexiones = 0
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, CursorContador.consultas, time.perf_counter() - inicio
+
+
+def limpiar_datos_prueba():
+    with db_postgres.get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            # Clientes de prueba y todo lo que cuelga de ellos
+            cursor.execute("SELECT id FROM clientes WHERE nombre LIKE %s", (PREFIJO + '%',))
+            cliente_ids = [fila[0] for fila in cursor.fetchall()]
+            for tabla in ("pagos", "deudas", "movimientos_clientes", "saldos_clientes"):
+                cursor.execute(f"DELETE FROM {tabla} WHERE cliente_id = ANY(%s)", (cliente_ids,))
+            cursor.execute("DELETE FROM clientes WHERE id = ANY(%s)", (cliente_ids,))
+            cursor.execute("""
+                DELETE FROM detalle_ventas
+                WHERE producto_id IN (SELECT id FROM productos WHERE nombre LIKE %s)
+            """, (PREFIJO + '%',))
+            cursor.execute("DELETE FROM ventas WHERE fecha < '2002-01-01'")
+            cursor.execute("""
+                DELETE FROM lotes_productos
+                WHERE producto_id IN (SELECT id FROM productos WHERE nombre LIKE %s)
+            """, (PREFIJO + '%',))
+            cursor.execute("""
+                DELETE FROM modificaciones
+                WHERE producto_id IN (SELECT id FROM productos WHERE nombre LIKE %s)
+            """, (PREFIJO + '%',))
+            cursor.execute("DELETE FROM productos WHERE nombre LIKE %s", (PREFIJO + '%',))
+
+
+def crear_productos_prueba(cursor, cantidad=200):
+    filas = execute_values(cursor, """
+        INSERT INTO productos (codigo_barras, nombre, venta_por_peso, disponible,
+                               precio_costo, precio_venta, margen_ganancia)
+        VALUES %s RETURNING id
+    """, [
+        (f"B{i:06d}", f"{PREFIJO}{i}", i % 2, 1_000_000, 10 + i % 50, 15 + i % 70, 50)
+        for i in range(cantidad)
+    ], fetch=True)
+    return [fila[0] for fila in filas]
+
+
+def sembrar_ventas(cantidad, lineas_por_venta=3):
+    """Inserta ventas de prueba repartidas en enero de 2001."""
+    with db_postgres.get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            producto_ids = crear_productos_prueba(cursor)
+            ventas = execute_values(cursor, """
+                INSERT INTO ventas (fecha, monto_total, metodo_pago) VALUES %s RETURNING id
+            """, [
+                (f"2001-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00",
+                 random.uniform(100, 5000), random.choice(["Efectivo", "Débito", "Transferencia"]))
+                for i in range(cantidad)
+            ], fetch=True, page_size=1000)
+            execute_values(cursor, """
+                INSERT INTO detalle_ventas (venta_id, producto_id, cantidad, precio_costo, precio_venta)
+                SELECT v.venta_id, v.producto_id, v.cantidad, p.precio_costo, p.precio_venta
+                FROM (VALUES %s) AS v (venta_id, producto_id, cantidad)
+                JOIN productos p ON p.id = v.producto_id
+            """, [
+                (venta_id, random.choice(producto_ids), random.randint(1, 5))
+                for (venta_id,) in ventas
+                for _ in range(lineas_por_venta)
+            ], page_size=5000)
+
+
+def reporte_por_venta(fecha_inicio, fecha_fin):
+    """Estrategia anterior: encabezados y una consulta de detalle por venta."""
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT v.fecha, v.monto_total, v.metodo_pago, v.id
+                FROM ventas v
+                WHERE date(v.fecha) BETWEEN %s AND %s AND v.metodo_pago != 'Pago de deuda'
+            """, (fecha_inicio, fecha_fin))
+            ventas = cursor.fetchall()
+    resultado = []
+    for fecha, monto_total, metodo_pago, venta_id in ventas:
+        detalle = db_postgres.obtener_detalle_ventas1(venta_id)
+        ganancia = sum((item[3] - item[2]) * item[1] for item in detalle)
+        resultado.append((fecha, monto_total, metodo_pago, detalle, ganancia))
+    return resultado
+
+
+def benchmark_reporte_ventas(args):
+    print(f"{'ventas':>8} {'estrategia':<12} {'consultas':>10} {'segundos':>10}")
+    for cantidad in args.ventas:
+        limpiar_datos_prueba()
+        sembrar_ventas(cantidad)
+        estrategias = [("agrupada", db_postgres.obtener_reporte_ventas)]
+        if cantidad <= args.max_por_venta:
+            estrategias.append(("por venta", reporte_por_venta))
+        for nombre, funcion in estrategias:
+            filas, consultas, segundos = medir(funcion, FECHA_BASE, "2001-01-31")
+            assert len(filas) == cantidad, f"{nombre}: se esperaban {cantidad} ventas, hubo {len(filas)}"
+            print(f"{cantidad:>8} {nombre:<12} {consultas:>10} {segundos:>10.3f}")
+    limpiar_datos_prueba()
+
+
+def stress_venta(args):
+    """
+    Varios hilos venden a la vez el mismo producto hasta agotarlo.
+
+    Con la validación y el descuento en una sola sentencia no puede haber
+    sobreventa: las ventas exitosas tienen que coincidir con el stock inicial.
+    """
+    limpiar_datos_prueba()
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            producto_ids = crear_productos_prueba(cursor, cantidad=args.lineas)
+            cursor.execute("UPDATE productos SET disponible = %s, venta_por_peso = 0 WHERE id = ANY(%s)",
+                           (args.stock, producto_ids))
+    disputado = producto_ids[0]
+
+    venta_ids = []
+    exitosas = fallidas = 0
+    lock = threading.Lock()
+
+    def vender():
+        nonlocal exitosas, fallidas
+        while True:
+            exito, venta_id, _ = db_postgres.registrar_venta([(disputado, 1, 10.0)], 10.0, "Efectivo")
+            with lock:
+                if exito:
+                    exitosas += 1
+                    venta_ids.append(venta_id)
+                else:
+                    fallidas += 1
+                    return
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=vender) for _ in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    # Sentencias por venta: una venta de varias líneas, medida sola
+    lineas = [(producto_id, 1, 10.0) for producto_id in producto_ids[1:]]
+    (exito, venta_id, _), consultas, _ = medir(db_postgres.registrar_venta, lineas, 10.0 * len(lineas), "Efectivo")
+    venta_ids.append(venta_id)
+
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT disponible FROM productos WHERE id = %s", (disputado,))
+            stock_final = cursor.fetchone()[0]
+            # Las ventas de prueba se borran y el resumen del día se recalcula
+            cursor.execute("DELETE FROM detalle_ventas WHERE venta_id = ANY(%s)", (venta_ids,))
+            cursor.execute("DELETE FROM ventas WHERE id = ANY(%s)", (venta_ids,))
+    db_postgres.reconstruir_ventas_diarias(date.today().isoformat(), date.today().isoformat())
+    limpiar_datos_prueba()
+
+    print(f"hilos={args.hilos} stock inicial={args.stock} ventas exitosas={exitosas} "
+          f"rechazadas={fallidas} stock final={stock_final} ({segundos:.2f}s)")
+    print(f"sentencias para una venta de {len(lineas)} líneas: {consultas}")
+    assert exitosas == args.stock and stock_final == 0, "¡Sobreventa o stock inconsistente!"
+    print("Sin sobreventa")
+
+
+def stress_lotes(args):
+    """
+    Varios hilos venden a la vez carritos con lotes de un mismo producto.
+
+    Cada lote se puede vender una sola vez: los que otra terminal tiene
+    bloqueados se saltean (SKIP LOCKED) y esa venta se rechaza entera. Al
+    final ningún lote aparece en dos ventas y el stock del producto baja
+    exactamente lo vendido.
+    """
+    limpiar_datos_prueba()
+    peso_lote = 1.5
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            producto_id = crear_productos_prueba(cursor, cantidad=1)[0]
+            cursor.execute("UPDATE productos SET disponible = %s, venta_por_peso = 1 WHERE id = %s",
+                           (peso_lote * args.lotes, producto_id))
+            lote_ids = [fila[0] for fila in execute_values(cursor, """
+                INSERT INTO lotes_productos (producto_id, peso_lote, codigo_unico, codigo_numerico)
+                VALUES %s RETURNING id
+            """, [(producto_id, peso_lote, f"B{i:05d}", i) for i in range(args.lotes)], fetch=True)]
+
+    venta_ids = []
+    exitosas = rechazadas = 0
+    lock = threading.Lock()
+
+    def vender(semilla):
+        nonlocal exitosas, rechazadas
+        azar = random.Random(semilla)
+        # Cada hilo intenta vender todos los lotes, en desorden y de a carritos de 1 a 3
+        pendientes = lote_ids[:]
+        if semilla is not None:
+            azar.shuffle(pendientes)
+        while pendientes:
+            tamano = azar.randint(1, 3) if semilla is not None else 1
+            carrito, pendientes = pendientes[:tamano], pendientes[tamano:]
+            lineas = [(producto_id, peso_lote, 10.0, lote_id) for lote_id in carrito]
+            exito, venta_id, _ = db_postgres.registrar_venta(lineas, 10.0 * len(lineas), "Efectivo",
+                                                             usuario="bench")
+            with lock:
+                if exito:
+                    exitosas += 1
+                    venta_ids.append(venta_id)
+                else:
+                    rechazadas += 1
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=vender, args=(i,)) for i in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    # Un carrito rechazado puede dejar lotes sin vender: una pasada final, de a uno
+    rechazadas_concurrentes = rechazadas
+    vender(None)
+
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*), COUNT(DISTINCT lote_id), COALESCE(SUM(peso_vendido), 0)
+                FROM detalle_ventas WHERE venta_id = ANY(%s)
+            """, (venta_ids,))
+            lineas_vendidas, lotes_distintos, peso_vendido = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*) FROM lotes_productos WHERE id = ANY(%s) AND disponible",
+                           (lote_ids,))
+            lotes_disponibles = cursor.fetchone()[0]
+            cursor.execute("SELECT disponible FROM productos WHERE id = %s", (producto_id,))
+            stock_final = cursor.fetchone()[0]
+
+    # Una venta con lotes, medida sola: una conexión y sentencias fijas
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE lotes_productos SET disponible = TRUE WHERE id = ANY(%s)", (lote_ids[:3],))
+            cursor.execute("UPDATE productos SET disponible = disponible + %s WHERE id = %s",
+                           (peso_lote * 3, producto_id))
+    lineas = [(producto_id, peso_lote, 10.0, lote_id) for lote_id in lote_ids[:3]]
+    (exito, venta_id, _), consultas, _ = medir(db_postgres.registrar_venta, lineas, 30.0, "Efectivo",
+                                                usuario="bench")
+    conexiones = CursorContador.conexiones
+    venta_ids.append(venta_id)
+
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM detalle_ventas WHERE venta_id = ANY(%s)", (venta_ids,))
+            cursor.execute("DELETE FROM ventas WHERE id = ANY(%s)", (venta_ids,))
+    db_postgres.reconstruir_ventas_diarias(date.today().isoformat(), date.today().isoformat())
+    limpiar_datos_prueba()
+
+    print(f"hilos={args.hilos} lotes={args.lotes} ventas exitosas={exitosas} rechazadas={rechazadas_concurrentes} "
+          f"lotes vendidos={lotes_distintos} stock final={stock_final:.3f} ({segundos:.2f}s)")
+    print(f"venta de 3 lotes: {consultas} sentencias, {conexiones} conexión(es)")
+    assert lineas_vendidas == lotes_distintos == args.lotes, "¡Un lote se vendió dos veces o quedó sin vender!"
+    assert lotes_disponibles == 0 and abs(float(stock_final)) < 0.001, "Stock inconsistente con lo vendido"
+    assert abs(float(peso_vendido) - peso_lote * args.lotes) < 0.001
+    assert exito and conexiones == 1, "La venta con lotes usó más de una conexión"
+    print("Sin lotes vendidos dos veces")
+
+
+def benchmark_asignacion_lotes(args):
+    """
+    Reparto FIFO de un pedido de peso en productos con muchos lotes abiertos.
+
+    El pedido siempre cubre tres lotes y medio: las sentencias y los lotes
+    bloqueados no deben crecer con la cantidad de lotes del producto.
+    """
+    print(f"{'lotes':>8} {'asignados':>10} {'consultas':>10} {'segundos':>10}")
+    for cantidad in args.lotes:
+        limpiar_datos_prueba()
+        with db_postgres.get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                producto_id = crear_productos_prueba(cursor, cantidad=1)[0]
+                execute_values(cursor, """
+                    INSERT INTO lotes_productos (producto_id, peso_lote, codigo_unico, codigo_numerico, fecha_creacion)
+                    VALUES %s
+                """, [(producto_id, 2.0, f"B{i:05d}", i, f"2001-01-01 00:00:{i % 60:02d}")
+                      for i in range(cantidad)], page_size=1000)
+
+        (plan, mensaje), consultas, segundos = medir(db_postgres.seleccionar_lote_para_venta, producto_id, 7.0)
+        assert plan and len(plan) == 4, mensaje
+        assert abs(sum(peso for _, peso in plan) - 7.0) < 0.001
+        print(f"{cantidad:>8} {len(plan):>10} {consultas:>10} {segundos:>10.4f}")
+
+    limpiar_datos_prueba()
+
+
+def etiquetas_lotes(args):
+    """
+    Ida y vuelta de la etiqueta de un lote: se genera como en la ficha del
+    lote y se resuelve como al escanearla en ventas.
+
+    Cubre códigos generados con ceros a la izquierda, códigos cortos, de 6
+    dígitos y EAN-13 (la etiqueta solo lleva sus primeros 6 dígitos).
+    """
+    limpiar_datos_prueba()
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            producto_ids = execute_values(cursor, """
+                INSERT INTO productos (codigo_barras, nombre, venta_por_peso, disponible,
+                                       precio_costo, precio_venta, margen_ganancia)
+                VALUES %s RETURNING id, codigo_barras
+            """, [
+                (codigo, f"{PREFIJO}etiqueta {codigo}", 1, 0, 10, 15, 50)
+                for codigo in args.codigos
+            ], fetch=True)
+
+    print(f"{'código':<15} {'etiqueta':<16} {'lote':>8} {'resuelto':>9}")
+    fallidos = []
+    for producto_id, codigo in producto_ids:
+        for _ in range(args.lotes):
+            lote_id = db_postgres.agregar_lote_producto(producto_id, 1.25, usuario="bench")
+            assert lote_id is not None, f"No se pudo crear un lote para {codigo}"
+            info = db_postgres.obtener_info_lote(lote_id)
+            etiqueta = db_postgres.generar_codigo_barras_lote(info[7], info[8], info[2])
+            resuelto = db_postgres.obtener_lote_por_codigo_barras(etiqueta)
+            resuelto_id = resuelto['lote_id'] if resuelto else None
+            print(f"{codigo:<15} {etiqueta:<16} {lote_id:>8} {str(resuelto_id):>9}")
+            if resuelto_id != lote_id:
+                fallidos.append((codigo, etiqueta))
+    limpiar_datos_prueba()
+    assert not fallidos, f"Etiquetas que no resuelven su lote: {fallidos}"
+    print("Todas las etiquetas resuelven su lote")
+
+
+def sembrar_deudas(cantidad):
+    """Crea un cliente de prueba con `cantidad` ventas a crédito impagas de $100."""
+    with db_postgres.get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO clientes (nombre) VALUES (%s) RETURNING id", (f"{PREFIJO}cliente",))
+            cliente_id = cursor.fetchone()[0]
+            ventas = execute_values(cursor, """
+                INSERT INTO ventas (fecha, monto_total, metodo_pago) VALUES %s RETURNING id, fecha
+            """, [
+                ("2001-01-01 00:00:00", 100.0, "A Crédito") for _ in range(cantidad)
+            ], fetch=True, page_size=1000)
+            execute_values(cursor, """
+                INSERT INTO deudas (cliente_id, venta_id, fecha, monto) VALUES %s
+            """, [
+                (cliente_id, venta_id, f"2001-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}", 100.0)
+                for i, (venta_id, _) in enumerate(ventas)
+            ], page_size=5000)
+            # El libro de movimientos tiene que coincidir con el saldo
+            execute_values(cursor, """
+                INSERT INTO movimientos_clientes (cliente_id, fecha, tipo, venta_id, monto, saldo) VALUES %s
+            """, [
+                (cliente_id, fecha, 'VENTA', venta_id, 100.0, 100.0 * (i + 1))
+                for i, (venta_id, fecha) in enumerate(ventas)
+            ], page_size=5000)
+            cursor.execute("""
+                INSERT INTO saldos_clientes (cliente_id, total_deuda, saldo) VALUES (%s, %s, %s)
+            """, (cliente_id, 100.0 * cantidad, 100.0 * cantidad))
+    return cliente_id
+
+
+def estado_deudas(cliente_id):
+    with db_postgres.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*), COALESCE(SUM(monto), 0) FROM deudas WHERE cliente_id = %s
+            """, (cliente_id,))
+            return cursor.fetchone()
+
+
+def benchmark_pago_deudas(args):
+    """
+    Pagos de clientes con muchas deudas abiertas.
+
+    Un pago que cubre la mitad de las deudas más media deuda y otro que
+    salda el resto: las sentencias tienen que ser las mismas para cualquier
+    cantidad de deudas.
+    """
+    print(f"{'deudas':>8} {'pago':<8} {'imputadas':>10} {'consultas':>10} {'segundos':>10}")
+    for cantidad in args.deudas:
+        limpiar_datos_prueba()
+        cliente_id = sembrar_deudas(cantidad)
+
+        parcial = 100.0 * (cantidad // 2) + 50.0
+        exito, consultas, segundos = medir(db_postgres.registrar_pago_cliente, cliente_id, parcial)
+        abiertas, pendiente = estado_deudas(cliente_id)
+        assert exito and abiertas == cantidad - cantidad // 2, f"deudas abiertas: {abiertas}"
+        assert abs(float(pendiente) - (100.0 * cantidad - parcial)) < 0.01, f"pendiente: {pendiente}"
+        print(f"{cantidad:>8} {'parcial':<8} {cantidad // 2 + 1:>10} {consultas:>10} {segundos:>10.3f}")
+
+        exito, consultas, segundos = medir(db_postgres.registrar_pago_cliente, cliente_id, float(pendiente))
+        abiertas, _ = estado_deudas(cliente_id)
+        assert exito and abiertas == 0, f"quedaron {abiertas} deudas abiertas"
+        print(f"{cantidad:>8} {'total':<8} {cantidad - cantidad // 2:>10} {consultas:>10} {segundos:>10.3f}")
+
+        diferencias = [d for d in db_postgres.conciliar_saldos_clientes() if d[0] == cliente_id]
+        assert not diferencias, f"saldo inconsistente: {diferencias}"
+
+    limpiar_datos_prueba()
+    db_postgres.reconstruir_ventas_diarias(date.today().isoformat(), date.today().isoformat())
+
+
+def escribir_lista_prueba(ruta, cantidad, aumento=0):
+    """Lista de precios de prueba; con aumento, los pares cambian de precio."""
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        escritor = csv.writer(archivo, delimiter=";")
+        escritor.writerow(["Código", "Descripción", "Costo", "Precio", "Stock"])
+        for i in range(cantidad):
+            costo = 10 + i % 50 + (aumento if i % 2 == 0 else 0)
+            escritor.writerow([f"BI{i:08d}", f"{PREFIJO}importado {i}",
+                               f"{costo:.2f}".replace(".", ","), "", 100])
+
+
+def benchmark_importacion(args):
+    """
+    Importación y exportación de listas de productos.
+
+    Mide la vista previa, el alta de todos los productos, una segunda lista
+    que modifica la mitad de los precios y la exportación del catálogo.
+    """
+    print(f"{'filas':>8} {'etapa':<12} {'nuevos':>8} {'modif.':>8} {'consultas':>10} {'segundos':>10}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "lista.csv")
+        for cantidad in args.filas:
+            limpiar_datos_prueba()
+            escribir_lista_prueba(ruta, cantidad)
+            etapas = (
+                ("simulacion", dict(simular=True)),
+                ("alta", dict(simular=False)),
+                ("sin cambios", dict(simular=True)),
+            )
+            for etapa, opciones in etapas:
+                resumen, consultas, segundos = medir(db_postgres.importar_productos, ruta, "bench", **opciones)
+                print(f"{cantidad:>8} {etapa:<12} {resumen['nuevos']:>8} {resumen['modificados']:>8} "
+                      f"{consultas:>10} {segundos:>10.3f}")
+            assert resumen['sin_cambios'] == cantidad, f"sin cambios: {resumen['sin_cambios']}"
+
+            escribir_lista_prueba(ruta, cantidad, aumento=5)
+            resumen, consultas, segundos = medir(db_postgres.importar_productos, ruta, "bench", simular=False)
+            assert resumen['modificados'] == (cantidad + 1) // 2, f"modificados: {resumen['modificados']}"
+            print(f"{cantidad:>8} {'aumento':<12} {resumen['nuevos']:>8} {resumen['modificados']:>8} "
+                  f"{consultas:>10} {segundos:>10.3f}")
+
+            exportados, consultas, segundos = medir(db_postgres.exportar_productos,
+                                                    os.path.join(carpeta, "catalogo.csv"))
+            assert exportados >= cantidad, f"exportados: {exportados}"
+            print(f"{cantidad:>8} {'exportacion':<12} {'':>8} {'':>8} {consultas:>10} {segundos:>10.3f}")
+
+    limpiar_datos_prueba()
+
+
+def tiempos_importacion(modulo):
+    """
+    Importa el módulo en un proceso nuevo con -X importtime.
+
+    Returns:
+        Lista de (módulo, propio_us, acumulado_us) en el orden de importación.
+    """
+    proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                             capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+    tiempos = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        tiempos.append((nombre.strip(), int(propio), int(acumulado)))
+    return tiempos
+
+
+def benchmark_arranque(args):
+    """
+    Costo del arranque hasta la ventana de login.
+
+    Desglosa la importación de main (los módulos más caros por tiempo
+    acumulado) y mide la apertura del pool y la verificación del esquema: al
+    día (una consulta) frente a volver a ejecutar todo el DDL, como hacía
+    cada arranque antes de esquema_version.
+    """
+    tiempos = tiempos_importacion("main")
+    total = next(acumulado for nombre, _, acumulado in tiempos if nombre == "main")
+    print(f"importación de main: {total / 1000:.0f} ms")
+    print(f"{'módulo':<40} {'propio ms':>10} {'acumulado ms':>13}")
+    for nombre, propio, acumulado in sorted(tiempos, key=lambda t: t[2], reverse=True)[:args.modulos]:
+        print(f"{nombre:<40} {propio / 1000:>10.1f} {acumulado / 1000:>13.1f}")
+    for modulo in ("productos_tab", "ventas_tab", "etiquetas_tab"):
+        acumulado = sum(a for nombre, _, a in tiempos_importacion(modulo) if nombre == modulo)
+        print(f"{modulo + ' (diferido)':<40} {'':>10} {acumulado / 1000:>13.1f}")
+
+    print(f"\n{'etapa':<28} {'consultas':>10} {'segundos':>10}")
+    _, consultas, segundos = medir(lambda: db_postgres.pool_manager.pool)
+    print(f"{'apertura del pool':<28} {consultas:>10} {segundos:>10.3f}")
+    etapas = (
+        ("esquema (primera vez)", dict()),
+        ("esquema al día", dict()),
+        ("esquema con DDL completo", dict(forzar=True)),
+    )
+    for etapa, opciones in etapas:
+        _, consultas, segundos = medir(db_postgres.preparar_esquema, **opciones)
+        print(f"{etapa:<28} {consultas:>10} {segundos:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    reporte = subparsers.add_parser("reporte-ventas", help="Reporte de Caja: agrupado vs. consulta por venta")
+    reporte.add_argument("--ventas", type=int, nargs="+", default=[1000, 10000, 100000])
+    reporte.add_argument("--max-por-venta", type=int, default=10000,
+                         help="No medir la estrategia por venta por encima de esta cantidad")
+    reporte.set_defaults(funcion=benchmark_reporte_ventas)
+
+    stress = subparsers.add_parser("stress-venta", help="Ventas concurrentes del último stock: control de sobreventa")
+    stress.add_argument("--hilos", type=int, default=8)
+    stress.add_argument("--stock", type=int, default=200)
+    stress.add_argument("--lineas", type=int, default=20,
+                        help="Líneas de la venta usada para contar sentencias por venta")
+    stress.set_defaults(funcion=stress_venta)
+
+    lotes = subparsers.add_parser("stress-lotes", help="Ventas concurrentes de lotes: cada lote se vende una vez")
+    lotes.add_argument("--hilos", type=int, default=8)
+    lotes.add_argument("--lotes", type=int, default=200)
+    lotes.set_defaults(funcion=stress_lotes)
+
+    asignacion = subparsers.add_parser("asignacion-lotes", help="Reparto FIFO de peso entre lotes abiertos")
+    asignacion.add_argument("--lotes", type=int, nargs="+", default=[10, 100, 1000])
+    asignacion.set_defaults(funcion=benchmark_asignacion_lotes)
+
+    etiquetas = subparsers.add_parser("etiquetas-lotes", help="Etiqueta de lote generada y vuelta a resolver")
+    etiquetas.add_argument("--codigos", nargs="+", default=["00042", "55", "123456", "7791234567890"],
+                           help="Códigos de producto de prueba (sin prefijos de 6 dígitos repetidos)")
+    etiquetas.add_argument("--lotes", type=int, default=3, help="Lotes por producto")
+    etiquetas.set_defaults(funcion=etiquetas_lotes)
+
+    pagos = subparsers.add_parser("pago-deudas", help="Imputación de pagos en clientes con muchas deudas")
+    pagos.add_argument("--deudas", type=int, nargs="+", default=[100, 1000, 5000])
+    pagos.set_defaults(funcion=benchmark_pago_deudas)
+
+    importacion = subparsers.add_parser("importacion", help="Importación y exportación masiva de productos")
+    importacion.add_argument("--filas", type=int, nargs="+", default=[1000, 100000])
+    importacion.set_defaults(funcion=benchmark_importacion)
+
+    arranque = subparsers.add_parser("arranque", help="Importaciones y verificación del esquema al iniciar")
+    arranque.add_argument("--modulos", type=int, default=15, help="Cantidad de módulos a listar")
+    arranque.set_defaults(funcion=benchmark_arranque)
+
+    args = parser.parse_args()
+    instrumentar_pool()
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
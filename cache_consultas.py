@@ -0,0 +1,120 @@
+# cache_consultas.py
+import threading
+from functools import wraps
+
+from cachetools import TTLCache
+
+
+class _TTLCacheContado(TTLCache):
+    """TTLCache que cuenta las entradas descartadas por tamaño o por vencimiento."""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.expulsiones = 0
+
+    def popitem(self):
+        self.expulsiones += 1
+        return super().popitem()
+
+    def expire(self, time=None):
+        vencidas = super().expire(time)
+        if vencidas:  # Las versiones viejas de cachetools no devuelven nada
+            self.expulsiones += len(vencidas)
+        return vencidas
+
+
+class _Espacio:
+    def __init__(self, maxsize, ttl):
+        self.cache = _TTLCacheContado(maxsize, ttl)
+        self.version = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+
+class CacheConsultas:
+    """
+    Caché de lecturas de la base agrupada en espacios (productos, clientes...).
+
+    Cada espacio tiene su tamaño máximo y su vencimiento, y un número de
+    versión que las funciones de escritura incrementan al invalidarlo. Una
+    lectura que empezó antes de una invalidación no guarda su resultado, así
+    un cambio nunca queda tapado por un dato viejo. La consulta a la base se
+    hace fuera del lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._espacios = {}
+
+    def configurar(self, espacio, maxsize, ttl):
+        with self._lock:
+            self._espacios[espacio] = _Espacio(maxsize, ttl)
+
+    def obtener(self, espacio, clave, cargar):
+        """Devuelve el valor guardado para la clave o lo carga con cargar()."""
+        datos = self._espacios[espacio]
+        with self._lock:
+            try:
+                valor = datos.cache[clave]
+                datos.aciertos += 1
+                return valor
+            except KeyError:
+                datos.fallos += 1
+                version = datos.version
+
+        valor = cargar()
+        with self._lock:
+            if datos.version == version:
+                datos.cache[clave] = valor
+        return valor
+
+    def invalidar(self, *espacios):
+        """Descarta todo lo guardado en los espacios indicados y sube su versión."""
+        with self._lock:
+            for espacio in espacios:
+                datos = self._espacios[espacio]
+                datos.version += 1
+                datos.cache.clear()
+
+    def version(self, espacio):
+        with self._lock:
+            return self._espacios[espacio].version
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                espacio: {
+                    'aciertos': datos.aciertos,
+                    'fallos': datos.fallos,
+                    'expulsiones': datos.cache.expulsiones,
+                    'entradas': len(datos.cache),
+                    'version': datos.version,
+                }
+                for espacio, datos in self._espacios.items()
+            }
+
+
+consultas_cache = CacheConsultas()
+consultas_cache.configurar('productos', maxsize=1, ttl=300)   # Nombres de productos activos
+consultas_cache.configurar('clientes', maxsize=1, ttl=120)    # Lista de clientes con saldo
+consultas_cache.configurar('usuarios', maxsize=1, ttl=60)     # Lista de usuarios
+consultas_cache.configurar('lotes', maxsize=512, ttl=120)     # Lotes por producto
+
+
+def cacheado(espacio):
+    """
+    Decorador que guarda el resultado de una función de lectura en consultas_cache.
+
+    La clave son los argumentos de la llamada. Las listas se devuelven copiadas
+    para que quien llama pueda ordenarlas o filtrarlas sin tocar la caché.
+    Las excepciones no se guardan.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = (args, tuple(sorted(kwargs.items())))
+            valor = consultas_cache.obtener(espacio, clave, lambda: funcion(*args, **kwargs))
+            return list(valor) if isinstance(valor, list) else valor
+        envoltura.sin_cache = funcion
+        return envoltura
+    return decorador
@@ -1,8 +1,9 @@
 from PyQt6.QtWidgets import QWidget, QDialog, QToolTip, QAbstractItemView, QMessageBox, QVBoxLayout, QHeaderView, QLabel, QDateEdit, QPushButton, QTableWidget, QTableWidgetItem, QHBoxLayout, QLineEdit
-from PyQt6.QtCore import QDate, Qt, QTimer
+from PyQt6.QtCore import QDate, Qt
 from PyQt6.QtGui import QMovie  # Add this import
 from datetime import date, datetime
-from db_postgres import obtener_total_ventas_efectivo, obtener_ventas_por_dia, obtener_ventas_por_periodo
+from db_postgres import obtener_resumen_ventas, obtener_ventas_por_dia, obtener_ventas_por_periodo
+from db_executor import db_executor
 
 class LoadingOverlay(QWidget):
     def __init__(self, parent=None):
@@ -125,19 +126,19 @@ class CajaTab(QWidget):
         self.daily_revenue_label.setText("Recaudación del día: Cargando...")
         self.daily_profit_label.setText("Ganancia del día: Cargando...")
         
-        # Use QTimer to allow the UI to update before processing
-        QTimer.singleShot(100, self._procesar_recaudacion_diaria)
-
-    def _procesar_recaudacion_diaria(self):
         fecha = self.daily_date.date().toString("yyyy-MM-dd")
-        ventas = obtener_ventas_por_dia(fecha)
-        
-        total_ventas = sum(venta[1] for venta in ventas)
-        ganancia_total = sum(venta[4] for venta in ventas)
-        total_efectivo = obtener_total_ventas_efectivo(fecha)
-
-        self.daily_revenue_label.setText(f"Recaudación del día: ${total_ventas:.2f}")
-        self.daily_profit_label.setText(f"Ganancia del día: ${ganancia_total:.2f}")
+        # La consulta corre en segundo plano; un nuevo cálculo reemplaza al anterior
+        db_executor.ejecutar(
+            lambda: (obtener_ventas_por_dia(fecha), obtener_resumen_ventas(fecha, fecha)),
+            al_terminar=self._mostrar_recaudacion_diaria,
+            al_fallar=self._mostrar_error,
+            clave=("caja", id(self)))
+
+    def _mostrar_recaudacion_diaria(self, resultado):
+        ventas, resumen = resultado
+
+        self.daily_revenue_label.setText(f"Recaudación del día: ${resumen['recaudacion']:.2f}")
+        self.daily_profit_label.setText(f"Ganancia del día: ${resumen['ganancia']:.2f}")
         self.period_revenue_label.setText(f"Recaudación por período: ")
         self.period_profit_label.setText(f"Ganancia por período: ")
         
@@ -150,24 +151,29 @@ class CajaTab(QWidget):
         self.period_revenue_label.setText("Recaudación por período: Cargando...")
         self.period_profit_label.setText("Ganancia por período: Cargando...")
         
-        # Use QTimer to allow the UI to update before processing
-        QTimer.singleShot(100, self._procesar_recaudacion_periodo)
-
-    def _procesar_recaudacion_periodo(self):
         fecha_inicio = self.start_date.date().toString("yyyy-MM-dd")
         fecha_fin = self.end_date.date().toString("yyyy-MM-dd")
-        ventas = obtener_ventas_por_periodo(fecha_inicio, fecha_fin)
-
-        total = sum(venta[1] for venta in ventas)
-        ganancia_total = sum(venta[4] for venta in ventas)
-        
-        self.period_revenue_label.setText(f"Recaudación por período: ${total:.2f}")
-        self.period_profit_label.setText(f"Ganancia por período: ${ganancia_total:.2f}")
+        db_executor.ejecutar(
+            lambda: (obtener_ventas_por_periodo(fecha_inicio, fecha_fin),
+                     obtener_resumen_ventas(fecha_inicio, fecha_fin)),
+            al_terminar=self._mostrar_recaudacion_periodo,
+            al_fallar=self._mostrar_error,
+            clave=("caja", id(self)))
+
+    def _mostrar_recaudacion_periodo(self, resultado):
+        ventas, resumen = resultado
+        
+        self.period_revenue_label.setText(f"Recaudación por período: ${resumen['recaudacion']:.2f}")
+        self.period_profit_label.setText(f"Ganancia por período: ${resumen['ganancia']:.2f}")
         self.daily_revenue_label.setText(f"Recaudación del día: ")
         self.daily_profit_label.setText(f"Ganancia del día: ")
 
         self.mostrar_ventas(ventas)
         self.loading.hide()
+
+    def _mostrar_error(self, error):
+        self.loading.hide()
+        QMessageBox.critical(self, "Error", f"No se pudo obtener la recaudación: {error}")
         
     def mostrar_ventas(self, ventas):
         self.table.setRowCount(0)
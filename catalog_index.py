@@ -0,0 +1,175 @@
+# catalog_index.py
+import re
+import threading
+
+# Posiciones de la tupla de producto, mismo orden que obtener_producto_por_codigo
+ID, CODIGO, NOMBRE, COSTO, VENTA, MARGEN, VENTA_PESO, DISPONIBLE = range(8)
+
+_CODIGO_BASE_RE = re.compile(r'^\d{5}$')
+
+
+def formato_busqueda(producto):
+    """Reordena un producto del índice al orden de buscar_producto()."""
+    return (producto[ID], producto[CODIGO], producto[NOMBRE], producto[VENTA_PESO],
+            producto[DISPONIBLE], producto[COSTO], producto[VENTA], producto[MARGEN])
+
+
+def es_codigo_peso(codigo_barras):
+    """Indica si el código corresponde a una etiqueta de balanza (peso variable)."""
+    return len(codigo_barras) >= 7 and codigo_barras.startswith('2')
+
+
+class CatalogIndex:
+    """
+    Índice en memoria del catálogo de productos activos.
+
+    Mantiene tablas hash por código de barras, por código base de 5 dígitos
+    (productos pesables), por id y por nombre, de modo que un escaneo se
+    resuelve sin consultar la base de datos. Las funciones de escritura de
+    db_postgres y el change feed lo actualizan de forma incremental, así que
+    no vence con el tiempo; si se invalida, se vuelve a cargar completo en la
+    siguiente consulta.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._por_codigo = {}
+        self._por_codigo_base = {}
+        self._por_id = {}
+        self._por_nombre = {}
+        self._cargado = False
+        self.hits = 0
+        self.misses = 0
+
+    def esta_vigente(self):
+        with self._lock:
+            return self._cargado
+
+    def cargar(self, productos):
+        """Reemplaza el contenido del índice con las filas recibidas."""
+        with self._lock:
+            self._por_codigo.clear()
+            self._por_codigo_base.clear()
+            self._por_id.clear()
+            self._por_nombre.clear()
+            for producto in productos:
+                self._indexar(tuple(producto))
+            self._cargado = True
+
+    def invalidar(self):
+        """Marca el índice como vencido; se recarga en el próximo acceso."""
+        with self._lock:
+            self._cargado = False
+
+    def _indexar(self, producto):
+        nombre = producto[NOMBRE] or ''
+        if nombre.startswith('[ELIMINADO]'):
+            return
+        self._por_id[producto[ID]] = producto
+        codigo = producto[CODIGO]
+        if codigo:
+            self._por_codigo[codigo] = producto
+            if _CODIGO_BASE_RE.match(codigo):
+                self._por_codigo_base[codigo] = producto
+        self._por_nombre[nombre.lower()] = producto
+
+    def _desindexar(self, producto_id):
+        anterior = self._por_id.pop(producto_id, None)
+        if anterior is None:
+            return
+        codigo = anterior[CODIGO]
+        if codigo and self._por_codigo.get(codigo) is anterior:
+            del self._por_codigo[codigo]
+        if codigo and self._por_codigo_base.get(codigo) is anterior:
+            del self._por_codigo_base[codigo]
+        nombre = (anterior[NOMBRE] or '').lower()
+        if self._por_nombre.get(nombre) is anterior:
+            del self._por_nombre[nombre]
+
+    def actualizar(self, producto):
+        """Inserta o reemplaza un producto (tupla en el orden del índice)."""
+        with self._lock:
+            producto = tuple(producto)
+            self._desindexar(producto[ID])
+            self._indexar(producto)
+
+    def eliminar(self, producto_id):
+        with self._lock:
+            self._desindexar(producto_id)
+
+    def ajustar_stock(self, producto_id, delta):
+        """Aplica en memoria un cambio de stock ya confirmado en la base de datos."""
+        with self._lock:
+            producto = self._por_id.get(producto_id)
+            if producto is None:
+                return
+            nuevo = list(producto)
+            nuevo[DISPONIBLE] = round(float(nuevo[DISPONIBLE] or 0) + float(delta), 3)
+            self._desindexar(producto_id)
+            self._indexar(tuple(nuevo))
+
+    def productos(self):
+        with self._lock:
+            return list(self._por_id.values())
+
+    def fijar_stock(self, producto_id, disponible):
+        """Reemplaza el stock con el valor confirmado por la base de datos."""
+        with self._lock:
+            producto = self._por_id.get(producto_id)
+            if producto is None:
+                return
+            nuevo = list(producto)
+            nuevo[DISPONIBLE] = disponible
+            self._desindexar(producto_id)
+            self._indexar(tuple(nuevo))
+
+    def buscar_por_id(self, producto_id):
+        with self._lock:
+            return self._por_id.get(producto_id)
+
+    def buscar_codigos(self, codigos):
+        """
+        Resuelve varios códigos de barras exactos bajo un solo bloqueo.
+
+        Returns:
+            (encontrados, faltantes): dict codigo -> tupla y lista de códigos sin resolver.
+        """
+        encontrados = {}
+        faltantes = []
+        with self._lock:
+            for codigo in codigos:
+                producto = self._por_codigo.get(codigo)
+                if producto is None:
+                    faltantes.append(codigo)
+                    self.misses += 1
+                else:
+                    encontrados[codigo] = producto
+                    self.hits += 1
+        return encontrados, faltantes
+
+    def buscar(self, codigo_o_nombre):
+        """
+        Resuelve un código escaneado o un nombre exacto.
+
+        Returns:
+            La tupla del producto o None si no está en el índice.
+        """
+        with self._lock:
+            producto = self._por_codigo.get(codigo_o_nombre)
+            if producto is None and es_codigo_peso(codigo_o_nombre):
+                producto = self._por_codigo_base.get(codigo_o_nombre[2:7])
+            if producto is None:
+                producto = self._por_nombre.get(codigo_o_nombre.lower())
+            if producto is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return producto
+
+    def __len__(self):
+        with self._lock:
+            return len(self._por_id)
+
+
+# Instancia global compartida por todo el proceso
+catalog_index = CatalogIndex()
@@ -0,0 +1,178 @@
+# change_feed.py
+import json
+import logging
+import select
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from catalog_index import catalog_index
+from cache_consultas import consultas_cache
+from signals import signals
+import db_postgres
+
+logger = logging.getLogger('change_feed')
+
+
+class ChangeFeedListener(threading.Thread):
+    """
+    Hilo que escucha las notificaciones de cambios de la base de datos.
+
+    Cada terminal mantiene cachés propias (índice del catálogo, lista de
+    nombres); este hilo las parchea con los cambios hechos desde otras
+    terminales y emite las señales de la interfaz, sin consultas periódicas
+    ni recargas completas.
+    """
+
+    def __init__(self, db_config, canal=db_postgres.CANAL_CAMBIOS, espera=5.0):
+        super().__init__(daemon=True, name="DB-ChangeFeed")
+        self.db_config = db_config
+        self.canal = canal
+        self.espera = espera  # Segundos máximos bloqueado en select()
+        self._detener = threading.Event()
+        self.notificaciones_recibidas = 0
+
+    def detener(self):
+        self._detener.set()
+
+    def _conectar(self):
+        conn = psycopg2.connect(
+            host=self.db_config['host'],
+            database=self.db_config['database'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            port=self.db_config['port'],
+            keepalives=1,
+            keepalives_idle=60,
+            keepalives_interval=30,
+            keepalives_count=5,
+            application_name='GestionDietetica-ChangeFeed'
+        )
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.canal}")
+        return conn
+
+    def run(self):
+        reintento = 1
+        primera_conexion = True
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = self._conectar()
+                reintento = 1
+                if not primera_conexion:
+                    # Pudimos perder notificaciones mientras no hubo conexión
+                    self._resincronizar()
+                primera_conexion = False
+                self._escuchar(conn)
+            except Exception as e:
+                logger.error(f"Error en el listener de cambios: {e}, reintentando en {reintento}s")
+                self._detener.wait(reintento)
+                reintento = min(reintento * 2, 60)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _escuchar(self, conn):
+        while not self._detener.is_set():
+            if select.select([conn], [], [], self.espera) == ([], [], []):
+                continue
+            conn.poll()
+            lote = []
+            while conn.notifies:
+                lote.append(conn.notifies.pop(0))
+            if lote:
+                self._procesar_lote(lote)
+
+    def _procesar_lote(self, notificaciones):
+        """Aplica un lote de notificaciones y emite cada señal una sola vez."""
+        pids_propios = db_postgres.pool_manager.backend_pids()
+        productos_cambiados = []
+        hubo_venta = hubo_cliente = hubo_lote = recarga_productos = False
+
+        for notificacion in notificaciones:
+            self.notificaciones_recibidas += 1
+            try:
+                cambio = json.loads(notificacion.payload)
+            except ValueError:
+                logger.warning(f"Notificación inválida: {notificacion.payload!r}")
+                continue
+
+            tabla, op, datos = cambio['t'], cambio['op'], cambio['d']
+            if tabla == 'productos' and op == 'R':
+                # Carga masiva: una sola notificación en lugar de una por fila
+                if cambio.get('pid') not in pids_propios:
+                    recarga_productos = True
+                continue
+            if tabla == 'productos':
+                # Los cambios propios ya se aplicaron localmente, pero la
+                # fila del servidor es la versión autoritativa
+                self._aplicar_producto(op, datos)
+            if cambio.get('pid') in pids_propios:
+                continue
+
+            if tabla == 'productos':
+                productos_cambiados.append(datos['id'])
+            elif tabla == 'lotes_productos':
+                productos_cambiados.append(datos['producto_id'])
+                hubo_lote = True
+            elif tabla == 'ventas':
+                hubo_venta = True
+            elif tabla in ('clientes', 'deudas'):
+                hubo_cliente = True
+
+        if recarga_productos:
+            db_postgres.recargar_catalogo()
+            db_postgres.clear_productos_cache()
+            signals.producto_actualizado.emit()
+        elif productos_cambiados:
+            db_postgres.clear_productos_cache()
+            signals.productos_modificados.emit(sorted(set(productos_cambiados)))
+            signals.producto_actualizado.emit()
+        if hubo_lote:
+            consultas_cache.invalidar('lotes')
+        if hubo_venta:
+            signals.venta_realizada.emit()
+        if hubo_cliente:
+            consultas_cache.invalidar('clientes')
+            signals.cliente_agregado.emit()
+
+    def _aplicar_producto(self, op, datos):
+        if op == 'D' or (datos.get('nombre') or '').startswith('[ELIMINADO]'):
+            catalog_index.eliminar(datos['id'])
+            return
+        catalog_index.actualizar((
+            datos['id'],
+            datos['codigo_barras'],
+            datos['nombre'],
+            datos['precio_costo'],
+            datos['precio_venta'],
+            datos['margen_ganancia'],
+            datos['venta_por_peso'],
+            datos['disponible'],
+        ))
+
+    def _resincronizar(self):
+        logger.info("Listener reconectado: invalidando cachés locales")
+        db_postgres.recargar_catalogo()
+        consultas_cache.invalidar('productos', 'clientes', 'usuarios', 'lotes')
+        signals.producto_actualizado.emit()
+        signals.venta_realizada.emit()
+        signals.cliente_agregado.emit()
+
+
+_listener = None
+
+def iniciar_listener():
+    """Inicia (una sola vez por proceso) el hilo de escucha de cambios."""
+    global _listener
+    if _listener is None or not _listener.is_alive():
+        _listener = ChangeFeedListener(db_postgres.DB_CONFIG)
+        _listener.start()
+    return _listener
+
+def detener_listener():
+    if _listener is not None:
+        _listener.detener()
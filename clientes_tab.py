@@ -8,9 +8,10 @@ from PyQt6.QtCore import Qt
 from datetime import datetime
 from db_postgres import (
     agregar_cliente_a_db, obtener_clientes, obtener_detalle_ventas_deudas,
-    obtener_deudas_cliente, obtener_pagos_cliente, registrar_pago_cliente
+    obtener_pagos_cliente, obtener_saldo_cliente, registrar_pago_cliente
 )
 from signals import signals
+from db_executor import db_executor
 
 class DetalleDeudaDialog(QDialog):
     def __init__(self, deuda, parent=None):
@@ -208,16 +209,24 @@ class ClientesTab(QWidget):
             self.register_pay_button.hide()
             return
 
-        deudas = obtener_detalle_ventas_deudas(cliente_id)
-        pagos = obtener_pagos_cliente(cliente_id)
-
-        # Calcular deuda total
-        total_deuda = sum(deuda["monto"] for deuda in deudas)
-        total_pagado = sum(pago["monto"] for pago in pagos if pago["venta_id"] in [deuda["venta_id"] for deuda in deudas])  # Filtrar pagos
-        total_ventas = sum(deuda["monto_total"] for deuda in deudas)
-        deuda_restante = total_ventas - total_pagado  # Calcular deuda restante
+        # Consultar en segundo plano; si se cambia de cliente antes de que
+        # termine, el pedido anterior se descarta
+        db_executor.ejecutar(
+            lambda: (obtener_detalle_ventas_deudas(cliente_id), obtener_pagos_cliente(cliente_id),
+                     obtener_saldo_cliente(cliente_id)),
+            al_terminar=lambda resultado: self.mostrar_datos_cliente(cliente_id, *resultado),
+            al_fallar=lambda e: QMessageBox.warning(self, "Error", f"No se pudieron cargar los datos del cliente: {e}"),
+            clave=("cliente", id(self)))
+
+    def mostrar_datos_cliente(self, cliente_id, deudas, pagos, saldo):
+        """Muestra las deudas y pagos ya consultados del cliente."""
+        if cliente_id != self.client_selector.currentData():
+            return
 
-        self.total_debt_label.setText(f"Deuda Total: ${total_ventas:.2f}, Pagado: ${total_pagado:.2f}, Deuda Restante: ${deuda_restante:.2f}")
+        # Totales mantenidos en saldos_clientes
+        self.total_debt_label.setText(
+            f"Deuda Total: ${saldo['deuda_total']:.2f}, Pagado: ${saldo['total_pagado']:.2f}, "
+            f"Deuda Restante: ${saldo['saldo']:.2f}")
         self.total_debt_label.show()
         self.client_pay_input.show()
         self.register_pay_button.show()
@@ -238,7 +247,7 @@ class ClientesTab(QWidget):
         self.payment_table.setRowCount(len(pagos))
         for row, pago in enumerate(pagos):
             self.payment_table.setItem(row, 0, QTableWidgetItem(pago["fecha"]))
-            self.payment_table.setItem(row, 1, QTableWidgetItem(f"${pago['monto']:.2f}"))
+            self.payment_table.setItem(row, 1, QTableWidgetItem(f"${pago['monto_pagado']:.2f}"))
 
 
     def registrar_pago(self):
@@ -257,8 +266,7 @@ class ClientesTab(QWidget):
             return
 
         # Verificar la deuda total actual
-        deudas = obtener_deudas_cliente(cliente_id)
-        total_deuda = sum(deuda["monto"] for deuda in deudas)
+        total_deuda = obtener_saldo_cliente(cliente_id)["saldo"]
 
         if total_deuda == 0:
             QMessageBox.information(self, "Sin deudas", "El cliente no tiene deudas pendientes.")
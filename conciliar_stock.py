@@ -0,0 +1,14 @@
+import sys
+from db_postgres import conciliar_stock_lotes
+
+# Uso:
+#   python conciliar_stock.py                        -> informa diferencias entre stock y lotes
+#   python conciliar_stock.py reparar                -> además iguala el stock a la suma de los lotes
+#   python conciliar_stock.py [reparar] incremental  -> solo productos que cambiaron desde la última vez
+reparar = 'reparar' in sys.argv[1:]
+incremental = 'incremental' in sys.argv[1:]
+
+diferencias = conciliar_stock_lotes(reparar=reparar, incremental=incremental)
+for producto_id, nombre, disponible, en_lotes in diferencias:
+    print(f"{producto_id:>6} {nombre:<30} stock={disponible:.3f} lotes={en_lotes:.3f}")
+print(f"{len(diferencias)} diferencias encontradas" + (" y reparadas" if reparar and diferencias else ""))
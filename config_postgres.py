@@ -11,5 +11,19 @@ DB_CONFIG = {
     "port": "16336"                # Generalmente 5432 o el asignado por Railway
 }
 
+# Registro de modificaciones en segundo plano (COPY desde una cola) en lugar
+# de escribirlo dentro de la transacción que las produce
+AUDITORIA_ASINCRONA = os.environ.get("GESTION_AUDITORIA_ASINCRONA", "0") == "1"
+
+# Franja horaria "inicio-fin" (horas locales, puede cruzar la medianoche) en
+# la que una terminal abierta puede ejecutar el mantenimiento de la base
+MANTENIMIENTO_FRANJA = tuple(
+    int(hora) for hora in os.environ.get("GESTION_MANTENIMIENTO_FRANJA", "21-8").split("-")
+)
+
 def get_db_config():
-    return DB_CONFIG
+    """Devuelve la configuración; cada valor se puede sobrescribir con GESTION_DB_<CLAVE>."""
+    return {
+        clave: os.environ.get(f"GESTION_DB_{clave.upper()}", valor)
+        for clave, valor in DB_CONFIG.items()
+    }
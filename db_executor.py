@@ -0,0 +1,109 @@
+# db_executor.py
+import logging
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import db_postgres
+
+logger = logging.getLogger('db_executor')
+
+
+class _PuenteGUI(QObject):
+    """Lleva los resultados de los hilos de trabajo al hilo de la interfaz."""
+    terminado = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        # La conexión es encolada: el slot corre en el hilo donde se creó el puente
+        self.terminado.connect(self._entregar)
+
+    def _entregar(self, entrega):
+        callback, valor = entrega
+        try:
+            callback(valor)
+        except RuntimeError as e:
+            # El widget que pidió el resultado ya fue destruido
+            logger.warning(f"Resultado descartado: {e}")
+
+
+class DbExecutor:
+    """
+    Ejecuta funciones de db_postgres en un pool de hilos acotado.
+
+    Cada pedido devuelve un Future; si se indican al_terminar / al_fallar,
+    se llaman en el hilo de la interfaz con el resultado o la excepción. Los
+    pedidos con la misma clave se reemplazan entre sí: al enviar uno nuevo,
+    el anterior se cancela si todavía no empezó y, si ya está corriendo, su
+    resultado se descarta (por ejemplo, al escribir en un buscador).
+    """
+
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="DB-Worker")
+        self._lock = threading.Lock()
+        self._vigentes = {}  # clave -> último Future enviado
+        self._puente = None
+
+    def ejecutar(self, funcion, *args, al_terminar=None, al_fallar=None, clave=None, **kwargs):
+        if self._puente is None:
+            # Se crea en el primer uso, desde el hilo de la interfaz
+            self._puente = _PuenteGUI()
+
+        future = self._executor.submit(funcion, *args, **kwargs)
+        if clave is not None:
+            with self._lock:
+                anterior = self._vigentes.get(clave)
+                self._vigentes[clave] = future
+            if anterior is not None:
+                anterior.cancel()
+
+        future.add_done_callback(
+            lambda f: self._al_completar(f, clave, al_terminar, al_fallar, funcion))
+        return future
+
+    def al_completar(self, future, al_terminar=None, al_fallar=None):
+        """
+        Entrega en el hilo de la interfaz el resultado de un Future ya enviado.
+
+        Sirve para que varios interesados esperen el mismo pedido; si ya
+        terminó, la entrega es inmediata.
+        """
+        if self._puente is None:
+            self._puente = _PuenteGUI()
+        future.add_done_callback(
+            lambda f: self._al_completar(f, None, al_terminar, al_fallar, al_terminar))
+
+    def _es_vigente(self, future, clave):
+        if clave is None:
+            return True
+        with self._lock:
+            if self._vigentes.get(clave) is not future:
+                return False
+            del self._vigentes[clave]
+            return True
+
+    def _al_completar(self, future, clave, al_terminar, al_fallar, funcion):
+        # Corre en el hilo de trabajo (o en el que canceló el Future)
+        if not self._es_vigente(future, clave):
+            return
+        try:
+            resultado = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"Error en {getattr(funcion, '__name__', funcion)}: {e}")
+            if al_fallar is not None:
+                self._puente.terminado.emit((al_fallar, e))
+            return
+        if al_terminar is not None:
+            self._puente.terminado.emit((al_terminar, resultado))
+
+    def cerrar(self):
+        """Cancela los pedidos pendientes sin esperar a los que están corriendo."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instancia global compartida por todas las pestañas: un hilo por conexión
+# del pool, dejando una libre para el chequeo de salud
+db_executor = DbExecutor(max_workers=max(1, db_postgres.POOL_MAX_CONEXIONES - 1))
@@ -1,17 +1,24 @@
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 from psycopg2.pool import ThreadedConnectionPool
 from psycopg2 import pool
-from config_postgres import get_db_config
-from datetime import datetime
+from psycopg2.extras import execute_values
+from config_postgres import get_db_config, AUDITORIA_ASINCRONA
+from datetime import date, datetime, timedelta
 from signals import signals
+from catalog_index import catalog_index
+from cache_consultas import consultas_cache, cacheado
 import hashlib
 import pytz
-from functools import lru_cache
 import time
-from cachetools import TTLCache
 from contextlib import contextmanager
 import logging
 import threading
+import queue
+import io
+import json
+import archivos_productos
 
 
 logging.basicConfig(level=logging.INFO, 
@@ -21,71 +28,244 @@ logger = logging.getLogger('db_postgres')
 config = get_db_config()
 DB_CONFIG = config
 
-# En la configuración del pool (~línea 24)
-connection_pool = ThreadedConnectionPool(
-    minconn=5,
-    maxconn=20,
-    host=DB_CONFIG['host'],
-    database=DB_CONFIG['database'],
-    user=DB_CONFIG['user'],
-    password=DB_CONFIG['password'],
-    port=DB_CONFIG['port'],
-    keepalives=1,  # Mantener conexiones activas
-    keepalives_idle=60,    # Enviar señal cada 60 segundos
-    keepalives_interval=30,# Reintentar cada 30 segundos si falla
-    keepalives_count=5,    # Máximo 5 intentos
-    options='-c statement_timeout=30000',
-    application_name='GestionDietetica'
-)
+POOL_MIN_CONEXIONES = 5
+POOL_MAX_CONEXIONES = 20
+
+def _crear_pool():
+    """Abre el pool; la primera conexión a la base se hace recién aquí."""
+    return ThreadedConnectionPool(
+        minconn=POOL_MIN_CONEXIONES,
+        maxconn=POOL_MAX_CONEXIONES,
+        host=DB_CONFIG['host'],
+        database=DB_CONFIG['database'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        port=DB_CONFIG['port'],
+        keepalives=1,  # Mantener conexiones activas
+        keepalives_idle=60,    # Enviar señal cada 60 segundos
+        keepalives_interval=30,# Reintentar cada 30 segundos si falla
+        keepalives_count=5,    # Máximo 5 intentos
+        options='-c statement_timeout=30000',
+        application_name='GestionDietetica'
+    )
+
+# Timeouts de sentencia (ms) según el tipo de operación
+STATEMENT_TIMEOUT_NORMAL = 30000    # 30 segundos
+STATEMENT_TIMEOUT_LENTO = 600000    # 10 minutos
+# Solo se valida con un ping una conexión que estuvo ociosa más de este tiempo
+IDLE_VALIDATION_SECONDS = 60
+
+
+class ValidatingConnectionPool:
+    """
+    Envoltorio del ThreadedConnectionPool con validación perezosa.
+
+    El pool se abre recién con el primer pedido de conexión (fabrica), así
+    importar este módulo no se conecta a la base.
+    Guarda por conexión el último uso, el statement_timeout vigente y el
+    estado de transacción. Al entregar una conexión solo se hace ping si
+    estuvo ociosa más de idle_threshold segundos o quedó en un estado de
+    transacción inválido, y el SET statement_timeout se envía únicamente
+    cuando cambia el modo pedido.
+    """
+
+    def __init__(self, fabrica, idle_threshold=IDLE_VALIDATION_SECONDS,
+                 timeout_inicial=STATEMENT_TIMEOUT_NORMAL, al_crear=None):
+        self._fabrica = fabrica
+        self._al_crear = al_crear
+        self._pool = None
+        self._lock_pool = threading.Lock()
+        self.idle_threshold = idle_threshold
+        self._timeout_inicial = timeout_inicial
+        self._meta = {}
+        self._lock = threading.Lock()
+        self.validaciones_omitidas = 0
+        self.validaciones_realizadas = 0
+        self.conexiones_descartadas = 0
+        self.timeouts_configurados = 0
+
+    @property
+    def pool(self):
+        """El ThreadedConnectionPool, que se crea en el primer uso."""
+        pool = self._pool
+        if pool is None:
+            with self._lock_pool:
+                if self._pool is None:
+                    self._pool = self._fabrica()
+                    if self._al_crear is not None:
+                        self._al_crear()
+                pool = self._pool
+        return pool
+
+    def creado(self):
+        return self._pool is not None
+
+    def cerrar(self):
+        """Cierra todas las conexiones; el próximo pedido vuelve a abrir el pool."""
+        with self._lock_pool:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+        with self._lock:
+            self._meta.clear()
+
+    def _metadata(self, conn):
+        with self._lock:
+            meta = self._meta.get(id(conn))
+            if meta is None or meta['conn'] is not conn:
+                # Conexión nueva: el timeout inicial viene de las opciones del pool
+                meta = {
+                    'conn': conn,
+                    'ultimo_uso': time.monotonic(),
+                    'timeout': self._timeout_inicial,
+                    'estado': conn.info.transaction_status,
+                    'backend_pid': conn.info.backend_pid,
+                }
+                self._meta[id(conn)] = meta
+            return meta
+
+    def _descartar(self, conn):
+        self._olvidar(conn)
+        with self._lock:
+            self.conexiones_descartadas += 1
+        try:
+            self.pool.putconn(conn, close=True)
+        except Exception as e:
+            logger.error(f"Error al descartar conexión: {e}")
+
+    def _es_valida(self, conn, meta):
+        """Devuelve False si la conexión debe descartarse."""
+        if conn.closed != 0:
+            return False
+
+        estado = conn.info.transaction_status
+        if estado == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if estado != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Quedó una transacción abierta o abortada: limpiar antes de usarla
+            conn.rollback()
+        elif time.monotonic() - meta['ultimo_uso'] < self.idle_threshold:
+            with self._lock:
+                self.validaciones_omitidas += 1
+            return True
+
+        with self._lock:
+            self.validaciones_realizadas += 1
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+
+    def getconn(self, timeout_ms=STATEMENT_TIMEOUT_NORMAL, intentos=3):
+        ultimo_error = None
+        for _ in range(intentos):
+            conn = self.pool.getconn()
+            meta = self._metadata(conn)
+            try:
+                if not self._es_valida(conn, meta):
+                    self._descartar(conn)
+                    continue
+                if meta['timeout'] != timeout_ms:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SET statement_timeout = %s", (str(timeout_ms),))
+                    # Confirmar para que un rollback posterior no revierta el SET
+                    conn.commit()
+                    meta['timeout'] = timeout_ms
+                    with self._lock:
+                        self.timeouts_configurados += 1
+                return conn
+            except psycopg2.Error as e:
+                logger.error(f"Conexión defectuosa descartada: {e}")
+                ultimo_error = e
+                self._descartar(conn)
+        raise psycopg2.OperationalError(f"No se pudo obtener una conexión válida: {ultimo_error}")
+
+    def putconn(self, conn, close=False):
+        if self._pool is None:
+            # El pool se cerró mientras la conexión estaba en uso
+            conn.close()
+            return
+        if close or conn.closed != 0:
+            self._descartar(conn)
+            return
+        meta = self._metadata(conn)
+        meta['ultimo_uso'] = time.monotonic()
+        meta['estado'] = conn.info.transaction_status
+        self.pool.putconn(conn)
+        if conn.closed != 0:
+            # El pool la cerró (ya tenía minconn libres): olvidar su backend
+            self._olvidar(conn)
+
+    def _olvidar(self, conn):
+        with self._lock:
+            meta = self._meta.get(id(conn))
+            if meta is not None and meta['conn'] is conn:
+                del self._meta[id(conn)]
+
+    def backend_pids(self):
+        """PIDs de servidor de las conexiones abiertas de este proceso."""
+        with self._lock:
+            return {meta['backend_pid'] for meta in self._meta.values() if meta['conn'].closed == 0}
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'validaciones_omitidas': self.validaciones_omitidas,
+                'validaciones_realizadas': self.validaciones_realizadas,
+                'conexiones_descartadas': self.conexiones_descartadas,
+                'timeouts_configurados': self.timeouts_configurados,
+            }
+
+
+def _iniciar_chequeo_salud():
+    global connection_health_thread
+    if connection_health_thread is None or not connection_health_thread.is_alive():
+        connection_health_thread = threading.Thread(
+            target=check_connection_health,
+            daemon=True,  # This ensures the thread will exit when the main program exits
+            name="DB-HealthCheck"
+        )
+        connection_health_thread.start()
+
+connection_health_thread = None
+pool_manager = ValidatingConnectionPool(_crear_pool, al_crear=_iniciar_chequeo_salud)
 
 def return_connection(conn):
-    connection_pool.putconn(conn)
+    auditoria.descartar(conn)
+    pool_manager.putconn(conn)
                     
 def get_connection():
-    return connection_pool.getconn()
+    return pool_manager.getconn()
 
 
 @contextmanager
 def get_db_connection(expected_slow=False):
-    conn = get_connection()
-    start_time = time.time()
+    timeout_ms = STATEMENT_TIMEOUT_LENTO if expected_slow else STATEMENT_TIMEOUT_NORMAL
+    conn = pool_manager.getconn(timeout_ms)
     try:
-        # Verificar y resetear conexión
-        if conn.closed != 0:  # Si la conexión está cerrada
-            conn = connection_pool.getconn()  # Obtener nueva conexión
-            
-        # Resetear y verificar estado
-        conn.reset()
-        with conn.cursor() as test_cursor:
-            test_cursor.execute("SELECT 1")  # Consulta de prueba
-            
-        # Configurar timeout
-        cursor = conn.cursor()
-        if expected_slow:
-            cursor.execute("SET statement_timeout = '600000'")  # 10 minutos
-        else:
-            cursor.execute("SET statement_timeout = '30000'")  # 30 segundos
-            
         yield conn
-        conn.commit()
+        auditoria.confirmar(conn)
         
     except psycopg2.OperationalError as e:
-        # Reconexión automática en caso de error
-        logger.error(f"Error de conexión: {e}, reintentando...")
-        conn.close()
-        conn = connection_pool.getconn()  # Nueva conexión
-        yield conn
-        conn.commit()
+        # La conexión se perdió a mitad de la operación: descartarla
+        logger.error(f"Error de conexión: {e}")
+        pool_manager.putconn(conn, close=True)
+        conn = None
+        raise
         
     finally:
-        # Devolver conexión al pool solo si está válida
-        if conn.closed == 0:
-            connection_pool.putconn(conn)
+        # Devolver conexión al pool (si sigue abierta)
+        if conn is not None:
+            auditoria.descartar(conn)
+            pool_manager.putconn(conn)
 
 def check_connection_health():
     """Verificación cada 2 minutos"""
     while True:
+        time.sleep(120)  # Verificar cada 2 minutos
+        if not pool_manager.creado():
+            continue  # Pool cerrado: se reabre con el próximo pedido
         try:
+            connection_pool = pool_manager.pool
             # Verificar y mantener todas las conexiones del pool
             for _ in range(connection_pool.minconn):
                 conn = connection_pool.getconn()
@@ -95,7 +275,7 @@ def check_connection_health():
                         connection_pool.putconn(conn)
                 except Exception as e:
                     logger.error(f"Conexión defectuosa: {e}")
-                    conn.close()  # Descartar conexión mala
+                    pool_manager.putconn(conn, close=True)  # Descartar conexión mala
             
             # Verificar conexión externa
             temp_conn = psycopg2.connect(
@@ -109,16 +289,7 @@ def check_connection_health():
             
         except Exception as e:
             logger.error(f"Error crítico: {e}")
-            connection_pool.closeall()  # Reiniciar todo el pool
-            
-        time.sleep(120)  # Verificar cada 2 minutos
-
-connection_health_thread = threading.Thread(
-    target=check_connection_health, 
-    daemon=True,  # This ensures the thread will exit when the main program exits
-    name="DB-HealthCheck"
-)
-connection_health_thread.start()
+            pool_manager.cerrar()  # Reiniciar todo el pool
 
 
 def _get_next_product_code(cursor):
@@ -144,6 +315,7 @@ def _get_next_product_code(cursor):
 def cleanup_stale_connections():
     """Cleanup stale connections in the pool"""
     try:
+        connection_pool = pool_manager.pool
         for conn in connection_pool._used.copy():
             if conn.closed:
                 connection_pool._used.remove(conn)
@@ -153,16 +325,19 @@ def cleanup_stale_connections():
         
 def get_pool_status():
     """Monitor connection pool status"""
+    connection_pool = pool_manager.pool
     return {
         'min_connections': connection_pool.minconn,
         'max_connections': connection_pool.maxconn,
         'used_connections': len(connection_pool._used),
         'free_connections': len(connection_pool._pool),
+        **pool_manager.estadisticas(),
+        'cache': consultas_cache.estadisticas(),
     }
     
 def cleanup_connections():
     """Emergency cleanup of connections"""
-    for conn in connection_pool._used:
+    for conn in list(pool_manager.pool._used):
         try:
             return_connection(conn)
         except Exception as e:
@@ -202,7 +377,7 @@ def crear_tablas():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ventas (
             id SERIAL PRIMARY KEY,
-            fecha TEXT,
+            fecha TIMESTAMP,
             monto_total REAL,
             metodo_pago TEXT
         )
@@ -226,7 +401,7 @@ def crear_tablas():
             id SERIAL PRIMARY KEY,
             cliente_id INTEGER NOT NULL,
             venta_id INTEGER NOT NULL,
-            fecha TEXT NOT NULL,
+            fecha TIMESTAMP NOT NULL,
             monto REAL NOT NULL,
             FOREIGN KEY (cliente_id) REFERENCES clientes(id),
             FOREIGN KEY (venta_id) REFERENCES ventas(id)
@@ -245,12 +420,93 @@ def crear_tablas():
         CREATE TABLE IF NOT EXISTS pagos (
             id SERIAL PRIMARY KEY,
             cliente_id INTEGER NOT NULL,
-            fecha TEXT NOT NULL,
+            fecha TIMESTAMP NOT NULL,
             monto REAL NOT NULL,
             FOREIGN KEY (cliente_id) REFERENCES clientes(id)
         )
     """)
 
+    # Las consultas de pagos imputan cada pago a una venta
+    cursor.execute("ALTER TABLE pagos ADD COLUMN IF NOT EXISTS venta_id INTEGER REFERENCES ventas(id)")
+
+    # Saldo por cliente y libro de movimientos (solo se agregan filas), mantenidos
+    # por registrar_venta (ventas a crédito) y registrar_pago_cliente
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saldos_clientes (
+            cliente_id INTEGER PRIMARY KEY REFERENCES clientes(id),
+            total_deuda NUMERIC(12,2) NOT NULL DEFAULT 0,
+            total_pagado NUMERIC(12,2) NOT NULL DEFAULT 0,
+            saldo NUMERIC(12,2) NOT NULL DEFAULT 0,
+            ultimo_movimiento TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS movimientos_clientes (
+            id SERIAL PRIMARY KEY,
+            cliente_id INTEGER NOT NULL REFERENCES clientes(id),
+            fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tipo TEXT NOT NULL CHECK (tipo IN ('VENTA', 'PAGO')),
+            venta_id INTEGER,
+            monto NUMERIC(12,2) NOT NULL,   -- positivo para ventas, negativo para pagos
+            saldo NUMERIC(12,2) NOT NULL    -- saldo del cliente después del movimiento
+        )
+    """)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movimientos_clientes_cliente
+        ON movimientos_clientes (cliente_id, id)
+    ''')
+
+    # Resumen diario de ventas, mantenido por registrar_venta y registrar_pago_cliente
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha DATE NOT NULL,
+            metodo_pago TEXT NOT NULL,
+            recaudacion DOUBLE PRECISION NOT NULL DEFAULT 0,
+            costo DOUBLE PRECISION NOT NULL DEFAULT 0,
+            ganancia DOUBLE PRECISION NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            tickets INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, metodo_pago)
+        )
+    """)
+
+    # Lotes de productos por peso. codigo_numerico es el número de 4 dígitos
+    # que va en la etiqueta (ver generar_codigo_barras_lote)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lotes_productos (
+            id SERIAL PRIMARY KEY,
+            producto_id INTEGER NOT NULL REFERENCES productos(id),
+            peso_lote REAL NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            codigo_unico TEXT,
+            disponible BOOLEAN DEFAULT TRUE
+        )
+    ''')
+    cursor.execute("ALTER TABLE lotes_productos ADD COLUMN IF NOT EXISTS codigo_numerico INTEGER")
+    # Líneas de venta que salen de un lote
+    cursor.execute("ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS lote_id INTEGER REFERENCES lotes_productos(id)")
+    cursor.execute("ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS peso_vendido REAL")
+    # Precios unitarios al momento de la venta: costo y ganancia de los
+    # reportes y de ventas_diarias no cambian con los precios posteriores
+    cursor.execute("ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS precio_costo REAL")
+    cursor.execute("ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS precio_venta REAL")
+    # Las líneas anteriores quedan con los precios vigentes al migrar
+    cursor.execute('''
+        UPDATE detalle_ventas dv
+        SET precio_costo = p.precio_costo, precio_venta = p.precio_venta
+        FROM productos p
+        WHERE p.id = dv.producto_id AND dv.precio_costo IS NULL AND dv.precio_venta IS NULL
+    ''')
+
+    # Productos cuyo stock o lotes cambiaron desde la última conciliación
+    # (los cargan los triggers de crear_triggers_conciliacion)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS productos_pendientes_conciliacion (
+            producto_id INTEGER PRIMARY KEY,
+            marcado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
     # Crear tabla de modificaciones
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS modificaciones (
@@ -266,6 +522,25 @@ def crear_tablas():
     )
     ''')
 
+    # Versión del esquema instalada (ver preparar_esquema)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS esquema_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Última ejecución de cada tarea de mantenimiento, compartida por las terminales
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mantenimiento_ejecuciones (
+            tarea TEXT PRIMARY KEY,
+            ultima_ejecucion TIMESTAMP NOT NULL,
+            duracion REAL,
+            resultado TEXT
+        )
+    ''')
+
     conn.commit()
     conn.close()
 
@@ -278,14 +553,273 @@ def crear_indices():
             
             # Índices para ventas
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_deudas_fecha ON deudas(fecha)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pagos_fecha ON pagos(fecha)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_ventas_metodo ON ventas(metodo_pago)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_detalle_ventas_venta ON detalle_ventas(venta_id)')
             
             # Índices para modificaciones
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_modificaciones_fecha ON modificaciones(fecha_hora)')
+            # (fecha_hora, id) es la clave de paginación de obtener_modificaciones
+            cursor.execute('DROP INDEX IF EXISTS idx_modificaciones_fecha')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_modificaciones_fecha_id ON modificaciones(fecha_hora, id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_modificaciones_usuario ON modificaciones(usuario)')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_modificaciones_producto
+                ON modificaciones(producto_id, fecha_hora, id)
+            ''')
+
+            # Lotes: resolución de la etiqueta por (producto, código numérico)
+            _asignar_codigos_lotes(cursor)
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_lotes_codigo_numerico
+                ON lotes_productos(producto_id, codigo_numerico) WHERE disponible
+            ''')
+            # Los 6 dígitos de producto de la etiqueta, con el mismo relleno
+            # y recorte que generar_codigo_barras_lote
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_productos_codigo_etiqueta
+                ON productos((lpad(codigo_barras, 6, '0')))
+            ''')
+            # Recorrido FIFO de los lotes abiertos de un producto
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_lotes_fifo
+                ON lotes_productos(producto_id, fecha_creacion, id) WHERE disponible
+            ''')
             
             conn.commit()
 
+def _asignar_codigos_lotes(cursor):
+    """
+    Completa codigo_numerico en los lotes que no lo tienen.
+
+    Se usa el mismo número que la etiqueta impresa; si dos lotes disponibles
+    del mismo producto coinciden, el más antiguo lo conserva y los siguientes
+    toman el próximo número libre.
+    """
+    cursor.execute("""
+        SELECT id, producto_id, codigo_unico, disponible FROM lotes_productos
+        WHERE codigo_numerico IS NULL
+        ORDER BY id
+    """)
+    pendientes = cursor.fetchall()
+    if not pendientes:
+        return
+    cursor.execute("""
+        SELECT producto_id, codigo_numerico FROM lotes_productos
+        WHERE disponible AND codigo_numerico IS NOT NULL
+    """)
+    usados = set(cursor.fetchall())
+    asignados = []
+    for lote_id, producto_id, codigo_unico, disponible in pendientes:
+        codigo = _codigo_numerico_lote(codigo_unico or '')
+        if disponible:
+            for desplazamiento in range(10000):
+                candidato = (codigo + desplazamiento) % 10000
+                if (producto_id, candidato) not in usados:
+                    codigo = candidato
+                    break
+            usados.add((producto_id, codigo))
+        asignados.append((lote_id, codigo))
+    execute_values(cursor, """
+        UPDATE lotes_productos AS lp SET codigo_numerico = v.codigo
+        FROM (VALUES %s) AS v (id, codigo)
+        WHERE lp.id = v.id
+    """, asignados, page_size=1000)
+    logger.info(f"Código numérico asignado a {len(asignados)} lotes")
+
+_pg_trgm = None
+
+def _pg_trgm_disponible():
+    """Indica (una vez por proceso) si la extensión pg_trgm está instalada."""
+    global _pg_trgm
+    if _pg_trgm is None:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _pg_trgm = cursor.fetchone() is not None
+    return _pg_trgm
+
+def crear_indices_busqueda():
+    """
+    Índices GIN de trigramas para buscar por nombre o código con LIKE '%...%'
+    y por similitud. Si no se puede instalar pg_trgm (falta de permisos), la
+    búsqueda sigue funcionando sin índice.
+    """
+    global _pg_trgm
+    try:
+        with get_db_connection(expected_slow=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_productos_nombre_trgm
+                    ON productos USING gin (lower(nombre) gin_trgm_ops)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_productos_codigo_trgm
+                    ON productos USING gin (codigo_barras gin_trgm_ops)
+                ''')
+        _pg_trgm = True
+    except Exception as e:
+        _pg_trgm = None
+        logger.error(f"No se pudieron crear los índices de búsqueda (pg_trgm): {e}")
+
+# Columnas de fecha que versiones anteriores crearon como TEXT
+COLUMNAS_FECHA = (('ventas', False), ('deudas', True), ('pagos', True))  # (tabla, NOT NULL)
+
+def _tipo_columna(cursor, tabla, columna):
+    cursor.execute('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+    ''', (tabla, columna))
+    fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+def migrar_fechas_a_timestamp(tamano_lote=5000):
+    """
+    Convierte ventas.fecha, deudas.fecha y pagos.fecha de TEXT a TIMESTAMP.
+
+    La copia se hace en una columna auxiliar por lotes de ids, confirmando
+    cada lote, para no bloquear tablas grandes. El reemplazo final de la
+    columna se hace en una transacción corta que además copia las filas
+    insertadas durante la migración.
+    """
+    for tabla, not_null in COLUMNAS_FECHA:
+        with get_db_connection(expected_slow=True) as conn:
+            with conn.cursor() as cursor:
+                tipo = _tipo_columna(cursor, tabla, 'fecha')
+                if tipo is None or tipo.startswith('timestamp'):
+                    logger.info(f"{tabla}.fecha ya es {tipo}, nada que migrar")
+                    continue
+
+                cursor.execute(f'ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS fecha_ts TIMESTAMP')
+                cursor.execute(f'SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {tabla}')
+                id_min, id_max = cursor.fetchone()
+                conn.commit()
+
+                desde = id_min - 1
+                while desde < id_max:
+                    hasta = desde + tamano_lote
+                    cursor.execute(f'''
+                        UPDATE {tabla} SET fecha_ts = fecha::timestamp
+                        WHERE id > %s AND id <= %s AND fecha_ts IS NULL AND fecha IS NOT NULL
+                    ''', (desde, hasta))
+                    conn.commit()
+                    logger.info(f"{tabla}: migradas filas hasta id {min(hasta, id_max)} de {id_max}")
+                    desde = hasta
+
+                # Reemplazo final: bloqueo breve y copia de lo insertado mientras tanto
+                cursor.execute(f'LOCK TABLE {tabla} IN SHARE ROW EXCLUSIVE MODE')
+                cursor.execute(f'''
+                    UPDATE {tabla} SET fecha_ts = fecha::timestamp
+                    WHERE fecha_ts IS NULL AND fecha IS NOT NULL
+                ''')
+                cursor.execute(f'ALTER TABLE {tabla} DROP COLUMN fecha')
+                cursor.execute(f'ALTER TABLE {tabla} RENAME COLUMN fecha_ts TO fecha')
+                if not_null:
+                    cursor.execute(f'ALTER TABLE {tabla} ALTER COLUMN fecha SET NOT NULL')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabla}_fecha ON {tabla}(fecha)')
+                conn.commit()
+                cursor.execute(f'ANALYZE {tabla}')
+                logger.info(f"{tabla}.fecha migrada a TIMESTAMP")
+
+def _indices_del_plan(plan):
+    """Devuelve los nombres de índice usados en un plan EXPLAIN (FORMAT JSON)."""
+    indices = set()
+    if 'Index Name' in plan:
+        indices.add(plan['Index Name'])
+    for subplan in plan.get('Plans', []):
+        indices |= _indices_del_plan(subplan)
+    return indices
+
+def verificar_indice_fecha_ventas(fecha_inicio, fecha_fin=None):
+    """
+    Comprueba con EXPLAIN si el filtro por fecha del reporte usa idx_ventas_fecha.
+
+    El plan es el que elige el planificador con su configuración normal, el
+    mismo que tendría el reporte: con pocas ventas en el rango un seq scan
+    puede ser legítimamente más barato.
+
+    Returns:
+        (usa_indice, plan) donde plan es el JSON devuelto por EXPLAIN.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                EXPLAIN (FORMAT JSON)
+                SELECT id FROM ventas
+                WHERE fecha >= %s AND fecha < %s AND metodo_pago != 'Pago de deuda'
+            ''', _rango_fechas(fecha_inicio, fecha_fin or fecha_inicio))
+            plan = cursor.fetchone()[0][0]['Plan']
+            conn.rollback()
+    return 'idx_ventas_fecha' in _indices_del_plan(plan), plan
+
+# Tablas cuyos cambios se publican por LISTEN/NOTIFY a las demás terminales
+CANAL_CAMBIOS = 'cambios_gestion'
+TABLAS_NOTIFICADAS = ('productos', 'ventas', 'clientes', 'deudas', 'lotes_productos')
+
+def crear_triggers_notificacion():
+    """Instala los triggers que publican un resumen de cada cambio con pg_notify."""
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f'''
+                CREATE OR REPLACE FUNCTION notificar_cambio() RETURNS trigger AS $$
+                DECLARE
+                    fila RECORD;
+                    datos JSONB;
+                BEGIN
+                    -- Las cargas masivas envían un único aviso de recarga
+                    IF current_setting('gestion.carga_masiva', true) = 'on' THEN
+                        RETURN NULL;
+                    END IF;
+
+                    IF TG_OP = 'DELETE' THEN
+                        fila := OLD;
+                    ELSE
+                        fila := NEW;
+                    END IF;
+
+                    -- Para productos se envía la fila completa así las demás
+                    -- terminales pueden parchear su caché sin consultar
+                    IF TG_TABLE_NAME = 'productos' THEN
+                        datos := jsonb_build_object(
+                            'id', fila.id,
+                            'codigo_barras', fila.codigo_barras,
+                            'nombre', fila.nombre,
+                            'precio_costo', fila.precio_costo,
+                            'precio_venta', fila.precio_venta,
+                            'margen_ganancia', fila.margen_ganancia,
+                            'venta_por_peso', fila.venta_por_peso,
+                            'disponible', fila.disponible
+                        );
+                    ELSIF TG_TABLE_NAME = 'lotes_productos' THEN
+                        datos := jsonb_build_object('id', fila.id, 'producto_id', fila.producto_id);
+                    ELSIF TG_TABLE_NAME = 'deudas' THEN
+                        datos := jsonb_build_object('id', fila.id, 'cliente_id', fila.cliente_id);
+                    ELSE
+                        datos := jsonb_build_object('id', fila.id);
+                    END IF;
+
+                    PERFORM pg_notify('{CANAL_CAMBIOS}', jsonb_build_object(
+                        't', TG_TABLE_NAME,
+                        'op', left(TG_OP, 1),
+                        'pid', pg_backend_pid(),
+                        'd', datos
+                    )::text);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+
+            for tabla in TABLAS_NOTIFICADAS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS trg_notificar_cambio ON {tabla}')
+                cursor.execute(f'''
+                    CREATE TRIGGER trg_notificar_cambio
+                    AFTER INSERT OR UPDATE OR DELETE ON {tabla}
+                    FOR EACH ROW EXECUTE FUNCTION notificar_cambio()
+                ''')
+
+            conn.commit()
+
 #Productos
 def existe_producto(codigo_barras, nombre):
     with get_db_connection() as conn:
@@ -303,16 +837,12 @@ def existe_producto(codigo_barras, nombre):
             
             return cursor.fetchone()[0] > 0        
 
-# Cache for 5 minutes
-productos_cache = {}  # Se borra en 5 minutos
-
 def clear_productos_cache():
-    productos_cache.clear()
+    consultas_cache.invalidar('productos')
 
+@cacheado('productos')
 def get_cached_productos():
-    if "productos" in productos_cache:
-        return productos_cache["productos"]
-    
+    """Nombres de los productos activos (caché de 5 minutos, se invalida al escribir)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
@@ -321,8 +851,6 @@ def get_cached_productos():
         ''')
         productos = [row[0] for row in cursor.fetchall()]
         cursor.close()
-    
-    productos_cache["productos"] = productos
     return productos
 
 def optimizar_base_datos():
@@ -349,36 +877,179 @@ def optimizar_base_datos():
 def fetch_productos():
     return get_cached_productos()
 
+def cargar_catalogo():
+    """Carga el catálogo completo en el índice en memoria (una sola consulta)."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT id, codigo_barras, nombre, precio_costo, precio_venta,
+                       margen_ganancia, venta_por_peso, disponible
+                FROM productos
+                WHERE nombre NOT LIKE '[ELIMINADO]%%'
+            ''')
+            catalog_index.cargar(cursor.fetchall())
+    logger.info(f"Catálogo en memoria cargado: {len(catalog_index)} productos")
+
+def recargar_catalogo():
+    """
+    Vuelve a cargar el índice en el hilo actual, para usar fuera del hilo de
+    la interfaz tras un cambio que no se puede aplicar de forma incremental.
+    Si falla, el índice queda vencido y se recarga en la próxima consulta.
+    """
+    try:
+        cargar_catalogo()
+    except Exception as e:
+        catalog_index.invalidar()
+        logger.error(f"No se pudo recargar el catálogo en memoria: {e}")
+
+def obtener_catalogo():
+    """Productos activos del índice en memoria, en el orden de obtener_producto_por_codigo."""
+    _asegurar_catalogo()
+    return catalog_index.productos()
+
+def _asegurar_catalogo():
+    if catalog_index.esta_vigente():
+        return
+    try:
+        cargar_catalogo()
+    except Exception as e:
+        # Sin índice se sigue respondiendo desde la base de datos
+        logger.error(f"No se pudo cargar el catálogo en memoria: {e}")
+
 # Add this to clear cache when products are modified
     
+class AuditoriaModificaciones:
+    """
+    Junta los registros de modificaciones de cada transacción y los escribe juntos.
+
+    registrar_modificacion solo agrega la fila a la lista de la conexión;
+    confirmar(conn) la escribe con un único INSERT de varias filas y hace el
+    commit. En modo asíncrono primero se confirma la transacción y las filas
+    pasan a una cola acotada que un hilo escritor vuelca con COPY; si la
+    cola está llena, quien confirma escribe sus filas directamente. cerrar()
+    vacía la cola antes de salir.
+    """
+
+    COLUMNAS = ('usuario', 'fecha_hora', 'tipo_modificacion', 'producto_id',
+                'campo_modificado', 'valor_anterior', 'valor_nuevo')
+    _FIN = object()
+
+    def __init__(self, asincrona=False, max_encoladas=10000, tamano_lote=500):
+        self.asincrona = asincrona
+        self.tamano_lote = tamano_lote
+        self._pendientes = {}  # id(conn) -> filas de la transacción en curso
+        self._lock = threading.Lock()
+        self._cola = queue.Queue(maxsize=max_encoladas)
+        self._hilo = None
+
+    def agregar(self, conn, fila):
+        with self._lock:
+            self._pendientes.setdefault(id(conn), []).append(fila)
+
+    def descartar(self, conn):
+        """Olvida lo registrado en una transacción que no se confirmó."""
+        with self._lock:
+            return self._pendientes.pop(id(conn), [])
+
+    def confirmar(self, conn):
+        """Escribe las modificaciones pendientes de la conexión y hace commit."""
+        filas = self.descartar(conn)
+        if filas and not self.asincrona:
+            with conn.cursor() as cursor:
+                self._insertar(cursor, filas)
+        conn.commit()
+        if filas and self.asincrona:
+            self._encolar(filas)
+
+    def _insertar(self, cursor, filas):
+        execute_values(cursor, f'''
+            INSERT INTO modificaciones ({', '.join(self.COLUMNAS)}) VALUES %s
+        ''', filas, page_size=len(filas))
+
+    def _encolar(self, filas):
+        self._iniciar_escritor()
+        for i, fila in enumerate(filas):
+            try:
+                self._cola.put_nowait(fila)
+            except queue.Full:
+                logger.warning("Cola de auditoría llena: escribiendo directamente")
+                self._escribir(filas[i:])
+                return
+
+    def _iniciar_escritor(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._escritor, daemon=True,
+                                              name="DB-Auditoria")
+                self._hilo.start()
+
+    def _escritor(self):
+        while True:
+            lote = [self._cola.get()]
+            while len(lote) < self.tamano_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            fin = any(fila is self._FIN for fila in lote)
+            lote = [fila for fila in lote if fila is not self._FIN]
+            if lote:
+                self._escribir(lote)
+            if fin:
+                return
+
+    @staticmethod
+    def _valor_copy(valor):
+        if valor is None:
+            return '\\N'
+        texto = valor.isoformat() if isinstance(valor, datetime) else str(valor)
+        return (texto.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+    def _escribir(self, filas):
+        datos = io.StringIO(''.join(
+            '\t'.join(self._valor_copy(valor) for valor in fila) + '\n' for fila in filas))
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY modificaciones ({', '.join(self.COLUMNAS)}) FROM STDIN", datos)
+        except Exception as e:
+            logger.error(f"Error al escribir {len(filas)} modificaciones con COPY: {e}")
+            try:
+                with get_db_connection() as conn:
+                    with conn.cursor() as cursor:
+                        self._insertar(cursor, filas)
+            except Exception as e:
+                logger.error(f"Se perdieron {len(filas)} registros de auditoría: {e}")
+
+    def cerrar(self, timeout=10):
+        """Espera a que el escritor vuelque lo encolado."""
+        if self._hilo is None or not self._hilo.is_alive():
+            return
+        self._cola.put(self._FIN)
+        self._hilo.join(timeout)
+        if self._hilo.is_alive():
+            logger.warning(f"Quedaron {self._cola.qsize()} modificaciones sin escribir")
+
+
+auditoria = AuditoriaModificaciones(asincrona=AUDITORIA_ASINCRONA)
+
+def cerrar_auditoria():
+    auditoria.cerrar()
+
 def registrar_modificacion(cursor, usuario, tipo_modificacion, producto_id, campo_modificado=None, valor_anterior=None, valor_nuevo=None):
-    try:
-        print(f"""
-        Registrando modificación:
-        Usuario: {usuario}
-        Tipo: {tipo_modificacion}
-        Producto ID: {producto_id}
-        Campo: {campo_modificado}
-        Valor anterior: {valor_anterior}
-        Valor nuevo: {valor_nuevo}
-        """)
-        
-        # Obtener la hora actual en el huso horario de Argentina
-        argentina_tz = pytz.timezone('America/Argentina/Buenos_Aires')
-        fecha_hora_argentina = datetime.now(argentina_tz)  # Hora en Argentina
-        
-        # Convertir a UTC
-        fecha_hora_utc = fecha_hora_argentina.astimezone(pytz.utc)  # Convertir a UTC
-        
-        cursor.execute('''
-            INSERT INTO modificaciones (usuario, fecha_hora, tipo_modificacion, producto_id, campo_modificado, valor_anterior, valor_nuevo)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (usuario, fecha_hora_utc, tipo_modificacion, producto_id, campo_modificado, valor_anterior, valor_nuevo))
-        
-        return True
-    except psycopg2.Error as e:  
-        print(f"Error al registrar modificación: {e}")
-        return False
+    """
+    Anota una modificación en la transacción de `cursor`.
+
+    La fila se escribe al confirmar la transacción con auditoria.confirmar(conn)
+    (get_db_connection lo hace al salir del bloque).
+    """
+    # Fecha en UTC; la pestaña de modificaciones la muestra en hora de Argentina
+    fecha_hora_utc = datetime.now(pytz.utc)
+    auditoria.agregar(cursor.connection, (usuario, fecha_hora_utc, tipo_modificacion, producto_id,
+                                          campo_modificado, valor_anterior, valor_nuevo))
+    return True
     
 def agregar_producto(codigo_barras, nombre, costo, venta, margen, cantidad, venta_por_peso, usuario):
     conn = get_connection()
@@ -419,8 +1090,10 @@ def agregar_producto(codigo_barras, nombre, costo, venta, margen, cantidad, vent
         # Register the modification with the correct product ID
         registrar_modificacion(cursor, usuario, 'ALTA', producto_id)
         
-        conn.commit()
+        auditoria.confirmar(conn)
         clear_productos_cache()  # Clear the cache after adding a product
+        catalog_index.actualizar((producto_id, codigo_barras, nombre, costo, venta,
+                                  margen, venta_por_peso, cantidad))
         return True
     except Exception as e:
         print(f"Error al agregar producto: {e}")
@@ -522,24 +1195,27 @@ def actualizar_producto(codigo_barras=None, nombre=None, costo=None, venta=None,
                   costo, venta, margen, producto_actual[ID]))
 
             # Registrar todas las modificaciones
-            print(f"Campos modificados para producto {producto_actual[ID]}:")
             for campo, valor_anterior, valor_nuevo in campos_modificados:
-                print(f"Campo: {campo}, Anterior: {valor_anterior}, Nuevo: {valor_nuevo}")
                 registrar_modificacion(cursor, usuario, 'MODIFICACION', 
                                     producto_actual[ID], campo, 
                                     valor_anterior, valor_nuevo)
 
-            conn.commit()
+            auditoria.confirmar(conn)
+            consultas_cache.invalidar('productos')
+            catalog_index.actualizar((producto_actual[ID], codigo_barras, nombre, costo,
+                                      venta, margen, venta_por_peso, cantidad))
             return True
         else:
-            print("No se detectaron cambios en el producto")
+            logger.debug(f"Sin cambios en el producto {producto_actual[ID]}")
             return True
 
     except psycopg2.Error as e:  
         print(f"Error en actualizar_producto: {e}")
+        conn.rollback()
         return False
     finally:
-        conn.close()
+        cursor.close()
+        return_connection(conn)
 
 def eliminar_producto(codigo_o_nombre, usuario, force_delete=False):
     with get_db_connection() as conn:
@@ -582,52 +1258,516 @@ def eliminar_producto(codigo_o_nombre, usuario, force_delete=False):
                 )
                 
                 
-                conn.commit()
+                auditoria.confirmar(conn)
                 clear_productos_cache()  # Clear the cache after deletion
+                catalog_index.eliminar(producto[0])
                 return True, "Producto marcado como eliminado"
                 
             except Exception as e:
                 conn.rollback()
                 return False, f"Error al eliminar: {str(e)}"
                                     
-def buscar_producto(term=''):
-    with get_db_connection() as conn:
+# Cambios masivos de productos: en lugar de una notificación por fila se envía
+# un único aviso de recarga que las demás terminales resuelven invalidando su catálogo
+
+def _silenciar_notificaciones(cursor):
+    """Desactiva los triggers de notificación hasta el fin de la transacción."""
+    cursor.execute("SET LOCAL gestion.carga_masiva = 'on'")
+
+def _notificar_recarga_productos(cursor):
+    cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_CAMBIOS, json.dumps({
+        't': 'productos', 'op': 'R', 'pid': cursor.connection.info.backend_pid, 'd': {},
+    })))
+
+def _productos_recargados():
+    """Invalida la caché de nombres y recarga el índice una sola vez tras un cambio masivo."""
+    clear_productos_cache()
+    recargar_catalogo()
+    signals.producto_actualizado.emit()
+
+# Importación y exportación masiva de productos
+
+_NUMERO_RE = r'^-?[0-9]+([.,][0-9]+)?$'
+
+def _sql_numero(columna):
+    """Convierte una columna de texto de la tabla de carga a número (NULL si no es válido)."""
+    return (f"CASE WHEN {columna} ~ '{_NUMERO_RE}' THEN replace({columna}, ',', '.')::real END AS {columna}, "
+            f"({columna} IS NOT NULL AND {columna} !~ '{_NUMERO_RE}') AS {columna}_invalido")
+
+# Diferencia entre la tabla de carga y productos, por código de barras. Si un
+# código aparece varias veces en el archivo vale la última línea. Para precios
+# se sigue la misma regla que el formulario de productos: con costo y venta se
+# recalcula el margen, con costo (o margen) solo se recalcula la venta.
+_SQL_DIFERENCIAS_IMPORTACION = f'''
+    CREATE TEMP TABLE importacion_cambios ON COMMIT DROP AS
+    WITH numeros AS (
+        SELECT linea, codigo_barras, nombre,
+               {_sql_numero('precio_costo')},
+               {_sql_numero('precio_venta')},
+               {_sql_numero('margen_ganancia')},
+               {_sql_numero('disponible')},
+               {_sql_numero('venta_por_peso')}
+        FROM importacion_carga
+    ),
+    entrada AS (
+        SELECT DISTINCT ON (COALESCE(codigo_barras, 'linea ' || linea)) *
+        FROM numeros
+        ORDER BY COALESCE(codigo_barras, 'linea ' || linea), linea DESC
+    ),
+    actual AS (
+        SELECT e.*, p.id AS producto_id, p.nombre AS nombre_a, p.precio_costo AS costo_a,
+               p.precio_venta AS venta_a, p.margen_ganancia AS margen_a,
+               p.disponible AS disponible_a, p.venta_por_peso AS por_peso_a,
+               COALESCE(e.precio_costo, p.precio_costo, 0) AS costo_n
+        FROM entrada e
+        LEFT JOIN LATERAL (
+            SELECT * FROM productos p
+            WHERE p.codigo_barras = e.codigo_barras AND p.nombre NOT LIKE '[ELIMINADO]%'
+            ORDER BY p.id
+            LIMIT 1
+        ) p ON TRUE
+    ),
+    con_margen AS (
+        SELECT a.*,
+               COALESCE(a.margen_ganancia,
+                        CASE WHEN a.precio_venta IS NOT NULL AND a.costo_n > 0
+                             THEN round(((a.precio_venta - a.costo_n) / a.costo_n * 100)::numeric, 2)::real END,
+                        a.margen_a, 0) AS margen_n
+        FROM actual a
+    ),
+    nuevo AS (
+        SELECT c.*,
+               COALESCE(c.nombre, c.nombre_a) AS nombre_n,
+               COALESCE(c.precio_venta,
+                        CASE WHEN c.precio_costo IS NOT NULL OR c.margen_ganancia IS NOT NULL
+                             THEN round((c.costo_n * (1 + c.margen_n / 100))::numeric, 2)::real END,
+                        c.venta_a, 0) AS venta_n,
+               COALESCE(c.disponible, c.disponible_a, 0) AS disponible_n,
+               COALESCE(c.venta_por_peso::integer, c.por_peso_a, 0) AS por_peso_n,
+               CASE
+                   WHEN c.codigo_barras IS NULL THEN 'Sin código de barras'
+                   WHEN c.precio_costo_invalido THEN 'Costo inválido'
+                   WHEN c.precio_venta_invalido THEN 'Precio de venta inválido'
+                   WHEN c.margen_ganancia_invalido THEN 'Margen inválido'
+                   WHEN c.disponible_invalido THEN 'Stock inválido'
+                   WHEN c.venta_por_peso_invalido OR c.venta_por_peso NOT IN (0, 1) THEN 'Venta por peso debe ser 0 o 1'
+                   WHEN c.producto_id IS NULL AND c.nombre IS NULL THEN 'Producto nuevo sin nombre'
+               END AS motivo
+        FROM con_margen c
+    )
+    SELECT n.linea, n.codigo_barras, n.producto_id, n.motivo,
+           n.nombre_a, n.costo_a, n.venta_a, n.margen_a, n.disponible_a, n.por_peso_a,
+           n.nombre_n, n.costo_n, n.venta_n, n.margen_n, n.disponible_n, n.por_peso_n,
+           CASE
+               WHEN n.motivo IS NOT NULL THEN 'INVALIDO'
+               WHEN n.producto_id IS NULL THEN 'NUEVO'
+               WHEN (n.nombre_n, n.costo_n, n.venta_n, n.margen_n, n.disponible_n, n.por_peso_n)
+                    IS DISTINCT FROM
+                    (n.nombre_a, n.costo_a, n.venta_a, n.margen_a, n.disponible_a, n.por_peso_a)
+                   THEN 'MODIFICADO'
+               ELSE 'SIN_CAMBIOS'
+           END AS estado
+    FROM nuevo n
+'''
+
+# Aplica las diferencias en una sola sentencia: modificaciones, altas y su auditoría
+_SQL_APLICAR_IMPORTACION = f'''
+    WITH actualizados AS (
+        UPDATE productos p
+        SET nombre = c.nombre_n, precio_costo = c.costo_n, precio_venta = c.venta_n,
+            margen_ganancia = c.margen_n, disponible = c.disponible_n,
+            venta_por_peso = c.por_peso_n
+        FROM importacion_cambios c
+        WHERE c.estado = 'MODIFICADO' AND p.id = c.producto_id
+        RETURNING p.id
+    ),
+    insertados AS (
+        INSERT INTO productos (codigo_barras, nombre, venta_por_peso, disponible,
+                               precio_costo, precio_venta, margen_ganancia)
+        SELECT codigo_barras, nombre_n, por_peso_n, disponible_n, costo_n, venta_n, margen_n
+        FROM importacion_cambios
+        WHERE estado = 'NUEVO'
+        ORDER BY linea
+        RETURNING id
+    ),
+    altas AS (
+        INSERT INTO modificaciones ({', '.join(AuditoriaModificaciones.COLUMNAS)})
+        SELECT %(usuario)s, %(fecha_hora)s, 'ALTA', id, NULL, NULL, NULL
+        FROM insertados
+        RETURNING 1
+    ),
+    cambios AS (
+        INSERT INTO modificaciones ({', '.join(AuditoriaModificaciones.COLUMNAS)})
+        SELECT %(usuario)s, %(fecha_hora)s, 'MODIFICACION', c.producto_id, v.campo, v.anterior, v.nuevo
+        FROM importacion_cambios c
+        CROSS JOIN LATERAL (VALUES
+            ('nombre', c.nombre_a, c.nombre_n),
+            ('precio_costo', c.costo_a::text, c.costo_n::text),
+            ('precio_venta', c.venta_a::text, c.venta_n::text),
+            ('margen_ganancia', c.margen_a::text, c.margen_n::text),
+            ('disponible', c.disponible_a::text, c.disponible_n::text),
+            ('venta_por_peso', c.por_peso_a::text, c.por_peso_n::text)
+        ) AS v (campo, anterior, nuevo)
+        WHERE c.estado = 'MODIFICADO' AND v.anterior IS DISTINCT FROM v.nuevo
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM actualizados), (SELECT COUNT(*) FROM insertados),
+           (SELECT COUNT(*) FROM altas) + (SELECT COUNT(*) FROM cambios)
+'''
+
+def importar_productos(ruta, usuario, simular=True, limite_vista_previa=200):
+    """
+    Importa una lista de productos (CSV o XLSX) comparándola por código de barras.
+
+    El archivo se carga con COPY a una tabla temporal y la comparación con
+    productos se hace en SQL. Con simular=True solo se informa qué cambiaría
+    y la transacción se descarta; si no, altas, modificaciones y su registro
+    en modificaciones se aplican en una única sentencia. Los triggers de
+    notificación se silencian y se envía un único aviso de recarga.
+
+    Returns:
+        dict con filas, duplicados, nuevos, modificados, sin_cambios, invalidos,
+        modificaciones_registradas, simulacion y vista_previa (lista de dicts
+        con las primeras filas que no quedan igual).
+    """
+    archivo = archivos_productos.ArchivoCopy(archivos_productos.leer_filas(ruta))
+    with get_db_connection(expected_slow=True) as conn:
         with conn.cursor() as cursor:
-            if term:
+            try:
                 cursor.execute('''
-                    SELECT id, codigo_barras, nombre, venta_por_peso, disponible, 
-                           precio_costo, precio_venta, margen_ganancia 
-                    FROM productos 
-                    WHERE (LOWER(nombre) LIKE LOWER(%s) OR codigo_barras LIKE %s)
-                    AND nombre NOT LIKE '[ELIMINADO]%%'
-                ''', (f'%{term}%', f'%{term}%'))
-            else:
+                    CREATE TEMP TABLE importacion_carga (
+                        linea INTEGER,
+                        codigo_barras TEXT, nombre TEXT, precio_costo TEXT, precio_venta TEXT,
+                        margen_ganancia TEXT, disponible TEXT, venta_por_peso TEXT
+                    ) ON COMMIT DROP
+                ''')
+                cursor.copy_expert("COPY importacion_carga FROM STDIN WITH (FORMAT csv)", archivo)
+                cursor.execute("ANALYZE importacion_carga")
+
+                if not simular:
+                    # Que nadie modifique productos entre la comparación y la escritura
+                    cursor.execute("LOCK TABLE productos IN SHARE ROW EXCLUSIVE MODE")
+                cursor.execute(_SQL_DIFERENCIAS_IMPORTACION)
+
+                cursor.execute('''
+                    SELECT estado, COUNT(*) FROM importacion_cambios GROUP BY estado
+                ''')
+                conteos = dict(cursor.fetchall())
                 cursor.execute('''
-                    SELECT id, codigo_barras, nombre, venta_por_peso, disponible, 
-                           precio_costo, precio_venta, margen_ganancia 
+                    SELECT estado, linea, codigo_barras, motivo,
+                           nombre_a, costo_a, venta_a, margen_a, disponible_a,
+                           nombre_n, costo_n, venta_n, margen_n, disponible_n
+                    FROM importacion_cambios
+                    WHERE estado != 'SIN_CAMBIOS'
+                    ORDER BY estado, linea
+                    LIMIT %s
+                ''', (limite_vista_previa,))
+                vista_previa = [
+                    {
+                        'estado': fila[0], 'linea': fila[1], 'codigo_barras': fila[2], 'motivo': fila[3],
+                        'anterior': dict(zip(('nombre', 'precio_costo', 'precio_venta', 'margen_ganancia', 'disponible'), fila[4:9])),
+                        'nuevo': dict(zip(('nombre', 'precio_costo', 'precio_venta', 'margen_ganancia', 'disponible'), fila[9:14])),
+                    }
+                    for fila in cursor.fetchall()
+                ]
+
+                resumen = {
+                    'filas': archivo.filas_leidas,
+                    'duplicados': archivo.filas_leidas - sum(conteos.values()),
+                    'nuevos': conteos.get('NUEVO', 0),
+                    'modificados': conteos.get('MODIFICADO', 0),
+                    'sin_cambios': conteos.get('SIN_CAMBIOS', 0),
+                    'invalidos': conteos.get('INVALIDO', 0),
+                    'modificaciones_registradas': 0,
+                    'simulacion': simular,
+                    'vista_previa': vista_previa,
+                }
+
+                if simular or not (resumen['nuevos'] or resumen['modificados']):
+                    conn.rollback()
+                    return resumen
+
+                _silenciar_notificaciones(cursor)
+                cursor.execute(_SQL_APLICAR_IMPORTACION, {
+                    'usuario': usuario,
+                    'fecha_hora': datetime.now(pytz.utc),
+                })
+                _, _, resumen['modificaciones_registradas'] = cursor.fetchone()
+                _notificar_recarga_productos(cursor)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error al importar productos desde {ruta}: {e}")
+                raise
+
+    logger.info(f"Importación de {ruta}: {resumen['nuevos']} nuevos, {resumen['modificados']} "
+                f"modificados, {resumen['invalidos']} inválidos")
+    _productos_recargados()
+    return resumen
+
+def exportar_productos(ruta):
+    """
+    Exporta el catálogo activo a CSV (con COPY) o XLSX, sin armarlo en memoria.
+
+    Las columnas son las que acepta importar_productos.
+
+    Returns:
+        Cantidad de productos exportados.
+    """
+    columnas = ', '.join(archivos_productos.COLUMNAS_ARCHIVO)
+    consulta = f'''
+        SELECT {columnas} FROM productos
+        WHERE nombre NOT LIKE '[ELIMINADO]%'
+        ORDER BY nombre
+    '''
+    with get_db_connection(expected_slow=True) as conn:
+        if not archivos_productos.es_xlsx(ruta):
+            with conn.cursor() as cursor, open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+                cursor.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER)", archivo)
+                return cursor.rowcount
+        # Cursor del servidor: las filas llegan de a lotes mientras se escribe el libro
+        with conn.cursor(name='exportar_productos') as cursor:
+            cursor.itersize = 5000
+            cursor.execute(consulta)
+            return archivos_productos.escribir_xlsx(ruta, archivos_productos.COLUMNAS_ARCHIVO, cursor)
+
+
+# Ajuste masivo de precios. Cada modo calcula costo, venta y margen nuevos a
+# partir de los actuales; el precio de venta se redondea al múltiplo indicado.
+_AJUSTES_PRECIO = {
+    # Sube el costo un porcentaje y recalcula la venta manteniendo el margen
+    # (si el margen no está cargado, el que surge de los precios actuales)
+    'costo': '''
+        round(o.precio_costo::numeric * (1 + %(valor)s::numeric / 100), 2) AS costo_n,
+        COALESCE(o.margen_ganancia::numeric,
+                 CASE WHEN o.precio_costo > 0
+                      THEN (o.precio_venta::numeric - o.precio_costo::numeric) / o.precio_costo::numeric * 100
+                 END) AS margen_n,
+        NULL::numeric AS venta_n
+    ''',
+    # Sube la venta un porcentaje y recalcula el margen sobre el costo actual
+    'venta': '''
+        o.precio_costo::numeric AS costo_n,
+        NULL::numeric AS margen_n,
+        o.precio_venta::numeric * (1 + %(valor)s::numeric / 100) AS venta_n
+    ''',
+    # Fija el margen y recalcula la venta sobre el costo actual
+    'margen': '''
+        o.precio_costo::numeric AS costo_n,
+        %(valor)s::numeric AS margen_n,
+        NULL::numeric AS venta_n
+    ''',
+}
+
+def ajustar_precios(usuario, modo, valor, nombre=None, codigo_desde=None, codigo_hasta=None,
+                    venta_por_peso=None, redondeo=0.01, hacia_arriba=False, simular=False):
+    '''
+    Ajusta los precios de todos los productos que cumplen el filtro en una sola sentencia.
+
+    Args:
+        modo: 'costo' (porcentaje sobre el costo, conserva el margen), 'venta'
+              (porcentaje sobre la venta, recalcula el margen) o 'margen'
+              (fija el margen y recalcula la venta).
+        valor: porcentaje o margen a aplicar.
+        nombre: texto contenido en el nombre (sin distinguir mayúsculas).
+        codigo_desde, codigo_hasta: rango de códigos de barras.
+        venta_por_peso: 0, 1 o None para no filtrar.
+        redondeo: múltiplo (mayor que cero) al que se redondea el precio de venta.
+        hacia_arriba: redondear siempre hacia arriba en lugar de al más cercano.
+        simular: calcula el resultado y descarta la transacción.
+
+    Los productos a los que no se les puede calcular un precio de venta
+    (falta el costo, la venta o el margen que el modo necesita) no se tocan.
+
+    Returns:
+        Lista de (id, codigo_barras, nombre, costo_anterior, costo_nuevo,
+        venta_anterior, venta_nueva, margen_nuevo) de los productos que cambian.
+    '''
+    if modo not in _AJUSTES_PRECIO:
+        raise ValueError(f"Modo de ajuste desconocido: {modo}")
+    if not redondeo or redondeo <= 0:
+        raise ValueError(f"El redondeo debe ser mayor que cero: {redondeo}")
+
+    filtros = ["nombre NOT LIKE '[ELIMINADO]%%'"]
+    parametros = {
+        'valor': valor,
+        'redondeo': redondeo,
+        'hacia_arriba': hacia_arriba,
+        'usuario': usuario,
+        'fecha_hora': datetime.now(pytz.utc),
+    }
+    if nombre:
+        filtros.append("nombre ILIKE %(nombre)s")
+        parametros['nombre'] = f"%{_escapar_like(nombre)}%"
+    if codigo_desde:
+        filtros.append("codigo_barras >= %(codigo_desde)s")
+        parametros['codigo_desde'] = codigo_desde
+    if codigo_hasta:
+        filtros.append("codigo_barras <= %(codigo_hasta)s")
+        parametros['codigo_hasta'] = codigo_hasta
+    if venta_por_peso is not None:
+        filtros.append("venta_por_peso = %(venta_por_peso)s")
+        parametros['venta_por_peso'] = venta_por_peso
+
+    sql = f'''
+        WITH objetivo AS (
+            SELECT id, precio_costo, precio_venta, margen_ganancia
+            FROM productos
+            WHERE {' AND '.join(filtros)}
+            FOR UPDATE
+        ),
+        base AS (
+            SELECT o.*, {_AJUSTES_PRECIO[modo]}
+            FROM objetivo o
+        ),
+        con_venta AS (
+            SELECT b.*,
+                   COALESCE(b.venta_n, b.costo_n * (1 + b.margen_n / 100)) AS venta_calculada
+            FROM base b
+        ),
+        redondeado AS (
+            SELECT v.id, v.precio_costo, v.precio_venta, v.margen_ganancia, v.costo_n,
+                   CASE WHEN %(hacia_arriba)s
+                        THEN ceil(v.venta_calculada / %(redondeo)s::numeric) * %(redondeo)s::numeric
+                        ELSE round(v.venta_calculada / %(redondeo)s::numeric) * %(redondeo)s::numeric
+                   END AS venta_n,
+                   v.margen_n
+            FROM con_venta v
+            -- Nunca dejar un precio en NULL
+            WHERE v.venta_calculada IS NOT NULL AND v.costo_n IS NOT NULL
+        ),
+        calculo AS (
+            SELECT r.id, r.precio_costo AS costo_a, r.precio_venta AS venta_a,
+                   r.margen_ganancia AS margen_a,
+                   r.costo_n::real AS costo_n, r.venta_n::real AS venta_n,
+                   COALESCE(r.margen_n,
+                            CASE WHEN r.costo_n > 0 THEN round((r.venta_n - r.costo_n) / r.costo_n * 100, 2) END,
+                            r.margen_ganancia)::real AS margen_n
+            FROM redondeado r
+        ),
+        actualizados AS (
+            UPDATE productos p
+            SET precio_costo = c.costo_n, precio_venta = c.venta_n, margen_ganancia = c.margen_n
+            FROM calculo c
+            WHERE p.id = c.id
+              AND (c.costo_n, c.venta_n, c.margen_n) IS DISTINCT FROM (c.costo_a, c.venta_a, c.margen_a)
+            RETURNING p.id, p.codigo_barras, p.nombre, c.costo_a, c.costo_n, c.venta_a, c.venta_n,
+                      c.margen_a, c.margen_n
+        ),
+        auditoria AS (
+            INSERT INTO modificaciones ({', '.join(AuditoriaModificaciones.COLUMNAS)})
+            SELECT %(usuario)s, %(fecha_hora)s, 'MODIFICACION', a.id, v.campo, v.anterior, v.nuevo
+            FROM actualizados a
+            CROSS JOIN LATERAL (VALUES
+                ('precio_costo', a.costo_a::text, a.costo_n::text),
+                ('precio_venta', a.venta_a::text, a.venta_n::text),
+                ('margen_ganancia', a.margen_a::text, a.margen_n::text)
+            ) AS v (campo, anterior, nuevo)
+            WHERE v.anterior IS DISTINCT FROM v.nuevo
+        )
+        SELECT id, codigo_barras, nombre, costo_a, costo_n, venta_a, venta_n, margen_n
+        FROM actualizados
+        ORDER BY nombre
+    '''
+
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            try:
+                _silenciar_notificaciones(cursor)
+                cursor.execute(sql, parametros)
+                cambios = cursor.fetchall()
+                if simular or not cambios:
+                    conn.rollback()
+                    return cambios
+                _notificar_recarga_productos(cursor)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error en el ajuste masivo de precios: {e}")
+                raise
+
+    logger.info(f"Ajuste de precios ({modo} {valor}) por {usuario}: {len(cambios)} productos")
+    _productos_recargados()
+    return cambios
+
+
+_COLUMNAS_BUSQUEDA = '''id, codigo_barras, nombre, venta_por_peso, disponible,
+                           precio_costo, precio_venta, margen_ganancia'''
+
+def _escapar_like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def buscar_producto(term='', limite=None, presupuesto_ms=500):
+    """
+    Busca productos activos por nombre o código.
+
+    Sin término devuelve todo el catálogo. Con término, los resultados se
+    ordenan por código exacto, prefijo, subcadena y por último similitud
+    (pg_trgm), y la consulta se corta si supera presupuesto_ms.
+    """
+    usar_trgm = bool(term) and _pg_trgm_disponible()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if not term:
+                cursor.execute(f'''
+                    SELECT {_COLUMNAS_BUSQUEDA}
                     FROM productos
                     WHERE nombre NOT LIKE '[ELIMINADO]%%'
                 ''')
-            return cursor.fetchall()
+                return cursor.fetchall()
+
+            termino = term.lower()
+            patron = _escapar_like(termino)
+            parametros = {
+                'termino': termino,
+                'prefijo': f'{patron}%',
+                'contiene': f'%{patron}%',
+                'limite': limite,
+            }
+            # Solo afecta a esta transacción; la conexión vuelve al pool con su timeout normal
+            cursor.execute('SET LOCAL statement_timeout = %s', (int(presupuesto_ms),))
+            if usar_trgm:
+                filtro_aproximado = 'OR lower(nombre) %% %(termino)s'
+                orden_similitud = 'similarity(lower(nombre), %(termino)s) DESC,'
+            else:
+                filtro_aproximado = orden_similitud = ''
+            try:
+                cursor.execute(f'''
+                    SELECT {_COLUMNAS_BUSQUEDA}
+                    FROM productos
+                    WHERE (lower(nombre) LIKE %(contiene)s OR codigo_barras LIKE %(contiene)s
+                           {filtro_aproximado})
+                    AND nombre NOT LIKE '[ELIMINADO]%%'
+                    ORDER BY CASE
+                                 WHEN codigo_barras = %(termino)s THEN 0
+                                 WHEN lower(nombre) LIKE %(prefijo)s OR codigo_barras LIKE %(prefijo)s THEN 1
+                                 WHEN lower(nombre) LIKE %(contiene)s OR codigo_barras LIKE %(contiene)s THEN 2
+                                 ELSE 3
+                             END,
+                             {orden_similitud}
+                             length(nombre), nombre
+                    LIMIT %(limite)s
+                ''', parametros)
+                return cursor.fetchall()
+            except psycopg2.errors.QueryCanceled:
+                logger.warning(f"Búsqueda de '{term}' cancelada por superar {presupuesto_ms} ms")
+                conn.rollback()
+                return []
                        
 #Ventas
 
-def buscar_coincidencias_producto(termino):
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            termino = f"%{termino}%"
-            cursor.execute('''
-                SELECT nombre FROM productos
-                WHERE (nombre LIKE %s OR codigo_barras LIKE %s)
-                AND nombre NOT LIKE '[ELIMINADO]%%'
-                LIMIT 10
-            ''', (termino, termino))
-            resultados = [fila[0] for fila in cursor.fetchall()]
-    return resultados
-
+def buscar_coincidencias_producto(termino, limite=10):
+    """Nombres de los productos que mejor coinciden con el término, para autocompletar."""
+    return [producto[2] for producto in buscar_producto(termino, limite=limite)]
 
 def obtener_producto_por_codigo(codigo_barras):
     """Versión optimizada para obtener un producto por su código de barras."""
+    # Primero el índice en memoria; la base de datos queda como respaldo
+    _asegurar_catalogo()
+    producto = catalog_index.buscar(codigo_barras)
+    if producto is not None:
+        return producto
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             # Para códigos de peso variable (comienzan con 2 y tienen al menos 7 dígitos)
@@ -650,7 +1790,40 @@ def obtener_producto_por_codigo(codigo_barras):
             return cursor.fetchone()
             
 
+def obtener_productos_por_codigos(codigos):
+    """
+    Resuelve de una vez varios códigos de barras exactos.
+
+    Primero se buscan en el índice en memoria y los que falten se piden en
+    una única consulta.
+
+    Returns:
+        dict codigo -> tupla del producto (mismo orden que obtener_producto_por_codigo).
+    """
+    _asegurar_catalogo()
+    encontrados, faltantes = catalog_index.buscar_codigos(set(codigos))
+    if not faltantes:
+        return encontrados
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT id, codigo_barras, nombre, precio_costo, precio_venta, 
+                       margen_ganancia, venta_por_peso, disponible
+                FROM productos
+                WHERE codigo_barras = ANY(%s)
+                AND nombre NOT LIKE '[ELIMINADO]%%'
+            ''', (faltantes,))
+            for producto in cursor.fetchall():
+                encontrados[producto[1]] = producto
+    return encontrados
+
 def obtener_producto_por_id(producto_id):
+    _asegurar_catalogo()
+    producto = catalog_index.buscar_por_id(producto_id)
+    if producto is not None:
+        return producto
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute('''
@@ -662,11 +1835,64 @@ def obtener_producto_por_id(producto_id):
             return cursor.fetchone()
 
 
-def registrar_venta(lista_productos, total, metodo_pago, cliente_id=None):
+def _descontar_lotes(cursor, lotes):
+    """
+    Bloquea y descuenta los lotes vendidos en una sola sentencia.
+
+    Args:
+        lotes: dict lote_id -> (producto_id, peso vendido)
+
+    Los lotes se bloquean en orden de id con SKIP LOCKED: si otra terminal
+    está vendiendo el mismo lote, la venta falla enseguida en lugar de
+    esperarla. Un lote que se vende completo queda no disponible con su
+    peso original, igual que en seleccionar_lote_para_venta.
+    """
+    descontados = execute_values(cursor, '''
+        WITH v (lote_id, producto_id, peso) AS (VALUES %s),
+        bloqueados AS (
+            SELECT lp.id FROM lotes_productos lp
+            JOIN v ON v.lote_id = lp.id AND v.producto_id = lp.producto_id
+            WHERE lp.disponible AND lp.peso_lote >= v.peso - 0.0005
+            ORDER BY lp.id
+            FOR UPDATE OF lp SKIP LOCKED
+        )
+        UPDATE lotes_productos lp
+        SET peso_lote = CASE WHEN lp.peso_lote - v.peso > 0.0005
+                             THEN lp.peso_lote - v.peso ELSE lp.peso_lote END,
+            disponible = lp.peso_lote - v.peso > 0.0005
+        FROM v, bloqueados b
+        WHERE lp.id = v.lote_id AND b.id = lp.id
+        RETURNING lp.id
+    ''', [(lote_id, producto_id, peso) for lote_id, (producto_id, peso) in sorted(lotes.items())],
+        template='(%s::integer, %s::integer, %s::real)', page_size=len(lotes), fetch=True)
+    if len(descontados) != len(lotes):
+        faltantes = set(lotes) - {fila[0] for fila in descontados}
+        raise Exception(f"Lotes no disponibles o en uso en otra terminal: {sorted(faltantes)}")
+
+def registrar_venta(lista_productos, total, metodo_pago, cliente_id=None, usuario=None):
+    """
+    Registra una venta descontando el stock de todos sus productos.
+
+    El stock se valida y descuenta en una sola sentencia que bloquea las
+    filas en orden de id: dos terminales que venden la última unidad a la
+    vez no pueden dejar el stock en negativo, y la cantidad de sentencias
+    no depende de la cantidad de líneas.
+
+    Cada línea es (producto_id, cantidad, precio_total) o, si sale de un
+    lote, (producto_id, peso, precio_total, lote_id). Los lotes se descuentan
+    en la misma transacción (ver _descontar_lotes) y, si se indica usuario,
+    cada uno queda en modificaciones.
+
+    Returns:
+        (exito, venta_id, productos), donde productos es un dict
+        producto_id -> (nombre, disponible, precio_venta) con el stock que
+        quedó después de la venta, tomado del RETURNING del descuento.
+    """
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
-                fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                ahora = datetime.now()
+                fecha_actual = ahora.strftime("%Y-%m-%d %H:%M:%S")
                 
                 # 1. Insert venta and get ID in one operation
                 cursor.execute('''
@@ -676,57 +1902,94 @@ def registrar_venta(lista_productos, total, metodo_pago, cliente_id=None):
                 ''', (fecha_actual, total, metodo_pago))
                 venta_id = cursor.fetchone()[0]
 
-                # 2. Prepare data for batch operations
-                detalles_values = []
-                stock_updates = []
-                producto_ids = [producto[0] for producto in lista_productos]
-
-                # 3. Get all product stock in one query
-                cursor.execute('''
-                    SELECT id, disponible 
-                    FROM productos 
-                    WHERE id = ANY(%s)
-                ''', (producto_ids,))
-                stock_actual = dict(cursor.fetchall())
-
-                # 4. Validate stock and prepare batch updates
-                for producto_id, cantidad, precio in lista_productos:
-                    stock_disponible = stock_actual.get(producto_id)
-                    
-                    if stock_disponible is None or stock_disponible < cantidad:
-                        raise Exception(f"Stock insuficiente para el producto con ID {producto_id}")
-                    
-                    detalles_values.append((venta_id, producto_id, cantidad))
-                    stock_updates.append((cantidad, producto_id))
-
-                # 5. Batch insert detalle_ventas
-                cursor.executemany('''
-                    INSERT INTO detalle_ventas (venta_id, producto_id, cantidad) 
-                    VALUES (%s, %s, %s)
-                ''', detalles_values)
-
-                # 6. Batch update stock
-                cursor.executemany('''
-                    UPDATE productos 
-                    SET disponible = CAST(disponible - %s AS DECIMAL(10,3)) 
-                    WHERE id = %s
-                ''', stock_updates)
-
-                # 7. Insert deuda if needed
+                if not lista_productos:
+                    raise Exception("La venta no tiene productos")
+
+                # 2. Total quantity per product (a product may appear in several lines)
+                cantidades = {}
+                lotes = {}
+                for linea in lista_productos:
+                    producto_id, cantidad = linea[0], linea[1]
+                    cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+                    if len(linea) > 3 and linea[3] is not None:
+                        _, peso = lotes.get(linea[3], (producto_id, 0))
+                        lotes[linea[3]] = (producto_id, peso + cantidad)
+
+                # Lots first, then products: always the same lock order
+                if lotes:
+                    _descontar_lotes(cursor, lotes)
+
+                # 3. Validate and decrement stock atomically, locking rows in id order
+                actualizados = execute_values(cursor, '''
+                    WITH v (id, cantidad) AS (VALUES %s),
+                    bloqueados AS (
+                        SELECT p.id FROM productos p
+                        JOIN v ON v.id = p.id
+                        ORDER BY p.id
+                        FOR UPDATE OF p
+                    )
+                    UPDATE productos p
+                    SET disponible = CAST(p.disponible - v.cantidad AS DECIMAL(10,3))
+                    FROM v, bloqueados b
+                    WHERE p.id = v.id AND b.id = p.id AND p.disponible >= v.cantidad
+                    RETURNING p.id, p.disponible, p.precio_costo, p.precio_venta, p.nombre
+                ''', sorted(cantidades.items()), template='(%s::integer, %s::numeric)',
+                    page_size=len(cantidades), fetch=True)
+
+                if len(actualizados) != len(cantidades):
+                    faltantes = set(cantidades) - {fila[0] for fila in actualizados}
+                    raise Exception(f"Stock insuficiente para los productos con ID {sorted(faltantes)}")
+
+                # 4. Batch insert detalle_ventas with the prices read while locked
+                precios = {fila[0]: (fila[2], fila[3]) for fila in actualizados}
+                detalle = []
+                for linea in lista_productos:
+                    lote_id = linea[3] if len(linea) > 3 else None
+                    detalle.append((venta_id, linea[0], linea[1], lote_id,
+                                    linea[1] if lote_id is not None else None) + precios[linea[0]])
+                execute_values(cursor, '''
+                    INSERT INTO detalle_ventas (venta_id, producto_id, cantidad, lote_id, peso_vendido,
+                                                precio_costo, precio_venta)
+                    VALUES %s
+                ''', detalle, page_size=len(detalle))
+                if usuario:
+                    for lote_id, (producto_id, peso) in lotes.items():
+                        registrar_modificacion(cursor, usuario, "VENTA_LOTE", producto_id, "disponible",
+                                               None, f"Venta {venta_id}, lote ID {lote_id}: -{peso} kg")
+
+                # 5. Insert deuda if needed
                 if metodo_pago == "A Crédito" and cliente_id is not None:
                     cursor.execute('''
                         INSERT INTO deudas (cliente_id, venta_id, fecha, monto) 
                         VALUES (%s, %s, CURRENT_TIMESTAMP, %s)
                     ''', (cliente_id, venta_id, total))
-
-                conn.commit()
+                    _registrar_movimiento_cliente(cursor, cliente_id, 'VENTA', total, venta_id)
+
+                # 6. Update the daily rollup in the same transaction
+                costo_total = ganancia_total = 0.0
+                for producto_id, _, precio_costo, precio_venta, _ in actualizados:
+                    cantidad = float(cantidades[producto_id])
+                    costo_total += float(precio_costo or 0) * cantidad
+                    ganancia_total += (float(precio_venta or 0) - float(precio_costo or 0)) * cantidad
+                _sumar_ventas_diarias(cursor, ahora.date(), metodo_pago, total,
+                                      costo_total, ganancia_total, len(lista_productos))
+
+                auditoria.confirmar(conn)
+                for producto_id, disponible, _, _, _ in actualizados:
+                    catalog_index.fijar_stock(producto_id, disponible)
+                if lotes:
+                    consultas_cache.invalidar('lotes')
+                if metodo_pago == "A Crédito" and cliente_id is not None:
+                    consultas_cache.invalidar('clientes')
                 signals.venta_realizada.emit()
-                return True, venta_id
+                productos = {producto_id: (nombre, disponible, precio_venta)
+                             for producto_id, disponible, _, precio_venta, nombre in actualizados}
+                return True, venta_id, productos
 
             except Exception as e:
                 conn.rollback()
                 print("Error al registrar venta:", e)
-                return False, None
+                return False, None, {}
             
             
 #Caja
@@ -756,138 +2019,485 @@ def obtener_detalle_ventas1(venta_id):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT p.nombre, dv.cantidad, p.precio_costo, p.precio_venta 
+                SELECT p.nombre, dv.cantidad, dv.precio_costo, dv.precio_venta
                 FROM detalle_ventas dv
                 JOIN productos p ON dv.producto_id = p.id
                 WHERE dv.venta_id = %s
             ''', (venta_id,))
             return cursor.fetchall()
         
-def obtener_ventas_por_dia(fecha):
+def _formatear_fecha(fecha):
+    """Convierte una fecha (datetime o texto ISO) a dd/mm/aaaa hh:mm."""
+    if isinstance(fecha, datetime):
+        return fecha.strftime("%d/%m/%Y %H:%M")
+    try:
+        return datetime.fromisoformat(str(fecha)).strftime("%d/%m/%Y %H:%M")
+    except ValueError:
+        # Fallback format if parsing fails
+        return str(fecha)
+
+def _formatear_fechas(fechas):
+    """Convierte en bloque las fechas de venta a dd/mm/aaaa hh:mm."""
+    return [_formatear_fecha(fecha) for fecha in fechas]
+
+def _rango_fechas(fecha_inicio, fecha_fin):
+    """
+    Devuelve los límites [inicio, fin) para filtrar por día con un rango semiabierto.
+
+    Comparar la columna directamente (fecha >= inicio AND fecha < fin) permite
+    usar el índice sobre ventas.fecha, cosa que date(fecha) impide.
+    """
+    inicio = date.fromisoformat(str(fecha_inicio))
+    fin = date.fromisoformat(str(fecha_fin)) + timedelta(days=1)
+    return inicio.isoformat(), fin.isoformat()
+
+def _rango_fechas_utc(fecha_inicio, fecha_fin):
+    """
+    Como _rango_fechas, para columnas que guardan la hora UTC sin zona
+    (modificaciones.fecha_hora): los días son de Argentina y los límites se
+    devuelven convertidos a UTC.
+    """
+    argentina_tz = pytz.timezone('America/Argentina/Buenos_Aires')
+    return tuple(
+        argentina_tz.localize(datetime.fromisoformat(limite)).astimezone(pytz.utc).replace(tzinfo=None)
+        for limite in _rango_fechas(fecha_inicio, fecha_fin)
+    )
+
+def obtener_reporte_ventas(fecha_inicio, fecha_fin):
+    """
+    Ventas entre dos fechas (inclusive) con su detalle y ganancia.
+
+    Encabezados, líneas y ganancia se resuelven en una única consulta
+    agrupada en lugar de una consulta de detalle por venta.
+
+    Returns:
+        Lista de tuplas (fecha_formateada, monto_total, metodo_pago, detalle, ganancia)
+        donde detalle es una lista de (nombre, cantidad, precio_costo, precio_venta).
+    """
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT v.fecha, v.monto_total, v.metodo_pago, v.id 
-                FROM ventas v
-                WHERE date(v.fecha) = %s AND v.metodo_pago != 'Pago de deuda'
-            ''', (fecha,))
+                WITH v AS (
+                    SELECT id, fecha, monto_total, metodo_pago
+                    FROM ventas
+                    WHERE fecha >= %s AND fecha < %s AND metodo_pago != 'Pago de deuda'
+                ),
+                lineas AS (
+                    SELECT dv.venta_id,
+                           json_agg(json_build_array(p.nombre, dv.cantidad, dv.precio_costo, dv.precio_venta)
+                                    ORDER BY dv.id) AS detalle,
+                           SUM((COALESCE(dv.precio_venta, 0)::float8 - COALESCE(dv.precio_costo, 0)::float8)
+                               * dv.cantidad::float8) AS ganancia
+                    FROM detalle_ventas dv
+                    JOIN v ON v.id = dv.venta_id
+                    JOIN productos p ON dv.producto_id = p.id
+                    GROUP BY dv.venta_id
+                )
+                SELECT v.fecha, v.monto_total, v.metodo_pago,
+                       COALESCE(l.detalle, '[]'::json), COALESCE(l.ganancia, 0)
+                FROM v
+                LEFT JOIN lineas l ON l.venta_id = v.id
+                ORDER BY v.fecha, v.id
+            ''', _rango_fechas(fecha_inicio, fecha_fin))
             ventas = cursor.fetchall()
 
-    # Process sales outside the connection context
-    ventas_con_detalle = []
-    for venta in ventas:
-        fecha_str, monto_total, metodo_pago, venta_id = venta
-        
-        # Convert datetime to string if it's a datetime object
-        if isinstance(fecha_str, datetime):
-            fecha_formateada = fecha_str.strftime("%d/%m/%Y %H:%M")
-        else:
-            # If it's already a string, parse it
-            try:
-                if " " in str(fecha_str):
-                    fecha_obj = datetime.strptime(str(fecha_str), "%Y-%m-%d %H:%M:%S")
-                else:
-                    fecha_obj = datetime.strptime(str(fecha_str), "%Y-%m-%d")
-                fecha_formateada = fecha_obj.strftime("%d/%m/%Y %H:%M")
-            except ValueError:
-                # Fallback format if parsing fails
-                fecha_formateada = str(fecha_str)
-        
-        detalle = obtener_detalle_ventas1(venta_id)
-        ganancia = sum((item[3] - item[2]) * item[1] for item in detalle)
-        ventas_con_detalle.append((fecha_formateada, monto_total, metodo_pago, detalle, ganancia))
-    
-    return ventas_con_detalle
+    fechas = _formatear_fechas(venta[0] for venta in ventas)
+    return [
+        (fecha, monto_total, metodo_pago, [tuple(item) for item in detalle], ganancia)
+        for fecha, (_, monto_total, metodo_pago, detalle, ganancia) in zip(fechas, ventas)
+    ]
+
+def obtener_ventas_por_dia(fecha):
+    return obtener_reporte_ventas(fecha, fecha)
 
 def obtener_ventas_por_periodo(fecha_inicio, fecha_fin):
+    return obtener_reporte_ventas(fecha_inicio, fecha_fin)
+
+def obtener_total_ventas_efectivo(fecha):
+    """Total cobrado en efectivo en el día, tomado del resumen ventas_diarias."""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT v.fecha, v.monto_total, v.metodo_pago, v.id 
-                FROM ventas v
-                WHERE date(v.fecha) BETWEEN %s AND %s AND v.metodo_pago != 'Pago de deuda'
+                SELECT recaudacion FROM ventas_diarias
+                WHERE fecha = %s AND metodo_pago = 'Efectivo'
+            ''', (fecha,))
+            fila = cursor.fetchone()
+    return fila[0] if fila else 0  # Si no hay ventas, devuelve 0
+
+def _sumar_ventas_diarias(cursor, fecha, metodo_pago, recaudacion, costo=0, ganancia=0, items=0, tickets=1):
+    """Acumula una venta (o un pago) en ventas_diarias dentro de la transacción en curso."""
+    cursor.execute('''
+        INSERT INTO ventas_diarias (fecha, metodo_pago, recaudacion, costo, ganancia, items, tickets)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (fecha, metodo_pago) DO UPDATE SET
+            recaudacion = ventas_diarias.recaudacion + EXCLUDED.recaudacion,
+            costo = ventas_diarias.costo + EXCLUDED.costo,
+            ganancia = ventas_diarias.ganancia + EXCLUDED.ganancia,
+            items = ventas_diarias.items + EXCLUDED.items,
+            tickets = ventas_diarias.tickets + EXCLUDED.tickets
+    ''', (fecha, metodo_pago, float(recaudacion), costo, ganancia, items, tickets))
+
+# Recalcula ventas_diarias a partir de ventas, detalle_ventas y pagos, con
+# los precios guardados en cada línea (los mismos que usó registrar_venta).
+# Los pagos de deudas se agrupan como 'Pago de deuda', sin costo ni ganancia.
+_SQL_RECALCULO_VENTAS_DIARIAS = '''
+    WITH v AS (
+        SELECT id, fecha, monto_total, metodo_pago
+        FROM ventas
+        WHERE fecha >= %(inicio)s AND fecha < %(fin)s
+    ),
+    lineas AS (
+        SELECT dv.venta_id,
+               COUNT(*) AS items,
+               SUM(COALESCE(dv.precio_costo, 0)::float8 * dv.cantidad::float8) AS costo,
+               SUM((COALESCE(dv.precio_venta, 0)::float8 - COALESCE(dv.precio_costo, 0)::float8)
+                   * dv.cantidad::float8) AS ganancia
+        FROM detalle_ventas dv
+        JOIN v ON v.id = dv.venta_id
+        GROUP BY dv.venta_id
+    ),
+    movimientos AS (
+        SELECT v.fecha::date AS fecha, v.metodo_pago, v.monto_total::float8 AS recaudacion,
+               COALESCE(l.costo, 0) AS costo, COALESCE(l.ganancia, 0) AS ganancia,
+               COALESCE(l.items, 0) AS items
+        FROM v
+        LEFT JOIN lineas l ON l.venta_id = v.id
+        UNION ALL
+        SELECT fecha::date, 'Pago de deuda', monto::float8, 0, 0, 0
+        FROM pagos
+        WHERE fecha >= %(inicio)s AND fecha < %(fin)s
+    )
+    SELECT fecha, metodo_pago, SUM(recaudacion), SUM(costo), SUM(ganancia),
+           SUM(items)::int, COUNT(*)::int
+    FROM movimientos
+    GROUP BY fecha, metodo_pago
+'''
+
+def _limites_ventas_diarias(fecha_inicio, fecha_fin):
+    inicio, fin = _rango_fechas(fecha_inicio or '1900-01-01', fecha_fin or date.today().isoformat())
+    return {'inicio': inicio, 'fin': fin}
+
+def reconstruir_ventas_diarias(fecha_inicio=None, fecha_fin=None):
+    """
+    Recalcula ventas_diarias para el rango indicado (por defecto, todo el historial).
+
+    Se usa para cargar el resumen la primera vez y para corregirlo si el
+    verificador encuentra diferencias.
+
+    Returns:
+        Cantidad de filas (día, método de pago) escritas.
+    """
+    limites = _limites_ventas_diarias(fecha_inicio, fecha_fin)
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            # Evita que una venta concurrente se sume sobre filas a medio reconstruir
+            cursor.execute('LOCK TABLE ventas_diarias IN EXCLUSIVE MODE')
+            cursor.execute('''
+                DELETE FROM ventas_diarias WHERE fecha >= %(inicio)s AND fecha < %(fin)s
+            ''', limites)
+            cursor.execute(f'''
+                INSERT INTO ventas_diarias (fecha, metodo_pago, recaudacion, costo, ganancia, items, tickets)
+                {_SQL_RECALCULO_VENTAS_DIARIAS}
+            ''', limites)
+            filas = cursor.rowcount
+            conn.commit()
+    logger.info(f"ventas_diarias reconstruida: {filas} filas")
+    return filas
+
+def verificar_ventas_diarias(fecha_inicio=None, fecha_fin=None, tolerancia=0.01):
+    """
+    Compara ventas_diarias con un recálculo desde las tablas de ventas.
+
+    Returns:
+        Lista de (fecha, metodo_pago, campo, valor_resumen, valor_recalculado).
+    """
+    limites = _limites_ventas_diarias(fecha_inicio, fecha_fin)
+    campos = ('recaudacion', 'costo', 'ganancia', 'items', 'tickets')
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT fecha, metodo_pago, recaudacion, costo, ganancia, items, tickets
+                FROM ventas_diarias
+                WHERE fecha >= %(inicio)s AND fecha < %(fin)s
+            ''', limites)
+            resumen = {(fila[0], fila[1]): fila[2:] for fila in cursor.fetchall()}
+            cursor.execute(_SQL_RECALCULO_VENTAS_DIARIAS, limites)
+            recalculado = {(fila[0], fila[1]): fila[2:] for fila in cursor.fetchall()}
+
+    diferencias = []
+    for clave in sorted(resumen.keys() | recalculado.keys()):
+        valores_resumen = resumen.get(clave, (0,) * len(campos))
+        valores_recalculo = recalculado.get(clave, (0,) * len(campos))
+        for campo, valor_resumen, valor_recalculo in zip(campos, valores_resumen, valores_recalculo):
+            if abs(float(valor_resumen or 0) - float(valor_recalculo or 0)) > tolerancia:
+                diferencias.append((clave[0], clave[1], campo, valor_resumen, valor_recalculo))
+    return diferencias
+
+def obtener_resumen_ventas(fecha_inicio, fecha_fin):
+    """
+    Totales de Caja entre dos fechas (inclusive) desde ventas_diarias.
+
+    Returns:
+        dict con recaudacion, ganancia, efectivo, tickets e items, sin contar
+        los pagos de deudas (igual que el reporte de ventas).
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT COALESCE(SUM(recaudacion), 0),
+                       COALESCE(SUM(ganancia), 0),
+                       COALESCE(SUM(recaudacion) FILTER (WHERE metodo_pago = 'Efectivo'), 0),
+                       COALESCE(SUM(tickets), 0),
+                       COALESCE(SUM(items), 0)
+                FROM ventas_diarias
+                WHERE fecha BETWEEN %s AND %s AND metodo_pago != 'Pago de deuda'
             ''', (fecha_inicio, fecha_fin))
-            ventas = cursor.fetchall()
+            recaudacion, ganancia, efectivo, tickets, items = cursor.fetchone()
+    return {
+        'recaudacion': recaudacion,
+        'ganancia': ganancia,
+        'efectivo': efectivo,
+        'tickets': tickets,
+        'items': items,
+    }
 
-    # Process sales outside the connection context
-    ventas_con_detalle = []
-    for venta in ventas:
-        fecha_str, monto_total, metodo_pago, venta_id = venta
-        
-        # Convert datetime to string if it's a datetime object
-        if isinstance(fecha_str, datetime):
-            fecha_formateada = fecha_str.strftime("%d/%m/%Y %H:%M")
-        else:
-            # If it's already a string, parse it
+
+#Clientes
+
+def agregar_cliente_a_db(nombre):
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
             try:
-                if " " in str(fecha_str):
-                    fecha_obj = datetime.strptime(str(fecha_str), "%Y-%m-%d %H:%M:%S")
-                else:
-                    fecha_obj = datetime.strptime(str(fecha_str), "%Y-%m-%d")
-                fecha_formateada = fecha_obj.strftime("%d/%m/%Y %H:%M")
-            except ValueError:
-                # Fallback format if parsing fails
-                fecha_formateada = str(fecha_str)
-        
-        detalle = obtener_detalle_ventas1(venta_id)
-        ganancia = sum((item[3] - item[2]) * item[1] for item in detalle)
-        
-        ventas_con_detalle.append((fecha_formateada, monto_total, metodo_pago, detalle, ganancia))
-    
-    return ventas_con_detalle
+                cursor.execute("INSERT INTO clientes (nombre) VALUES (%s) RETURNING id", (nombre,))
+                cliente_id = cursor.fetchone()[0]
+                cursor.execute("INSERT INTO saldos_clientes (cliente_id) VALUES (%s)", (cliente_id,))
+                conn.commit()
+                consultas_cache.invalidar('clientes')
+                signals.cliente_agregado.emit()
+                return True, cliente_id
+            except Exception as e:
+                conn.rollback()
+                print(f"Error al agregar cliente: {e}")
+                return False, None
 
-def obtener_total_ventas_efectivo(fecha):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT SUM(monto_total) FROM ventas WHERE fecha = %s AND metodo_pago = 'Efectivo'
-    ''', (fecha,))
-    total_efectivo = cursor.fetchone()[0] or 0  # Si no hay ventas, devuelve 0
-    conn.close()
-    return total_efectivo        
+@cacheado('clientes')
+def _leer_clientes():
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                    SELECT c.id, c.nombre,
+                           COALESCE(s.total_deuda, 0) as deuda_total,
+                           COALESCE(s.total_pagado, 0) as total_pagado,
+                           COALESCE(s.saldo, 0) as saldo
+                    FROM clientes c
+                    LEFT JOIN saldos_clientes s ON s.cliente_id = c.id
+                    ORDER BY c.nombre
+                """)
+            return [
+                {
+                    "id": row[0],
+                    "nombre": row[1],
+                    "deuda_total": float(row[2]),
+                    "total_pagado": float(row[3]),
+                    "saldo": float(row[4])
+                } for row in cursor.fetchall()
+            ]
+
+def obtener_clientes():
+    """Clientes con sus totales, leídos de saldos_clientes (una fila por cliente)."""
+    try:
+        return _leer_clientes()
+    except Exception as e:
+        print(f"Error al obtener clientes: {e}")
+        return []
+
+def obtener_saldo_cliente(cliente_id):
+    """Totales y saldo pendiente de un cliente."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT total_deuda, total_pagado, saldo FROM saldos_clientes WHERE cliente_id = %s
+            """, (cliente_id,))
+            fila = cursor.fetchone() or (0, 0, 0)
+    return {
+        "deuda_total": float(fila[0]),
+        "total_pagado": float(fila[1]),
+        "saldo": float(fila[2])
+    }
 
+def obtener_movimientos_cliente(cliente_id, limite=100):
+    """Últimos movimientos del libro de un cliente, con el saldo después de cada uno."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT fecha, tipo, venta_id, monto, saldo
+                FROM movimientos_clientes
+                WHERE cliente_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (cliente_id, limite))
+            return [
+                {
+                    "fecha": _formatear_fecha(row[0]),
+                    "tipo": row[1],
+                    "venta_id": row[2],
+                    "monto": float(row[3]),
+                    "saldo": float(row[4])
+                } for row in cursor.fetchall()
+            ]
+
+def _registrar_movimiento_cliente(cursor, cliente_id, tipo, monto, venta_id=None):
+    """
+    Suma una venta a crédito o un pago al saldo del cliente y lo anota en el
+    libro, dentro de la transacción en curso.
+
+    El upsert bloquea la fila de saldos_clientes, así que los movimientos
+    de un mismo cliente quedan en serie y el saldo del libro es correcto.
+    """
+    importe = float(monto) if tipo == 'VENTA' else -float(monto)
+    cursor.execute("""
+        INSERT INTO saldos_clientes (cliente_id, total_deuda, total_pagado, saldo, ultimo_movimiento)
+        VALUES (%(cliente_id)s, %(deuda)s, %(pagado)s, %(importe)s, CURRENT_TIMESTAMP)
+        ON CONFLICT (cliente_id) DO UPDATE SET
+            total_deuda = saldos_clientes.total_deuda + EXCLUDED.total_deuda,
+            total_pagado = saldos_clientes.total_pagado + EXCLUDED.total_pagado,
+            saldo = saldos_clientes.saldo + EXCLUDED.saldo,
+            ultimo_movimiento = EXCLUDED.ultimo_movimiento
+        RETURNING saldo
+    """, {
+        'cliente_id': cliente_id,
+        'deuda': float(monto) if tipo == 'VENTA' else 0,
+        'pagado': float(monto) if tipo == 'PAGO' else 0,
+        'importe': importe,
+    })
+    saldo = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO movimientos_clientes (cliente_id, tipo, venta_id, monto, saldo)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (cliente_id, tipo, venta_id, importe, saldo))
+    return saldo
+
+# Movimientos de clientes recalculados desde el historial. Una venta es a
+# crédito si tiene deuda o pagos imputados (las deudas saldadas se borran,
+# pero sus pagos quedan); el saldo corrido se calcula con una ventana.
+_SQL_RECALCULO_MOVIMIENTOS = '''
+    WITH ventas_credito AS (
+        SELECT DISTINCT ON (venta_id) venta_id, cliente_id
+        FROM (
+            SELECT venta_id, cliente_id, 0 AS prioridad FROM deudas
+            UNION ALL
+            SELECT venta_id, cliente_id, 1 FROM pagos WHERE venta_id IS NOT NULL
+        ) origen
+        ORDER BY venta_id, prioridad
+    ),
+    movimientos AS (
+        SELECT vc.cliente_id, v.fecha, 'VENTA' AS tipo, v.id AS venta_id,
+               v.monto_total::numeric(12,2) AS monto, 0 AS orden
+        FROM ventas_credito vc
+        JOIN ventas v ON v.id = vc.venta_id
+        UNION ALL
+        -- Los pagos imputados en una misma operación comparten la fecha
+        -- y forman un solo movimiento, igual que en registrar_pago_cliente
+        SELECT cliente_id, fecha, 'PAGO',
+               CASE WHEN COUNT(*) = 1 THEN MIN(venta_id) END,
+               -SUM(monto::numeric(12,2)), 1
+        FROM pagos
+        GROUP BY cliente_id, fecha
+    )
+    SELECT cliente_id, fecha, tipo, venta_id, monto, orden,
+           SUM(monto) OVER (PARTITION BY cliente_id ORDER BY fecha, orden, venta_id
+                            ROWS UNBOUNDED PRECEDING) AS saldo
+    FROM movimientos
+'''
+
+_SQL_RECALCULO_SALDOS = f'''
+    SELECT cliente_id,
+           COALESCE(SUM(monto) FILTER (WHERE tipo = 'VENTA'), 0) AS total_deuda,
+           COALESCE(-SUM(monto) FILTER (WHERE tipo = 'PAGO'), 0) AS total_pagado,
+           COALESCE(SUM(monto), 0) AS saldo,
+           MAX(fecha) AS ultimo_movimiento
+    FROM ({_SQL_RECALCULO_MOVIMIENTOS}) m
+    GROUP BY cliente_id
+'''
+
+def reconstruir_saldos_clientes():
+    """
+    Carga movimientos_clientes y saldos_clientes desde ventas, deudas y pagos.
 
-#Clientes
+    Se corre una vez para pasar el historial al libro, y de nuevo si la
+    conciliación encuentra diferencias.
 
-def agregar_cliente_a_db(nombre):
-    with get_db_connection() as conn:
+    Returns:
+        (cantidad de movimientos, cantidad de clientes)
+    """
+    with get_db_connection(expected_slow=True) as conn:
         with conn.cursor() as cursor:
             try:
-                cursor.execute("INSERT INTO clientes (nombre) VALUES (%s) RETURNING id", (nombre,))
-                cliente_id = cursor.fetchone()[0]
+                # Ninguna venta ni pago puede escribir en el libro mientras se rehace
+                cursor.execute('LOCK TABLE saldos_clientes, movimientos_clientes IN EXCLUSIVE MODE')
+                cursor.execute('DELETE FROM movimientos_clientes')
+                cursor.execute(f'''
+                    INSERT INTO movimientos_clientes (cliente_id, fecha, tipo, venta_id, monto, saldo)
+                    SELECT cliente_id, fecha, tipo, venta_id, monto, saldo
+                    FROM ({_SQL_RECALCULO_MOVIMIENTOS}) m
+                    ORDER BY cliente_id, fecha, orden, venta_id
+                ''')
+                movimientos = cursor.rowcount
+                cursor.execute('DELETE FROM saldos_clientes')
+                cursor.execute(f'''
+                    INSERT INTO saldos_clientes (cliente_id, total_deuda, total_pagado, saldo, ultimo_movimiento)
+                    SELECT c.id, COALESCE(r.total_deuda, 0), COALESCE(r.total_pagado, 0),
+                           COALESCE(r.saldo, 0), r.ultimo_movimiento
+                    FROM clientes c
+                    LEFT JOIN ({_SQL_RECALCULO_SALDOS}) r ON r.cliente_id = c.id
+                ''')
+                clientes = cursor.rowcount
                 conn.commit()
-                signals.cliente_agregado.emit()
-                return True, cliente_id
+                consultas_cache.invalidar('clientes')
             except Exception as e:
                 conn.rollback()
-                print(f"Error al agregar cliente: {e}")
-                return False, None
+                print(f"Error al reconstruir saldos de clientes: {e}")
+                raise
+    logger.info(f"Saldos de clientes reconstruidos: {movimientos} movimientos, {clientes} clientes")
+    return movimientos, clientes
 
-def obtener_clientes():
-    with get_db_connection() as conn:
+def conciliar_saldos_clientes(tolerancia=0.01):
+    """
+    Compara saldos_clientes con el libro de movimientos y con un recálculo
+    desde ventas, deudas y pagos.
+
+    Returns:
+        Lista de (cliente_id, nombre, campo, valor_tabla, valor_esperado). El
+        campo saldo_libro compara el saldo con la suma de los movimientos.
+    """
+    with get_db_connection(expected_slow=True) as conn:
         with conn.cursor() as cursor:
-            try:
-                cursor.execute("""
-                    SELECT c.id, c.nombre,
-                           COALESCE(SUM(d.monto), 0) as deuda_total,
-                           COALESCE(SUM(p.monto), 0) as total_pagado
-                    FROM clientes c
-                    LEFT JOIN deudas d ON c.id = d.cliente_id
-                    LEFT JOIN pagos p ON c.id = p.cliente_id
-                    GROUP BY c.id, c.nombre
-                    ORDER BY c.nombre
-                """)
-                return [
-                    {
-                        "id": row[0],
-                        "nombre": row[1],
-                        "deuda_total": float(row[2]),
-                        "total_pagado": float(row[3])
-                    } for row in cursor.fetchall()
-                ]
-            except Exception as e:
-                print(f"Error al obtener clientes: {e}")
-                return []
+            cursor.execute(f'''
+                SELECT c.id, c.nombre,
+                       COALESCE(s.total_deuda, 0), COALESCE(r.total_deuda, 0),
+                       COALESCE(s.total_pagado, 0), COALESCE(r.total_pagado, 0),
+                       COALESCE(s.saldo, 0), COALESCE(r.saldo, 0),
+                       COALESCE(l.saldo, 0)
+                FROM clientes c
+                LEFT JOIN saldos_clientes s ON s.cliente_id = c.id
+                LEFT JOIN ({_SQL_RECALCULO_SALDOS}) r ON r.cliente_id = c.id
+                LEFT JOIN (
+                    SELECT cliente_id, SUM(monto) AS saldo
+                    FROM movimientos_clientes GROUP BY cliente_id
+                ) l ON l.cliente_id = c.id
+                ORDER BY c.id
+            ''')
+            filas = cursor.fetchall()
+
+    diferencias = []
+    for cliente_id, nombre, deuda, deuda_r, pagado, pagado_r, saldo, saldo_r, saldo_libro in filas:
+        for campo, valor, esperado in (('total_deuda', deuda, deuda_r),
+                                       ('total_pagado', pagado, pagado_r),
+                                       ('saldo', saldo, saldo_r),
+                                       ('saldo_libro', saldo, saldo_libro)):
+            if abs(float(valor) - float(esperado)) > tolerancia:
+                diferencias.append((cliente_id, nombre, campo, valor, esperado))
+    return diferencias
 
 def obtener_deudas_cliente(cliente_id):
     with get_db_connection() as conn:
@@ -905,11 +2515,11 @@ def obtener_deudas_cliente(cliente_id):
                 
                 return [
                     {
-                        "fecha": row[0],
+                        "fecha": _formatear_fecha(row[0]),
                         "monto_total": float(row[1]),
                         "venta_id": row[2],
                         "monto_pagado": float(row[3]),
-                        "monto_pendiente": float(row[1]) - float(row[3])
+                        "monto_pendiente": float(row[1])  # deudas.monto es lo que falta pagar
                     } for row in cursor.fetchall()
                 ]
             except Exception as e:
@@ -933,7 +2543,7 @@ def obtener_pagos_cliente(cliente_id):
                 
                 return [
                     {
-                        "fecha": row[0],
+                        "fecha": _formatear_fecha(row[0]),
                         "monto_pagado": float(row[1]),
                         "venta_id": row[2],
                         "monto_venta_total": float(row[3]) if row[3] else 0,
@@ -951,33 +2561,41 @@ def obtener_detalle_ventas_deudas(cliente_id):
         with conn.cursor() as cursor:
             try:
                 # Single query to get all necessary information
+                # Pagos y detalle se agregan por separado para que no se
+                # multipliquen entre sí (líneas x pagos)
                 cursor.execute("""
-                    SELECT 
+                    SELECT
                         d.fecha,
                         d.monto,
                         d.venta_id,
                         v.monto_total,
-                        COALESCE(SUM(p.monto), 0) as monto_pagado,
-                        json_agg(
+                        COALESCE(p.monto_pagado, 0) as monto_pagado,
+                        dv.detalles
+                    FROM deudas d
+                    JOIN ventas v ON d.venta_id = v.id
+                    LEFT JOIN LATERAL (
+                        SELECT SUM(monto) AS monto_pagado
+                        FROM pagos WHERE venta_id = d.venta_id
+                    ) p ON TRUE
+                    LEFT JOIN LATERAL (
+                        SELECT json_agg(
                             json_build_object(
                                 'nombre', COALESCE(pr.nombre, 'Producto Desconocido'),
                                 'cantidad', dv.cantidad,
-                                'precio_unitario', pr.precio_venta
+                                'precio_unitario', COALESCE(dv.precio_venta, pr.precio_venta)
                             )
-                        ) as detalles
-                    FROM deudas d
-                    JOIN ventas v ON d.venta_id = v.id
-                    LEFT JOIN detalle_ventas dv ON v.id = dv.venta_id
-                    LEFT JOIN productos pr ON dv.producto_id = pr.id
-                    LEFT JOIN pagos p ON d.venta_id = p.venta_id
+                        ) AS detalles
+                        FROM detalle_ventas dv
+                        LEFT JOIN productos pr ON dv.producto_id = pr.id
+                        WHERE dv.venta_id = d.venta_id
+                    ) dv ON TRUE
                     WHERE d.cliente_id = %s
-                    GROUP BY d.fecha, d.monto, d.venta_id, v.monto_total
                     ORDER BY d.fecha DESC
                 """, (cliente_id,))
                 
                 return [
                     {
-                        "fecha": row[0],
+                        "fecha": _formatear_fecha(row[0]),
                         "monto": float(row[1]),
                         "monto_total": float(row[3]),
                         "monto_pagado": float(row[4]),
@@ -991,88 +2609,77 @@ def obtener_detalle_ventas_deudas(cliente_id):
                 return []
 
 def registrar_pago_cliente(cliente_id, monto):
-    """Registra el pago de un cliente y actualiza sus deudas."""
+    """
+    Registra el pago de un cliente imputándolo a sus deudas, de la más vieja a la más nueva.
+
+    La imputación se calcula en SQL con una suma acumulada de los saldos
+    pendientes, y los pagos, las deudas reducidas y las saldadas se escriben
+    en la misma sentencia: la cantidad de idas y vueltas no depende de
+    cuántas deudas tenga el cliente. Las deudas del cliente quedan
+    bloqueadas hasta el final de la transacción.
+
+    deudas.monto guarda lo que falta pagar de cada venta.
+    """
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
-                # Begin transaction
-                cursor.execute("BEGIN")
-                
-                # Get all unpaid debts in one query
                 cursor.execute("""
-                    WITH DeudaPendiente AS (
-                        SELECT 
-                            d.id,
-                            d.venta_id,
-                            d.monto as monto_original,
-                            d.monto - COALESCE(SUM(p.monto), 0) as monto_pendiente
-                        FROM deudas d
-                        LEFT JOIN pagos p ON d.venta_id = p.venta_id
-                        WHERE d.cliente_id = %s
-                        GROUP BY d.id, d.venta_id, d.monto
-                        HAVING d.monto > COALESCE(SUM(p.monto), 0)
-                        ORDER BY d.fecha ASC
+                    WITH pendientes AS (
+                        SELECT id, venta_id, fecha, monto::numeric(12,2) AS pendiente
+                        FROM deudas
+                        WHERE cliente_id = %(cliente_id)s AND monto > 0
+                        ORDER BY fecha, id
                         FOR UPDATE
+                    ),
+                    imputacion AS (
+                        SELECT id, venta_id, pendiente,
+                               LEAST(pendiente, GREATEST(%(monto)s::numeric(12,2)
+                                   - (SUM(pendiente) OVER (ORDER BY fecha, id) - pendiente), 0)) AS pago
+                        FROM pendientes
+                    ),
+                    aplicados AS (
+                        SELECT * FROM imputacion WHERE pago > 0
+                    ),
+                    pagos_nuevos AS (
+                        INSERT INTO pagos (cliente_id, venta_id, monto, fecha)
+                        SELECT %(cliente_id)s, venta_id, pago, CURRENT_TIMESTAMP FROM aplicados
+                        RETURNING fecha
+                    ),
+                    reducidas AS (
+                        UPDATE deudas d SET monto = a.pendiente - a.pago
+                        FROM aplicados a
+                        WHERE d.id = a.id AND a.pago < a.pendiente
+                    ),
+                    saldadas AS (
+                        DELETE FROM deudas d
+                        USING aplicados a
+                        WHERE d.id = a.id AND a.pago >= a.pendiente
                     )
-                    SELECT * FROM DeudaPendiente
-                """, (cliente_id,))
-                
-                deudas = cursor.fetchall()
-                
-                if not deudas:
+                    SELECT (SELECT COUNT(*) FROM pendientes), venta_id, pago,
+                           (SELECT MAX(fecha)::date FROM pagos_nuevos)
+                    FROM aplicados
+                """, {'cliente_id': cliente_id, 'monto': monto})
+                imputados = cursor.fetchall()
+
+                if not imputados:
                     raise Exception("El cliente no tiene deudas pendientes.")
-                
-                monto_restante = monto
-                pagos_a_registrar = []
-                deudas_a_actualizar = []
-                deudas_a_eliminar = []
-                
-                # Process all debts
-                for deuda_id, venta_id, monto_original, monto_pendiente in deudas:
-                    if monto_restante <= 0:
-                        break
-                        
-                    pago_actual = min(monto_restante, monto_pendiente)
-                    monto_restante -= pago_actual
-                    
-                    pagos_a_registrar.append((
-                        cliente_id,
-                        venta_id,
-                        pago_actual
-                    ))
-                    
-                    if pago_actual >= monto_pendiente:
-                        deudas_a_eliminar.append(deuda_id)
-                    else:
-                        deudas_a_actualizar.append((
-                            monto_original - pago_actual,
-                            deuda_id
-                        ))
-                
-                # Batch insert payments
-                if pagos_a_registrar:
-                    cursor.executemany("""
-                        INSERT INTO pagos (cliente_id, venta_id, monto, fecha)
-                        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                    """, pagos_a_registrar)
-                
-                # Batch update remaining debts
-                if deudas_a_actualizar:
-                    cursor.executemany("""
-                        UPDATE deudas SET monto = %s WHERE id = %s
-                    """, deudas_a_actualizar)
-                
-                # Batch delete fully paid debts
-                if deudas_a_eliminar:
-                    cursor.execute("""
-                        DELETE FROM deudas WHERE id = ANY(%s)
-                    """, (deudas_a_eliminar,))
-                
-                cursor.execute("COMMIT")
+
+                total_pagado = sum(pago for _, _, pago, _ in imputados)
+                venta_id = imputados[0][1] if len(imputados) == 1 else None
+                _registrar_movimiento_cliente(cursor, cliente_id, 'PAGO', total_pagado, venta_id)
+                # El día es el de pagos.fecha tal como quedó guardada, el mismo
+                # que usa el recálculo de ventas_diarias
+                _sumar_ventas_diarias(cursor, imputados[0][3], 'Pago de deuda', total_pagado,
+                                      tickets=len(imputados))
+
+                conn.commit()
+                consultas_cache.invalidar('clientes')
+                logger.info(f"Pago de cliente {cliente_id}: ${total_pagado} imputado a "
+                            f"{len(imputados)} de {imputados[0][0]} deudas")
                 return True
-                
+
             except Exception as e:
-                cursor.execute("ROLLBACK")
+                conn.rollback()
                 print(f"Error al registrar pago: {e}")
                 return False
             
@@ -1098,6 +2705,7 @@ def verificar_credenciales(nombre_usuario, password):
                 resultado = cursor.fetchone()
                 if resultado:
                     conn.commit()
+                    consultas_cache.invalidar('usuarios')
                     return True, resultado[0]
                 return False, None
             except Exception as e:
@@ -1115,6 +2723,7 @@ def registrar_desconexion(nombre_usuario):
                 WHERE nombre = %s
             ''', (nombre_usuario,))
             conn.commit()
+    consultas_cache.invalidar('usuarios')
                     
 def crear_usuario_admin_default():
     """Creates a default admin user if no users exist in the system."""
@@ -1150,6 +2759,7 @@ def crear_usuario_admin_default():
                     
                     if cursor.fetchone():
                         conn.commit()
+                        consultas_cache.invalidar('usuarios')
                         print("Default admin user created successfully")
                         return True
                     
@@ -1172,6 +2782,7 @@ def crear_usuario(nombre, password, rol):
                 ''', (nombre, hash_password(password), rol))
                 usuario_id = cursor.fetchone()[0]
                 conn.commit()
+                consultas_cache.invalidar('usuarios')
                 return True, usuario_id
             except Exception as e:
                 conn.rollback()
@@ -1205,18 +2816,63 @@ def modificar_usuario(id_usuario, nuevo_nombre, password, rol):
                     raise Exception("Usuario no encontrado")
                     
                 conn.commit()
+                consultas_cache.invalidar('usuarios')
                 return True
             except Exception as e:
                 conn.rollback()
                 print(f"Error al modificar usuario: {e}")
                 return False
 
-def obtener_modificaciones():
-    """Obtiene el historial de modificaciones con detalles optimizados."""
+def obtener_modificaciones(limite=200, antes_de=None, despues_de_id=None, usuario=None,
+                           producto_id=None, tipo=None, fecha_inicio=None, fecha_fin=None):
+    """
+    Obtiene una página del historial de modificaciones, de la más nueva a la más vieja.
+
+    La paginación es por clave (fecha_hora, id), no por OFFSET: cada página
+    cuesta lo mismo sin importar cuán atrás esté, usando el índice
+    idx_modificaciones_fecha_id.
+
+    Args:
+        limite: cantidad máxima de filas
+        antes_de: (fecha_hora, id) de la última fila de la página anterior
+        despues_de_id: solo las modificaciones con id mayor (las nuevas desde la última carga)
+        usuario, producto_id, tipo: filtros opcionales por igualdad
+        fecha_inicio, fecha_fin: filtro opcional por días de Argentina, inclusive
+            (aaaa-mm-dd). fecha_hora se guarda en UTC sin zona; los límites del
+            día se convierten a UTC antes de comparar
+
+    Returns:
+        Lista de dicts con id, usuario, fecha_hora, tipo_modificacion,
+        producto_nombre, campo_modificado, valor_anterior y valor_nuevo.
+    """
+    condiciones = []
+    parametros = []
+    if antes_de is not None:
+        condiciones.append("(m.fecha_hora, m.id) < (%s, %s)")
+        parametros.extend(antes_de)
+    if despues_de_id is not None:
+        condiciones.append("m.id > %s")
+        parametros.append(despues_de_id)
+    if usuario:
+        condiciones.append("m.usuario = %s")
+        parametros.append(usuario)
+    if producto_id is not None:
+        condiciones.append("m.producto_id = %s")
+        parametros.append(producto_id)
+    if tipo:
+        condiciones.append("m.tipo_modificacion = %s")
+        parametros.append(tipo)
+    if fecha_inicio or fecha_fin:
+        inicio, fin = _rango_fechas_utc(fecha_inicio or '1900-01-01', fecha_fin or date.today().isoformat())
+        condiciones.append("m.fecha_hora >= %s AND m.fecha_hora < %s")
+        parametros.extend([inicio, fin])
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    parametros.append(limite)
+
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
-                cursor.execute('''
+                cursor.execute(f'''
                     SELECT 
                         m.id,
                         m.usuario,
@@ -1228,9 +2884,10 @@ def obtener_modificaciones():
                         m.valor_nuevo
                     FROM modificaciones m
                     LEFT JOIN productos p ON m.producto_id = p.id
-                    ORDER BY m.fecha_hora DESC
-                    LIMIT 1000
-                ''')
+                    {where}
+                    ORDER BY m.fecha_hora DESC, m.id DESC
+                    LIMIT %s
+                ''', parametros)
                 
                 return [
                     {
@@ -1250,6 +2907,7 @@ def obtener_modificaciones():
                 print(f"Error al obtener modificaciones: {e}")
                 return []
 
+@cacheado('usuarios')
 def obtener_usuarios():
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
@@ -1285,6 +2943,7 @@ def eliminar_usuario(usuario_id):
                     return False
                 
                 conn.commit()
+                consultas_cache.invalidar('usuarios')
                 return True
             except Exception as e:
                 conn.rollback()
@@ -1308,6 +2967,7 @@ def actualizar_estado_usuarios():
                 ''')
                 
                 conn.commit()
+                consultas_cache.invalidar('usuarios')
                 print("Estado de conexión de los usuarios actualizado.")
             except Exception as e:
                 print(f"Error al actualizar el estado de los usuarios: {e}")
@@ -1350,25 +3010,44 @@ def agregar_lote_producto(producto_id, peso, codigo_unico=None, usuario=None):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Insertar el nuevo lote
-            cursor.execute("""
-                INSERT INTO lotes_productos (producto_id, peso_lote, codigo_unico)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """, (producto_id, peso, codigo_unico))
-            
-            lote_id = cursor.fetchone()[0]
-            
-            # Actualizar el stock total del producto
+            # Actualizar el stock total del producto (bloquea la fila del
+            # producto, así dos altas simultáneas no eligen el mismo código)
             cursor.execute("""
                 UPDATE productos
                 SET disponible = disponible + %s
                 WHERE id = %s
             """, (peso, producto_id))
             
+            # Insertar el nuevo lote con el primer código numérico libre
+            # entre los lotes disponibles del producto
+            cursor.execute("""
+                INSERT INTO lotes_productos (producto_id, peso_lote, codigo_unico, codigo_numerico)
+                SELECT %(producto_id)s, %(peso)s, %(codigo_unico)s, (%(codigo)s + s) %% 10000
+                FROM generate_series(0, 9999) AS s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM lotes_productos
+                    WHERE producto_id = %(producto_id)s AND disponible
+                      AND codigo_numerico = (%(codigo)s + s) %% 10000
+                )
+                ORDER BY s
+                LIMIT 1
+                RETURNING id
+            """, {
+                'producto_id': producto_id,
+                'peso': peso,
+                'codigo_unico': codigo_unico,
+                'codigo': _codigo_numerico_lote(codigo_unico),
+            })
+            
+            fila = cursor.fetchone()
+            if fila is None:
+                raise ValueError("El producto no tiene códigos de lote libres")
+            lote_id = fila[0]
+            
             # Registrar la modificación
             if usuario:
                 registrar_modificacion(
+                    cursor,
                     usuario, 
                     "AGREGAR_LOTE", 
                     producto_id, 
@@ -1376,8 +3055,11 @@ def agregar_lote_producto(producto_id, peso, codigo_unico=None, usuario=None):
                     None, 
                     f"Lote {codigo_unico}: +{peso} kg"
                 )
+            auditoria.confirmar(conn)
             
-            return lote_id
+        catalog_index.ajustar_stock(producto_id, peso)
+        consultas_cache.invalidar('lotes')
+        return lote_id
     except Exception as e:
         print(f"Error al agregar lote: {str(e)}")
         return None
@@ -1394,9 +3076,15 @@ def obtener_lotes_producto(producto_id, solo_disponibles=True):
         Lista de lotes o lista vacía si hay error
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        return _leer_lotes_producto(producto_id, solo_disponibles)
+    except Exception as e:
+        print(f"Error al obtener lotes: {str(e)}")
+        return []
+
+@cacheado('lotes')
+def _leer_lotes_producto(producto_id, solo_disponibles):
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
             query = """
                 SELECT lp.id, lp.peso_lote, lp.fecha_creacion, lp.codigo_unico, lp.disponible
                 FROM lotes_productos lp
@@ -1410,9 +3098,6 @@ def obtener_lotes_producto(producto_id, solo_disponibles=True):
             
             cursor.execute(query, (producto_id,))
             return cursor.fetchall()
-    except Exception as e:
-        print(f"Error al obtener lotes: {str(e)}")
-        return []
 
 def marcar_lote_como_vendido(lote_id):
     """
@@ -1432,7 +3117,8 @@ def marcar_lote_como_vendido(lote_id):
                 SET disponible = FALSE
                 WHERE id = %s
             """, (lote_id,))
-            return True
+        consultas_cache.invalidar('lotes')
+        return True
     except Exception as e:
         print(f"Error al marcar lote como vendido: {str(e)}")
         return False
@@ -1440,7 +3126,10 @@ def marcar_lote_como_vendido(lote_id):
 def registrar_venta_con_lote(venta_id, producto_id, lote_id, cantidad, peso_vendido, usuario=None):
     """
     Registra una venta que incluye un lote específico
-    
+
+    Todo se hace en una transacción sobre una sola conexión: el lote se
+    bloquea y descuenta con _descontar_lotes, igual que en registrar_venta.
+
     Args:
         venta_id: ID de la venta
         producto_id: ID del producto
@@ -1448,45 +3137,54 @@ def registrar_venta_con_lote(venta_id, producto_id, lote_id, cantidad, peso_vend
         cantidad: Cantidad (normalmente 1 para productos por peso)
         peso_vendido: Peso vendido en kg
         usuario: Usuario que realiza la operación
-    
+
     Returns:
         ID del detalle de venta o None si hay error
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Insertar detalle de venta con lote
-            cursor.execute("""
-                INSERT INTO detalle_ventas (venta_id, producto_id, lote_id, cantidad, peso_vendido)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-            """, (venta_id, producto_id, lote_id, cantidad, peso_vendido))
-            
-            detalle_id = cursor.fetchone()[0]
-            
-            # Actualizar disponibilidad del lote
-            marcar_lote_como_vendido(lote_id)
-            
-            # Actualizar stock total del producto
-            cursor.execute("""
-                UPDATE productos
-                SET disponible = disponible - %s
-                WHERE id = %s
-            """, (peso_vendido, producto_id))
-            
-            # Registrar la modificación
-            if usuario:
-                registrar_modificacion(
-                    usuario, 
-                    "VENTA_LOTE", 
-                    producto_id, 
-                    "disponible", 
-                    None, 
-                    f"Venta lote ID {lote_id}: -{peso_vendido} kg"
-                )
-            
-            return detalle_id
+            with conn.cursor() as cursor:
+                try:
+                    _descontar_lotes(cursor, {lote_id: (producto_id, peso_vendido)})
+
+                    # Insertar detalle de venta con lote
+                    cursor.execute("""
+                        INSERT INTO detalle_ventas (venta_id, producto_id, lote_id, cantidad, peso_vendido,
+                                                    precio_costo, precio_venta)
+                        SELECT %s, id, %s, %s, %s, precio_costo, precio_venta
+                        FROM productos WHERE id = %s
+                        RETURNING id
+                    """, (venta_id, lote_id, cantidad, peso_vendido, producto_id))
+                    detalle_id = cursor.fetchone()[0]
+
+                    # Actualizar stock total del producto
+                    cursor.execute("""
+                        UPDATE productos
+                        SET disponible = disponible - %s
+                        WHERE id = %s
+                        RETURNING disponible
+                    """, (peso_vendido, producto_id))
+                    disponible = cursor.fetchone()[0]
+
+                    # Registrar la modificación
+                    if usuario:
+                        registrar_modificacion(
+                            cursor,
+                            usuario,
+                            "VENTA_LOTE",
+                            producto_id,
+                            "disponible",
+                            None,
+                            f"Venta lote ID {lote_id}: -{peso_vendido} kg"
+                        )
+                    auditoria.confirmar(conn)
+                except Exception:
+                    conn.rollback()
+                    raise
+
+        catalog_index.fijar_stock(producto_id, disponible)
+        consultas_cache.invalidar('lotes')
+        return detalle_id
     except Exception as e:
         print(f"Error al registrar venta con lote: {str(e)}")
         return None
@@ -1506,7 +3204,8 @@ def obtener_info_lote(lote_id):
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT lp.id, lp.producto_id, lp.peso_lote, lp.fecha_creacion, 
-                       lp.disponible, lp.codigo_unico, p.nombre, p.codigo_barras
+                       lp.disponible, lp.codigo_unico, p.nombre, p.codigo_barras,
+                       lp.codigo_numerico
                 FROM lotes_productos lp
                 JOIN productos p ON p.id = lp.producto_id
                 WHERE lp.id = %s
@@ -1516,13 +3215,20 @@ def obtener_info_lote(lote_id):
         print(f"Error al obtener información del lote: {str(e)}")
         return None
 
+def _codigo_numerico_lote(codigo_unico):
+    """Número de 4 dígitos derivado del código único del lote (base 36 módulo 10000)."""
+    lote_num = 0
+    for char in codigo_unico:
+        lote_num = lote_num * 36 + (ord(char) - 48 if '0' <= char <= '9' else ord(char) - 87)
+    return lote_num % 10000
+
 def generar_codigo_barras_lote(producto_codigo, lote_codigo, peso=None):
     """
     Genera un código de barras único para un lote específico
     
     Args:
         producto_codigo: Código del producto base
-        lote_codigo: Código único del lote
+        lote_codigo: codigo_numerico del lote (o, para lotes viejos, su código único)
         peso: Peso del lote (opcional, para incluir en el código)
     
     Returns:
@@ -1541,10 +3247,10 @@ def generar_codigo_barras_lote(producto_codigo, lote_codigo, peso=None):
         producto_codigo = producto_codigo.zfill(6)[:6]
     
     # Convertir el código de lote a 4 dígitos
-    # Si es alfanumérico, convertir a un valor numérico
-    lote_num = 0
-    for char in lote_codigo:
-        lote_num = lote_num * 36 + (ord(char) - 48 if '0' <= char <= '9' else ord(char) - 87)
+    if isinstance(lote_codigo, int):
+        lote_num = lote_codigo
+    else:
+        lote_num = _codigo_numerico_lote(lote_codigo)
     lote_codigo_num = str(lote_num % 10000).zfill(4)
     
     # Formatear el peso (si se proporciona)
@@ -1582,102 +3288,101 @@ def obtener_lote_por_codigo_barras(codigo_barras):
     # Extraer componentes
     codigo_producto = codigo_barras[:6]
     codigo_lote_num = codigo_barras[6:10]
+    if not codigo_lote_num.isdigit():
+        return None
     
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            # Primero buscar el producto
+            # Una sola consulta por idx_productos_codigo_etiqueta e
+            # idx_lotes_codigo_numerico. lpad rellena con ceros a la izquierda
+            # y recorta a 6 caracteres, igual que zfill(6)[:6] en la etiqueta
             cursor.execute("""
-                SELECT id FROM productos 
-                WHERE codigo_barras = %s
-            """, (codigo_producto.lstrip('0'),))
+                SELECT lp.id, lp.producto_id, lp.peso_lote, lp.codigo_unico,
+                       p.nombre, p.precio_venta
+                FROM productos p
+                JOIN lotes_productos lp ON lp.producto_id = p.id
+                WHERE lpad(p.codigo_barras, 6, '0') = %s
+                  AND lp.codigo_numerico = %s AND lp.disponible
+                ORDER BY p.id
+                LIMIT 1
+            """, (codigo_producto, int(codigo_lote_num)))
             
-            producto_result = cursor.fetchone()
-            if not producto_result:
+            lote = cursor.fetchone()
+            if not lote:
                 return None
-                
-            producto_id = producto_result[0]
-            
-            # Buscar lotes que coincidan con el código numérico
-            cursor.execute("""
-                SELECT lp.id, lp.producto_id, lp.peso_lote, lp.codigo_unico, 
-                       p.nombre, p.codigo_barras, p.precio_venta
-                FROM lotes_productos lp
-                JOIN productos p ON p.id = lp.producto_id
-                WHERE lp.producto_id = %s AND lp.disponible = TRUE
-            """, (producto_id,))
             
-            lotes = cursor.fetchall()
-            
-            # Buscar el lote que coincida con el código numérico
-            for lote in lotes:
-                lote_id, _, peso_lote, codigo_unico, nombre, _, precio_venta = lote
-                
-                # Convertir el código único a su representación numérica
-                lote_num = 0
-                for char in codigo_unico:
-                    lote_num = lote_num * 36 + (ord(char) - 48 if '0' <= char <= '9' else ord(char) - 87)
-                lote_codigo_num = str(lote_num % 10000).zfill(4)
-                
-                if lote_codigo_num == codigo_lote_num:
-                    return {
-                        'lote_id': lote_id,
-                        'producto_id': producto_id,
-                        'nombre': nombre,
-                        'codigo_barras': codigo_producto,
-                        'peso': peso_lote,
-                        'precio_venta': precio_venta,
-                        'codigo_unico': codigo_unico
-                    }
-            
-            return None
+            lote_id, producto_id, peso_lote, codigo_unico, nombre, precio_venta = lote
+            return {
+                'lote_id': lote_id,
+                'producto_id': producto_id,
+                'nombre': nombre,
+                'codigo_barras': codigo_producto,
+                'peso': peso_lote,
+                'precio_venta': precio_venta,
+                'codigo_unico': codigo_unico
+            }
     except Exception as e:
         print(f"Error al buscar lote por código de barras: {str(e)}")
         return None
 
+def _asignar_lotes_fifo(cursor, producto_id, peso_necesario):
+    """
+    Reparte un peso entre los lotes disponibles del producto, del más antiguo al más nuevo.
+
+    Los lotes se toman de a uno en orden FIFO (índice idx_lotes_fifo) con
+    FOR UPDATE SKIP LOCKED, hasta cubrir el peso: el costo y los bloqueos
+    dependen de los lotes que se usan, no de cuántos lotes abiertos tenga el
+    producto. Los que otra terminal tiene bloqueados se saltean.
+
+    Returns:
+        Lista de (lote_id, peso_tomado) en orden FIFO, o None si los lotes
+        disponibles no alcanzan.
+    """
+    plan = []
+    restante = peso_necesario
+    while restante > 0.0005:
+        # Los lotes ya tomados siguen bloqueados por esta transacción, que
+        # SKIP LOCKED no saltea: se excluyen por id
+        cursor.execute('''
+            SELECT id, peso_lote FROM lotes_productos
+            WHERE producto_id = %s AND disponible AND id <> ALL(%s)
+            ORDER BY fecha_creacion, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ''', (producto_id, [lote_id for lote_id, _ in plan]))
+        fila = cursor.fetchone()
+        if fila is None:
+            return None
+        lote_id, peso_lote = fila
+        tomado = min(peso_lote, restante)
+        plan.append((lote_id, tomado))
+        restante -= tomado
+    return plan
+
 def seleccionar_lote_para_venta(producto_id, peso_necesario):
-    """Selecciona el lote más antiguo disponible para la venta"""
+    """
+    Toma el peso pedido de los lotes más antiguos del producto (FIFO).
+
+    Un pedido puede repartirse en varios lotes; los que se vacían quedan no
+    disponibles y el último conserva lo que le sobra.
+
+    Returns:
+        (plan, mensaje), donde plan es la lista de (lote_id, peso_tomado),
+        o (None, mensaje) si no hay peso suficiente.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
         try:
-            # Buscar lotes disponibles ordenados por fecha más antigua
-            cursor.execute('''
-                SELECT id, peso_lote 
-                FROM lotes_productos 
-                WHERE producto_id = %s AND disponible = TRUE
-                ORDER BY fecha_creacion
-                FOR UPDATE SKIP LOCKED
-            ''', (producto_id,))
-            
-            lotes = cursor.fetchall()
-            
-            if not lotes:
-                return None, "No hay lotes disponibles"
+            plan = _asignar_lotes_fifo(cursor, producto_id, peso_necesario)
+            if not plan:
+                conn.rollback()
+                return None, "Peso insuficiente en los lotes disponibles"
 
-            # Usar el lote más antiguo
-            lote_id, peso_disponible = lotes[0]
-            
-            if peso_disponible < peso_necesario:
-                return None, "Peso insuficiente en el lote seleccionado"
-                
-            # Actualizar el lote
-            nuevo_peso = peso_disponible - peso_necesario
-            if nuevo_peso <= 0:
-                cursor.execute('''
-                    UPDATE lotes_productos 
-                    SET disponible = FALSE 
-                    WHERE id = %s
-                ''', (lote_id,))
-            else:
-                cursor.execute('''
-                    UPDATE lotes_productos 
-                    SET peso_lote = %s 
-                    WHERE id = %s
-                ''', (nuevo_peso, lote_id))
-            
+            _descontar_lotes(cursor, {lote_id: (producto_id, peso) for lote_id, peso in plan})
             conn.commit()
-            return lote_id, "Lote actualizado correctamente"
+            consultas_cache.invalidar('lotes')
+            return plan, f"Peso tomado de {len(plan)} lote(s)"
             
         except Exception as e:
             conn.rollback()
@@ -1695,7 +3400,254 @@ def actualizar_peso_lote(lote_id, nuevo_peso):
         ''', (nuevo_peso, lote_id))
         producto_id = cursor.fetchone()[0]
         conn.commit()
-        return producto_id
+    consultas_cache.invalidar('lotes')
+    return producto_id
+
+# Conciliación del stock de productos por peso con sus lotes. Se toman en
+# cuenta los productos que tienen lotes; el stock esperado es la suma del
+# peso de los lotes disponibles.
+
+def crear_triggers_conciliacion():
+    """Instala los triggers que anotan en productos_pendientes_conciliacion qué productos cambiaron."""
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            # Triggers por sentencia con tablas de transición: una carga
+            # masiva de lotes hace un solo INSERT en la tabla de pendientes
+            cursor.execute('''
+                CREATE OR REPLACE FUNCTION marcar_stock_pendiente() RETURNS trigger AS $$
+                BEGIN
+                    -- Los ajustes de la propia conciliación no se vuelven a marcar
+                    IF current_setting('gestion.conciliando', true) = 'on' THEN
+                        RETURN NULL;
+                    END IF;
+
+                    IF TG_TABLE_NAME = 'productos' THEN
+                        INSERT INTO productos_pendientes_conciliacion (producto_id)
+                        SELECT n.id FROM filas_nuevas n
+                        JOIN filas_viejas v ON v.id = n.id
+                        WHERE n.venta_por_peso = 1 AND n.disponible IS DISTINCT FROM v.disponible
+                        ON CONFLICT DO NOTHING;
+                    ELSIF TG_OP = 'DELETE' THEN
+                        INSERT INTO productos_pendientes_conciliacion (producto_id)
+                        SELECT DISTINCT producto_id FROM filas_viejas
+                        ON CONFLICT DO NOTHING;
+                    ELSE
+                        INSERT INTO productos_pendientes_conciliacion (producto_id)
+                        SELECT DISTINCT producto_id FROM filas_nuevas
+                        ON CONFLICT DO NOTHING;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+
+            triggers = (
+                ('trg_conciliacion_lotes_alta', 'INSERT ON lotes_productos', 'NEW TABLE AS filas_nuevas'),
+                ('trg_conciliacion_lotes_cambio', 'UPDATE ON lotes_productos', 'NEW TABLE AS filas_nuevas'),
+                ('trg_conciliacion_lotes_baja', 'DELETE ON lotes_productos', 'OLD TABLE AS filas_viejas'),
+                ('trg_conciliacion_productos', 'UPDATE ON productos',
+                 'OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas'),
+            )
+            for nombre, evento, transicion in triggers:
+                tabla = evento.split(' ON ')[1]
+                cursor.execute(f'DROP TRIGGER IF EXISTS {nombre} ON {tabla}')
+                cursor.execute(f'''
+                    CREATE TRIGGER {nombre}
+                    AFTER {evento}
+                    REFERENCING {transicion}
+                    FOR EACH STATEMENT EXECUTE FUNCTION marcar_stock_pendiente()
+                ''')
+
+            conn.commit()
+
+def _sql_diferencias_stock_lotes(filtro=''):
+    return f'''
+        SELECT p.id, p.nombre, p.disponible,
+               COALESCE(SUM(lp.peso_lote) FILTER (WHERE lp.disponible), 0) AS en_lotes
+        FROM productos p
+        JOIN lotes_productos lp ON lp.producto_id = p.id
+        WHERE p.nombre NOT LIKE '[ELIMINADO]%%' {filtro}
+        GROUP BY p.id
+        HAVING abs(p.disponible - COALESCE(SUM(lp.peso_lote) FILTER (WHERE lp.disponible), 0)) > %(tolerancia)s
+        ORDER BY p.id
+    '''
+
+def conciliar_stock_lotes(reparar=False, incremental=False, tolerancia=0.001, usuario='conciliacion'):
+    """
+    Compara productos.disponible con la suma de sus lotes disponibles.
+
+    Args:
+        reparar: iguala el stock a la suma de los lotes en una sola sentencia
+                 y deja cada ajuste en modificaciones.
+        incremental: revisa solo los productos anotados por los triggers desde
+                     la última conciliación (al reparar, los saca de la lista).
+        tolerancia: diferencia en kg que se ignora.
+
+    Returns:
+        Lista de (producto_id, nombre, disponible, en_lotes) con las diferencias
+        encontradas (antes de reparar).
+    """
+    parametros = {'tolerancia': tolerancia}
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            try:
+                if incremental:
+                    # Al reparar, los pendientes se consumen; al solo informar, quedan
+                    if reparar:
+                        cursor.execute("DELETE FROM productos_pendientes_conciliacion RETURNING producto_id")
+                    else:
+                        cursor.execute("SELECT producto_id FROM productos_pendientes_conciliacion")
+                    parametros['ids'] = [fila[0] for fila in cursor.fetchall()]
+                    filtro = 'AND p.id = ANY(%(ids)s)'
+                else:
+                    filtro = ''
+                cursor.execute(_sql_diferencias_stock_lotes(filtro), parametros)
+                diferencias = cursor.fetchall()
+
+                if reparar and diferencias:
+                    # Lotes y después productos, el mismo orden de bloqueo que una venta;
+                    # con todo bloqueado se recalcula la suma con datos confirmados
+                    parametros['ids'] = [fila[0] for fila in diferencias]
+                    cursor.execute('''
+                        SELECT id FROM lotes_productos WHERE producto_id = ANY(%(ids)s)
+                        ORDER BY id FOR UPDATE
+                    ''', parametros)
+                    cursor.execute('''
+                        SELECT id FROM productos WHERE id = ANY(%(ids)s)
+                        ORDER BY id FOR UPDATE
+                    ''', parametros)
+                    cursor.execute("SET LOCAL gestion.conciliando = 'on'")
+                    cursor.execute(f'''
+                        UPDATE productos p
+                        SET disponible = d.en_lotes
+                        FROM ({_sql_diferencias_stock_lotes('AND p.id = ANY(%(ids)s)')}) d
+                        WHERE p.id = d.id
+                        RETURNING p.id, d.disponible, p.disponible
+                    ''', parametros)
+                    ajustados = cursor.fetchall()
+                    for producto_id, anterior, nuevo in ajustados:
+                        registrar_modificacion(cursor, usuario, 'AJUSTE_STOCK', producto_id, 'disponible',
+                                               str(anterior), str(nuevo))
+                    if not incremental:
+                        # Una conciliación completa deja todo revisado
+                        cursor.execute('DELETE FROM productos_pendientes_conciliacion')
+                    auditoria.confirmar(conn)
+                    for producto_id, _, nuevo in ajustados:
+                        catalog_index.fijar_stock(producto_id, nuevo)
+                    logger.info(f"Conciliación de stock: {len(ajustados)} productos ajustados a sus lotes")
+                else:
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error al conciliar stock con lotes: {e}")
+                raise
+    return diferencias
+
+
+# Esquema y mantenimiento. El DDL de crear_tablas, crear_indices y los
+# triggers se ejecuta solo cuando la versión registrada en esquema_version es
+# anterior a VERSION_ESQUEMA: subirla cada vez que cambie alguna de esas
+# funciones.
+VERSION_ESQUEMA = 3
+
+# Clave del advisory lock que serializa la actualización del esquema
+_BLOQUEO_ESQUEMA = 72410001
+
+def _version_esquema_instalada(cursor):
+    try:
+        cursor.execute('SELECT version FROM esquema_version WHERE id = 1')
+    except psycopg2.errors.UndefinedTable:
+        cursor.connection.rollback()
+        return None
+    fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+def preparar_esquema(forzar=False):
+    """
+    Deja el esquema en VERSION_ESQUEMA.
+
+    Si la base ya tiene esa versión (lo normal) cuesta una sola consulta; si
+    no, crea tablas, índices y triggers y registra la versión. Dos terminales
+    que arrancan a la vez no ejecutan el DDL en paralelo.
+
+    Returns:
+        True si se ejecutó el DDL, False si el esquema ya estaba al día.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            instalada = _version_esquema_instalada(cursor)
+        conn.commit()
+    if not forzar and instalada is not None and instalada >= VERSION_ESQUEMA:
+        if instalada > VERSION_ESQUEMA:
+            logger.warning(f"La base tiene el esquema {instalada}, más nuevo que el de esta versión "
+                           f"({VERSION_ESQUEMA}); no se modifica")
+        return False
+
+    with get_db_connection(expected_slow=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', (_BLOQUEO_ESQUEMA,))
+            try:
+                # Otra terminal pudo haberlo actualizado mientras esperábamos
+                instalada = _version_esquema_instalada(cursor)
+                conn.commit()
+                if not forzar and instalada is not None and instalada >= VERSION_ESQUEMA:
+                    return False
+
+                logger.info(f"Actualizando esquema de la versión {instalada} a la {VERSION_ESQUEMA}...")
+                inicio = time.perf_counter()
+                crear_tablas()
+                crear_indices()
+                crear_indices_busqueda()
+                crear_triggers_notificacion()
+                crear_triggers_conciliacion()
+                crear_usuario_admin_default()
+
+                cursor.execute('''
+                    INSERT INTO esquema_version (id, version) VALUES (1, %s)
+                    ON CONFLICT (id) DO UPDATE
+                    SET version = EXCLUDED.version, actualizado = CURRENT_TIMESTAMP
+                ''', (VERSION_ESQUEMA,))
+                conn.commit()
+                logger.info(f"Esquema actualizado en {time.perf_counter() - inicio:.2f}s")
+                return True
+            finally:
+                conn.rollback()
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (_BLOQUEO_ESQUEMA,))
+                conn.commit()
+
+def reclamar_mantenimiento(tarea, intervalo):
+    """
+    Reserva una tarea de mantenimiento si su última ejecución (en cualquier
+    terminal) fue hace más de intervalo (timedelta).
+
+    Returns:
+        True si esta terminal debe ejecutarla.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # Una sola sentencia: de dos terminales que compiten, solo una obtiene la fila
+            cursor.execute('''
+                INSERT INTO mantenimiento_ejecuciones (tarea, ultima_ejecucion)
+                VALUES (%(tarea)s, CURRENT_TIMESTAMP)
+                ON CONFLICT (tarea) DO UPDATE
+                SET ultima_ejecucion = CURRENT_TIMESTAMP, duracion = NULL, resultado = NULL
+                WHERE mantenimiento_ejecuciones.ultima_ejecucion < CURRENT_TIMESTAMP - %(intervalo)s
+                RETURNING tarea
+            ''', {'tarea': tarea, 'intervalo': intervalo})
+            reclamada = cursor.fetchone() is not None
+            conn.commit()
+    return reclamada
+
+def registrar_mantenimiento(tarea, duracion, resultado):
+    """Guarda la duración (segundos) y el resultado de una tarea de mantenimiento."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE mantenimiento_ejecuciones SET duracion = %s, resultado = %s
+                WHERE tarea = %s
+            ''', (duracion, resultado, tarea))
+            conn.commit()
+
 
 def agregar_stock_manual_db(producto_id: int, cantidad: float, usuario: str, comentario: str = None):
     """Agrega stock manualmente y registra la modificación"""
@@ -1733,7 +3685,8 @@ def agregar_stock_manual_db(producto_id: int, cantidad: float, usuario: str, com
                 valor_nuevo=descripcion
             )
             
-            conn.commit()
+            auditoria.confirmar(conn)
+            catalog_index.ajustar_stock(producto_id, cantidad)
             return True
             
         except Exception as e:
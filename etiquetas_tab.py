@@ -4,6 +4,9 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt6.QtCore import Qt, QBuffer, QStringListModel
 from PyQt6.QtGui import QPixmap, QImage
 from db_postgres import buscar_producto, buscar_coincidencias_producto
+from product_search import ProductSearchIndex
+from catalog_index import formato_busqueda
+from precarga import precarga
 from logica_codigo import generar_codigo_variable_ean13, generar_csv_etiqueta, imprimir_etiqueta, imprimir_pdf_directo
 import os
 import sys
@@ -20,7 +23,9 @@ class EtiquetasTab(QWidget):
         super().__init__()
         self.setObjectName("etiquetas")
         self.init_ui()
-        self.cargar_productos()
+        self.productos = []
+        self.productos_por_texto = {}
+        precarga.al_estar('catalogo', self.mostrar_catalogo, al_fallar=lambda _: self.cargar_productos())
         
     def init_ui(self):
         # Layout principal
@@ -41,10 +46,13 @@ class EtiquetasTab(QWidget):
         self.busqueda_producto.returnPressed.connect(self.buscar_producto_enter)
         form_layout.addRow("Buscar:", self.busqueda_producto)
         
-        # Configurar el autocompletado
-        self.completer = QCompleter([])
+        # Configurar el autocompletado: el índice de búsqueda filtra y ordena,
+        # el completer solo muestra las sugerencias
+        self.buscador = ProductSearchIndex()
+        self.modelo_sugerencias = QStringListModel()
+        self.completer = QCompleter(self.modelo_sugerencias)
         self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        self.completer.setFilterMode(Qt.MatchFlag.MatchContains)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
         self.busqueda_producto.setCompleter(self.completer)
         self.completer.activated.connect(self.seleccionar_producto_completer)
         
@@ -153,120 +161,55 @@ class EtiquetasTab(QWidget):
     
     def cargar_productos(self):
         """Carga los productos desde la base de datos para el autocompletado"""
-        self.productos = buscar_producto()
-        self.nombres_productos = []
-        
-        for producto in self.productos:
-            if producto[3] == 1:
-                codigo = producto[1] or ""
-                nombre = producto[2]
-                self.nombres_productos.append(f"{codigo} - {nombre}")
-        
-        # Actualizar el modelo del completer
-        model = QStringListModel()
-        model.setStringList(self.nombres_productos)
-        self.completer.setModel(model)
+        self.mostrar_productos(buscar_producto())
+
+    def mostrar_catalogo(self, productos):
+        self.mostrar_productos([formato_busqueda(producto) for producto in productos])
+
+    def mostrar_productos(self, productos):
+        self.productos = productos
+        self.buscador.cargar(self.productos)
+        self.productos_por_texto = {self._texto_sugerencia(p).lower(): p for p in self.productos}
+        self.modelo_sugerencias.setStringList([])
+    
+    @staticmethod
+    def _texto_sugerencia(producto):
+        return f"{producto[1] or ''} - {producto[2]}"
     
     def actualizar_sugerencias(self, texto):
         """Actualiza las sugerencias del autocompletado según el texto ingresado"""
         if len(texto) >= 2:  # Solo buscar si hay al menos 2 caracteres
-            sugerencias = []
-            for producto in self.productos:
-                if producto[3] == 1:
-                    codigo = producto[1] or ""
-                    nombre = producto[2]
-                    texto_producto = f"{codigo} - {nombre}"
-                    if texto.lower() in texto_producto.lower():
-                        sugerencias.append(texto_producto)
-            
-            # Actualizar el modelo del completer
-            model = QStringListModel()
-            model.setStringList(sugerencias)
-            self.completer.setModel(model)
+            # Solo se sugieren productos que se venden por peso
+            resultados = self.buscador.buscar(texto, limite=20, filtro=lambda p: p[3] == 1)
+            self.modelo_sugerencias.setStringList([self._texto_sugerencia(p) for p in resultados])
             self.completer.complete()
 
     def buscar_producto_enter(self):
         """Busca y selecciona el producto cuando se presiona Enter en el campo de búsqueda"""
-        texto = self.busqueda_producto.text().lower().strip()
+        texto = self.busqueda_producto.text().strip()
         
         if not texto:
             return
         
-        # Imprimir para depuración
-        print(f"Buscando producto con texto: '{texto}'")
-        
-        # Buscar coincidencias exactas primero
-        for producto in self.productos:
-            codigo = producto[1] or ""
-            nombre = producto[2].lower()
-            texto_producto = f"{codigo} - {nombre}".lower()
-            
-            # Verificar coincidencia exacta con código, nombre o texto completo
-            if (texto == codigo.lower() or 
-                texto == nombre or 
-                texto == texto_producto or
-                texto in texto_producto):
-                
-                print(f"Coincidencia encontrada: {producto[2]}")
-                self.cargar_datos_producto(producto)
-                return
-        
-        # Si no hay coincidencia exacta, buscar coincidencias parciales
-        mejores_coincidencias = []
-        
-        for producto in self.productos:
-            codigo = producto[1] or ""
-            nombre = producto[2].lower()
-            texto_producto = f"{codigo} - {nombre}".lower()
-            
-            # Verificar si el texto está contenido en el código, nombre o texto completo
-            if (texto in codigo.lower() or 
-                texto in nombre or 
-                texto in texto_producto):
-                
-                # Calcular un puntaje de coincidencia (menor es mejor)
-                if nombre.startswith(texto):
-                    puntaje = 0  # Prioridad máxima si comienza con el texto
-                elif codigo.lower() == texto:
-                    puntaje = 1  # Alta prioridad si coincide con el código
-                else:
-                    # Buscar la posición de la coincidencia
-                    pos_nombre = nombre.find(texto)
-                    pos_codigo = codigo.lower().find(texto)
-                    pos_texto = texto_producto.find(texto)
-                    
-                    # Tomar la mejor posición (la más cercana al inicio)
-                    puntaje = min(
-                        pos_nombre if pos_nombre != -1 else 999,
-                        pos_codigo if pos_codigo != -1 else 999,
-                        pos_texto if pos_texto != -1 else 999
-                    )
-                
-                mejores_coincidencias.append((puntaje, producto))
-        
-        # Ordenar por puntaje (las mejores coincidencias primero)
-        mejores_coincidencias.sort(key=lambda x: x[0])
+        # El texto puede ser una sugerencia completa ("código - nombre")
+        producto = self.productos_por_texto.get(texto.lower())
+        if producto is not None:
+            self.cargar_datos_producto(producto)
+            return
         
-        # Seleccionar la mejor coincidencia si existe
-        if mejores_coincidencias:
-            mejor_producto = mejores_coincidencias[0][1]
-            print(f"Mejor coincidencia: {mejor_producto[2]} (puntaje: {mejores_coincidencias[0][0]})")
-            self.cargar_datos_producto(mejor_producto)
+        # Si no, la mejor coincidencia según el índice de búsqueda
+        resultados = self.buscador.buscar(texto, limite=1)
+        if resultados:
+            self.cargar_datos_producto(resultados[0])
         else:
-            print("No se encontraron coincidencias")
             QMessageBox.information(self, "Búsqueda", 
                                 f"No se encontró ningún producto que coincida con '{texto}'")
 
     def seleccionar_producto_completer(self, texto_seleccionado):
         """Carga los datos del producto seleccionado desde el autocompletado"""
-        for producto in self.productos:
-            codigo = producto[1] or ""
-            nombre = producto[2]
-            texto_producto = f"{codigo} - {nombre}"
-            
-            if texto_producto == texto_seleccionado:
-                self.cargar_datos_producto(producto)
-                break
+        producto = self.productos_por_texto.get(texto_seleccionado.lower())
+        if producto is not None:
+            self.cargar_datos_producto(producto)
     
     def cargar_datos_producto(self, producto):
         """Carga los datos del producto en los campos del formulario"""
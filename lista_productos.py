@@ -0,0 +1,24 @@
+import sys
+from db_postgres import importar_productos, exportar_productos
+
+# Uso:
+#   python lista_productos.py simular archivo.csv            -> muestra qué cambiaría
+#   python lista_productos.py importar archivo.xlsx [usuario] -> aplica la lista
+#   python lista_productos.py exportar archivo.csv            -> exporta el catálogo
+# Se aceptan .csv (separado por coma o punto y coma) y .xlsx.
+if len(sys.argv) < 3:
+    sys.exit("Uso: python lista_productos.py simular|importar|exportar archivo [usuario]")
+comando, ruta = sys.argv[1], sys.argv[2]
+usuario = sys.argv[3] if len(sys.argv) > 3 else 'importacion'
+
+if comando == 'exportar':
+    print(f"{exportar_productos(ruta)} productos exportados a {ruta}")
+else:
+    resumen = importar_productos(ruta, usuario, simular=(comando != 'importar'))
+    for cambio in resumen['vista_previa']:
+        nuevo = cambio['nuevo']
+        print(f"{cambio['estado']:<11} {cambio['linea']:>6} {cambio['codigo_barras'] or '':<15} "
+              f"{nuevo['nombre'] or '':<30} {nuevo['precio_venta'] or '':>10} {cambio['motivo'] or ''}")
+    print(f"{resumen['filas']} filas: {resumen['nuevos']} nuevos, {resumen['modificados']} modificados, "
+          f"{resumen['sin_cambios']} sin cambios, {resumen['invalidos']} inválidos, "
+          f"{resumen['duplicados']} repetidos" + (" (simulación)" if resumen['simulacion'] else ""))
@@ -1,9 +1,10 @@
 # login_window.py
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLabel, QLineEdit, 
                            QPushButton, QMessageBox, QWidget)
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPixmap, QMovie
 from db_postgres import verificar_credenciales
+from db_executor import db_executor
 from PyQt6.QtCore import pyqtSignal
 import sys
 import os
@@ -180,11 +181,14 @@ class LoginWindow(QDialog):
         self.spinner_label.show()
         self.boton_login.setEnabled(False)  # Deshabilitar el botón de login
         
-        # Usar un QTimer para simular un retraso (o procesar el login en segundo plano)
-        QTimer.singleShot(1000, lambda: self.procesar_login(usuario, password))  # Simula un retraso de 1 segundo
+        # Verificar en segundo plano para que el spinner siga animado
+        db_executor.ejecutar(
+            verificar_credenciales, usuario, password,
+            al_terminar=lambda resultado: self.procesar_login(usuario, resultado),
+            al_fallar=self.error_login)
         
-    def procesar_login(self, usuario, password):
-        exito, rol = verificar_credenciales(usuario, password)
+    def procesar_login(self, usuario, resultado):
+        exito, rol = resultado
         
         if exito:
             self.rol_usuario = rol
@@ -202,6 +206,12 @@ class LoginWindow(QDialog):
             self.input_password.clear()
             self.input_password.setFocus()
                         
+    def error_login(self, error):
+        self.spinner_movie.stop()
+        self.spinner_label.hide()
+        self.boton_login.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"No se pudo conectar con la base de datos: {error}")
+
     def clear_inputs(self):
         """Clear login form inputs and reset UI state"""
         self.input_usuario.clear()
@@ -1,5 +1,9 @@
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
 import sys
 import uuid
+import importlib
 import os
 import platform
 import subprocess
@@ -8,15 +12,54 @@ from PyQt6.QtWidgets import QApplication, QMainWindow, QMessageBox, QTabWidget,
 from PyQt6.QtCore import QFile, QTextStream, Qt, QTimer
 from PyQt6.QtGui import QPixmap, QIcon
 from backup import create_backup_if_needed
-from productos_tab import ProductosTab
-from usuarios_tab import UsuariosTab
-from ventas_tab import VentasTab
-from caja_tab import CajaTab
-from etiquetas_tab import EtiquetasTab 
 from config_postgres import get_db_config
-from db_postgres import crear_tablas, crear_indices, logger, optimizar_base_datos, crear_usuario_admin_default, registrar_desconexion, connection_pool  # Asegurarnos de que las tablas estén creadas
+from db_postgres import preparar_esquema, logger, registrar_desconexion, pool_manager, cerrar_auditoria
 from login_window import LoginWindow
-from modificaciones_tab import ModificacionesTab
+from change_feed import iniciar_listener, detener_listener
+from mantenimiento import iniciar_mantenimiento, detener_mantenimiento
+from db_executor import db_executor
+from precarga import precarga
+
+# Módulo y clase de cada pestaña. Se importan la primera vez que se muestra
+# la pestaña: reportlab, PIL, barcode y win32print no hacen falta para el login
+PESTANAS = {
+    'Productos': ('productos_tab', 'ProductosTab'),
+    'Ventas': ('ventas_tab', 'VentasTab'),
+    'Caja': ('caja_tab', 'CajaTab'),
+    'Etiquetas': ('etiquetas_tab', 'EtiquetasTab'),
+    'Usuarios': ('usuarios_tab', 'UsuariosTab'),
+    'Modificaciones': ('modificaciones_tab', 'ModificacionesTab'),
+}
+
+# Pestañas de cada rol, en orden
+PESTANAS_POR_ROL = {
+    'administrador': ('Productos', 'Ventas', 'Caja', 'Etiquetas', 'Usuarios', 'Modificaciones'),
+    'empleado': ('Productos', 'Ventas', 'Etiquetas'),
+}
+# Pestañas cuyo constructor recibe el usuario actual
+PESTANAS_CON_USUARIO = {'Productos', 'Usuarios'}
+
+
+class TiemposArranque:
+    """Duración de cada etapa del arranque, para dejarla en el log."""
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self._ultimo = inicio
+        self.etapas = []
+
+    def marcar(self, etapa):
+        ahora = time.perf_counter()
+        self.etapas.append((etapa, ahora - self._ultimo))
+        self._ultimo = ahora
+
+    def resumen(self):
+        detalle = ", ".join(f"{etapa} {segundos * 1000:.0f} ms" for etapa, segundos in self.etapas)
+        return f"Arranque: {(self._ultimo - self.inicio) * 1000:.0f} ms ({detalle})"
+
+
+tiempos_arranque = TiemposArranque(INICIO_ARRANQUE)
+tiempos_arranque.marcar("importaciones")
 
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -28,6 +71,33 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
+class PestanaDiferida(QWidget):
+    """
+    Lugar de una pestaña en el QTabWidget. El módulo se importa y la pestaña
+    se crea recién la primera vez que se muestra.
+    """
+
+    def __init__(self, titulo, *args):
+        super().__init__()
+        self.titulo = titulo
+        self.args = args
+        self.contenido = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def crear(self):
+        if self.contenido is not None:
+            return
+        inicio = time.perf_counter()
+        modulo, clase = PESTANAS[self.titulo]
+        modulo = importlib.import_module(modulo)
+        importado = time.perf_counter()
+        self.contenido = getattr(modulo, clase)(*self.args)
+        self.layout().addWidget(self.contenido)
+        logger.info(f"Pestaña {self.titulo}: importación {(importado - inicio) * 1000:.0f} ms, "
+                    f"creación {(time.perf_counter() - importado) * 1000:.0f} ms")
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -69,6 +139,12 @@ class MainWindow(QMainWindow):
             }
         """)
         # No agregar pestañas aquí, lo haremos después del login
+        self.tabs.currentChanged.connect(self._mostrar_pestana)
+
+    def _mostrar_pestana(self, indice):
+        pestana = self.tabs.widget(indice)
+        if isinstance(pestana, PestanaDiferida):
+            pestana.crear()
 
     def setup_barra_usuario(self):
         if self.barra_superior is not None:
@@ -171,7 +247,9 @@ class MainWindow(QMainWindow):
         
         # Limpiar y eliminar las pestañas actuales
         while self.tabs.count() > 0:
+            pestana = self.tabs.widget(0)
             self.tabs.removeTab(0)
+            pestana.deleteLater()
         
          # Clear the user bar
         if self.barra_superior is not None:
@@ -183,9 +261,14 @@ class MainWindow(QMainWindow):
         self.stacked_widget.setCurrentIndex(0)
             
     def closeEvent(self, event):
-        registrar_desconexion(self.nombre_usuario)
-        if 'connection_pool' in globals():
-            connection_pool.closeall()
+        if self.nombre_usuario is not None:
+            registrar_desconexion(self.nombre_usuario)
+        detener_listener()
+        detener_mantenimiento()
+        db_executor.cerrar()
+        # La cola de auditoría se vuelca con el pool todavía abierto
+        cerrar_auditoria()
+        pool_manager.cerrar()
         event.accept()
 
 
@@ -211,44 +294,25 @@ class MainWindow(QMainWindow):
     def mostrar_pantalla_principal(self, nombre_usuario, rol_usuario):
         self.nombre_usuario = nombre_usuario
         self.rol_usuario = rol_usuario
+        pestanas = PESTANAS_POR_ROL.get(rol_usuario, ())
+
+        # Los datos que piden las pestañas se empiezan a traer ya, en paralelo
+        precarga.iniciar(['catalogo', 'clientes'] + (['usuarios'] if 'Usuarios' in pestanas else []))
 
         # Keep the spinner visible during the entire loading process
         self.login_window.spinner_label.show()
         self.login_window.spinner_movie.start()
         self.login_window.boton_login.setEnabled(False)
         
-        # Create tabs in chunks to keep UI responsive
-        QTimer.singleShot(100, self._setup_pantalla_principal_parte1)
+        QTimer.singleShot(0, self._setup_pantalla_principal)
 
-    def _setup_pantalla_principal_parte1(self):
-        self.login_window.spinner_movie.start()
-        # First part: Create basic structure
-        if self.rol_usuario == 'administrador':
-            self.tabs.addTab(ProductosTab(self.nombre_usuario), "Productos")
-            QTimer.singleShot(100, self._setup_pantalla_principal_parte2)
-        elif self.rol_usuario == 'empleado':
-            self.tabs.addTab(ProductosTab(self.nombre_usuario), "Productos")
-            QTimer.singleShot(100, self._setup_pantalla_principal_parte2)
-
-    def _setup_pantalla_principal_parte2(self):
-        self.login_window.spinner_movie.start()
-        # Second part: Add more tabs
-        if self.rol_usuario == 'administrador':
-            self.tabs.addTab(VentasTab(), "Ventas")
-            self.tabs.addTab(CajaTab(), "Caja")
-            self.tabs.addTab(EtiquetasTab(), "Etiquetas")  # Agregar la pestaña de etiquetas
-            QTimer.singleShot(100, self._setup_pantalla_principal_parte3)
-        elif self.rol_usuario == 'empleado':
-            self.tabs.addTab(VentasTab(), "Ventas")
-            self.tabs.addTab(EtiquetasTab(), "Etiquetas")
-            QTimer.singleShot(100, self._finalizar_setup)
-
-    def _setup_pantalla_principal_parte3(self):
-        self.login_window.spinner_movie.start()
-        # Third part: Add remaining tabs for admin
-        self.tabs.addTab(UsuariosTab(self.nombre_usuario), "Usuarios")
-        self.tabs.addTab(ModificacionesTab(), "Modificaciones")
-        QTimer.singleShot(100, self._finalizar_setup)
+    def _setup_pantalla_principal(self):
+        # Solo se crea la pestaña visible; el resto, al elegirla
+        for titulo in PESTANAS_POR_ROL.get(self.rol_usuario, ()):
+            args = (self.nombre_usuario,) if titulo in PESTANAS_CON_USUARIO else ()
+            self.tabs.addTab(PestanaDiferida(titulo, *args), titulo)
+        self._mostrar_pestana(self.tabs.currentIndex())
+        self._finalizar_setup()
 
     def _finalizar_setup(self):
         # Final setup==
@@ -267,6 +331,7 @@ class MainWindow(QMainWindow):
 def realizar_tareas_cierre():
     """Función para realizar tareas antes de cerrar la aplicación"""
     try:
+        cerrar_auditoria()  # Escribir las modificaciones que queden en cola
         create_backup_if_needed()  # Crear backup si es necesario
     except Exception as e:
         print(f"Error al realizar tareas de cierre: {e}")
@@ -344,31 +409,50 @@ def verificar_licencia():
                             "ID de Hardware: " + hardware_id_actual[:16] + "...")
         sys.exit(1)  # Salir si la licencia no es válida
 
-def initialize_database():
-    """Initialize database with tables and indexes"""
-    logger.info("Iniciando creación de tablas...")
-    crear_tablas()
-    logger.info("Tablas creadas correctamente")
-    
-    logger.info("Creando índices...")
-    crear_indices()
-    logger.info("Índices creados correctamente")
-    
-    # Optimizar base de datos en segundo plano para no bloquear la UI
-    QTimer.singleShot(1000, optimizar_base_datos)
-    
-    logger.info("Base de datos inicializada")
+def initialize_database(login_window):
+    """
+    Verifica el esquema en segundo plano con la ventana de login ya visible.
+
+    El pool se abre con esta primera consulta; el botón de login queda
+    deshabilitado hasta que la base está lista.
+    """
+    login_window.boton_login.setEnabled(False)
+    login_window.spinner_label.show()
+    login_window.spinner_movie.start()
+
+    def base_lista(ddl_ejecutado):
+        tiempos_arranque.marcar("esquema (DDL)" if ddl_ejecutado else "esquema")
+        logger.info(tiempos_arranque.resumen())
+        login_window.spinner_movie.stop()
+        login_window.spinner_label.hide()
+        login_window.boton_login.setEnabled(True)
+        # Mantener coherentes las cachés con los cambios de otras terminales
+        iniciar_listener()
+        # VACUUM y conciliación de stock fuera del horario de atención
+        iniciar_mantenimiento()
+
+    def error_base(error):
+        logger.error(f"No se pudo preparar la base de datos: {error}")
+        login_window.spinner_movie.stop()
+        login_window.spinner_label.hide()
+        login_window.boton_login.setEnabled(True)
+        QMessageBox.warning(login_window, "Base de datos",
+                            f"No se pudo conectar con la base de datos:\n{error}")
+
+    db_executor.ejecutar(preparar_esquema, al_terminar=base_lista, al_fallar=error_base)
 
     
 if __name__ == "__main__":
     app = QApplication(sys.argv)  # Crear la instancia de QApplication primero
+    tiempos_arranque.marcar("QApplication")
     verificar_licencia()  # Verificar la licencia después de crear QApplication
-    initialize_database()
-    crear_usuario_admin_default()  # Crear el usuario admin por defecto si no existe
+    tiempos_arranque.marcar("licencia")
     
     main_window = MainWindow()  # Crear la ventana principal
     main_window.app = app
     main_window.cargar_estilos()
     app.aboutToQuit.connect(realizar_tareas_cierre)
     main_window.showMaximized()
+    tiempos_arranque.marcar("ventana de login")
+    initialize_database(main_window.login_window)
     sys.exit(app.exec())
@@ -0,0 +1,117 @@
+# mantenimiento.py
+# Uso: python mantenimiento.py   (ejecuta ya las tareas vencidas, sin mirar la franja horaria)
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config_postgres import MANTENIMIENTO_FRANJA
+import db_postgres
+
+logger = logging.getLogger('mantenimiento')
+
+
+def _conciliar_stock():
+    # Solo informa: el stock puede diferir de los lotes con razón (ventas de
+    # etiqueta sin lote, stock agregado a mano). Reparar queda a cargo de un
+    # operador (python conciliar_stock.py reparar). Tampoco se usa el modo
+    # incremental, que vaciaría la lista de pendientes.
+    diferencias = db_postgres.conciliar_stock_lotes()
+    if diferencias:
+        logger.warning(f"Stock distinto de la suma de lotes en {len(diferencias)} productos "
+                       f"(ver python conciliar_stock.py)")
+    return f"{len(diferencias)} diferencias encontradas"
+
+def _optimizar():
+    db_postgres.optimizar_base_datos()
+    return "VACUUM y ANALYZE"
+
+# (nombre, función, cada cuánto se ejecuta como máximo entre todas las terminales)
+TAREAS = (
+    ('conciliar_stock_lotes', _conciliar_stock, timedelta(hours=6)),
+    ('optimizar_base_datos', _optimizar, timedelta(days=1)),
+)
+
+
+def en_franja(ahora=None, franja=MANTENIMIENTO_FRANJA):
+    """Indica si la hora actual cae en la franja de mantenimiento."""
+    hora = (ahora or datetime.now()).hour
+    inicio, fin = franja
+    if inicio <= fin:
+        return inicio <= hora < fin
+    return hora >= inicio or hora < fin
+
+def ejecutar_tareas_vencidas(tareas=TAREAS):
+    """
+    Ejecuta las tareas cuyo intervalo venció. La reserva se hace en la base,
+    así cada tarea corre en una sola terminal aunque haya varias abiertas.
+
+    Returns:
+        Lista de (tarea, segundos, resultado) de las tareas ejecutadas.
+    """
+    ejecutadas = []
+    for nombre, funcion, intervalo in tareas:
+        try:
+            if not db_postgres.reclamar_mantenimiento(nombre, intervalo):
+                continue
+        except Exception as e:
+            logger.error(f"No se pudo reservar la tarea {nombre}: {e}")
+            continue
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion()
+        except Exception as e:
+            resultado = f"ERROR: {e}"
+            logger.error(f"Error en la tarea de mantenimiento {nombre}: {e}")
+        duracion = time.perf_counter() - inicio
+        logger.info(f"Mantenimiento {nombre}: {resultado} ({duracion:.1f}s)")
+        try:
+            db_postgres.registrar_mantenimiento(nombre, duracion, resultado)
+        except Exception as e:
+            logger.error(f"No se pudo registrar la tarea {nombre}: {e}")
+        ejecutadas.append((nombre, duracion, resultado))
+    return ejecutadas
+
+
+class ProgramadorMantenimiento(threading.Thread):
+    """
+    Hilo que cada cierto tiempo revisa si está en la franja de mantenimiento
+    y, en ese caso, ejecuta las tareas vencidas. Fuera de la franja no toca
+    la base.
+    """
+
+    def __init__(self, revision=600):
+        super().__init__(daemon=True, name="DB-Mantenimiento")
+        self.revision = revision
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.revision):
+            if en_franja():
+                ejecutar_tareas_vencidas()
+
+    def detener(self):
+        self._detener.set()
+
+
+_programador = None
+
+def iniciar_mantenimiento():
+    """Inicia (una sola vez por proceso) el hilo de mantenimiento."""
+    global _programador
+    if _programador is None or not _programador.is_alive():
+        _programador = ProgramadorMantenimiento()
+        _programador.start()
+    return _programador
+
+def detener_mantenimiento():
+    if _programador is not None:
+        _programador.detener()
+
+
+if __name__ == "__main__":
+    ejecutadas = ejecutar_tareas_vencidas()
+    if not ejecutadas:
+        print("No hay tareas vencidas")
+    for nombre, duracion, resultado in ejecutadas:
+        print(f"{nombre}: {resultado} ({duracion:.1f}s)")
@@ -0,0 +1,12 @@
+from db_postgres import migrar_fechas_a_timestamp, verificar_indice_fecha_ventas
+from datetime import date
+
+# Convierte ventas/deudas/pagos.fecha de TEXT a TIMESTAMP (por lotes)
+migrar_fechas_a_timestamp()
+
+# Confirma que el filtro por fecha del reporte de Caja usa idx_ventas_fecha
+usa_indice, plan = verificar_indice_fecha_ventas(date.today().isoformat())
+print(f"Filtro por fecha usa idx_ventas_fecha: {'sí' if usa_indice else 'NO'}")
+if not usa_indice:
+    # Con pocas ventas en el día el planificador puede preferir un seq scan
+    print(plan)
@@ -3,7 +3,10 @@ from db_postgres import obtener_modificaciones
 from signals import signals 
 from datetime import datetime
 import pytz
-from PyQt6.QtCore import QTimer
+from db_executor import db_executor
+
+# Filas por página; las siguientes se piden al llegar al final de la tabla
+TAMANO_PAGINA = 200
 
 class ModificacionesTab(QWidget):
     def __init__(self):
@@ -25,6 +28,7 @@ class ModificacionesTab(QWidget):
         self.tabla.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.tabla.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.tabla.itemSelectionChanged.connect(self.mostrar_detalle)
+        self.tabla.verticalScrollBar().valueChanged.connect(self.al_desplazar)
 
         # Crear un layout horizontal para el botón
         btn_layout = QHBoxLayout()
@@ -44,7 +48,7 @@ class ModificacionesTab(QWidget):
         self.setLayout(layout)
         
         self.cargar_modificaciones()
-        signals.producto_actualizado.connect(self.cargar_modificaciones)
+        signals.producto_actualizado.connect(self.cargar_nuevas)
         
     def formatear_nombre_campo(self, campo):
         mapeo_campos = {
@@ -59,60 +63,125 @@ class ModificacionesTab(QWidget):
         return mapeo_campos.get(campo, campo)
         
     def cargar_modificaciones(self):
-        modificaciones = obtener_modificaciones()
-        self.tabla.setRowCount(len(modificaciones))
-        
-        argentina_tz = pytz.timezone('America/Argentina/Buenos_Aires')
-        utc_tz = pytz.utc
+        """Recarga desde la primera página (botón Actualizar)."""
+        self.cursor_pagina = None
+        self.ultimo_id = None
+        self.hay_mas = True
+        self.cargando_pagina = True
+        db_executor.ejecutar(
+            obtener_modificaciones, limite=TAMANO_PAGINA,
+            al_terminar=self.mostrar_modificaciones,
+            al_fallar=self.error_carga,
+            clave=("modificaciones", id(self)))
 
-        for i, mod in enumerate(modificaciones):
-            # Usuario
-            self.tabla.setItem(i, 0, QTableWidgetItem(mod['usuario']))
-            
-            # Fecha/Hora
-            try:
-                fecha_hora = mod['fecha_hora']
-                if fecha_hora:
-                    if isinstance(fecha_hora, str):
-                        fecha_hora = datetime.strptime(fecha_hora, "%Y-%m-%d %H:%M:%S%z")
-                    if fecha_hora.tzinfo is None:
-                        fecha_hora = pytz.utc.localize(fecha_hora)
-                    fecha_local = fecha_hora.astimezone(argentina_tz)
-                    fecha_formateada = fecha_local.strftime("%d/%m/%Y %H:%M")
-                    self.tabla.setItem(i, 1, QTableWidgetItem(fecha_formateada))
-                else:
-                    self.tabla.setItem(i, 1, QTableWidgetItem(""))
-            except Exception as e:
-                print(f"Error al convertir fecha: {e}")
-                self.tabla.setItem(i, 1, QTableWidgetItem(str(mod['fecha_hora'])))
-
-            # Tipo
-            self.tabla.setItem(i, 2, QTableWidgetItem(mod['tipo_modificacion']))
-            
-            # Producto
-            self.tabla.setItem(i, 3, QTableWidgetItem(mod['producto_nombre']))
-            
-            # Campo (con formato)
-            campo_formateado = self.formatear_nombre_campo(mod['campo_modificado']) if mod['campo_modificado'] else ''
-            self.tabla.setItem(i, 4, QTableWidgetItem(campo_formateado))
-            
-            # Valor anterior
-            self.tabla.setItem(i, 5, QTableWidgetItem(str(mod['valor_anterior'] or '')))
-            
-            # Valor nuevo
-            self.tabla.setItem(i, 6, QTableWidgetItem(str(mod['valor_nuevo'] or '')))
-            
-        self.btn_actualizar.setEnabled(True)  # Deshabilitar el botón de actualización
+    def mostrar_modificaciones(self, modificaciones):
+        self.tabla.setRowCount(0)
+        self.agregar_pagina(modificaciones)
+        self.btn_actualizar.setEnabled(True)
         signals.actualizar_modificaciones.emit()
 
+    def cargar_siguiente_pagina(self):
+        if self.cargando_pagina or not self.hay_mas or self.cursor_pagina is None:
+            return
+        self.cargando_pagina = True
+        db_executor.ejecutar(
+            obtener_modificaciones, limite=TAMANO_PAGINA, antes_de=self.cursor_pagina,
+            al_terminar=self.agregar_pagina,
+            al_fallar=self.error_carga,
+            clave=("modificaciones", id(self)))
+
+    def agregar_pagina(self, modificaciones):
+        """Agrega al final una página de modificaciones más viejas."""
+        self.cargando_pagina = False
+        self.hay_mas = len(modificaciones) == TAMANO_PAGINA
+        if not modificaciones:
+            return
+        self.cursor_pagina = (modificaciones[-1]['fecha_hora'], modificaciones[-1]['id'])
+        self.ultimo_id = max(self.ultimo_id or 0, max(mod['id'] for mod in modificaciones))
+
+        fila = self.tabla.rowCount()
+        self.tabla.setRowCount(fila + len(modificaciones))
+        for i, mod in enumerate(modificaciones, start=fila):
+            self.llenar_fila(i, mod)
+
+    def al_desplazar(self, valor):
+        barra = self.tabla.verticalScrollBar()
+        if valor >= barra.maximum() - barra.pageStep():
+            self.cargar_siguiente_pagina()
+
+    def cargar_nuevas(self):
+        """Trae solo las modificaciones posteriores a la última vista."""
+        if self.ultimo_id is None:
+            self.cargar_modificaciones()
+            return
+        db_executor.ejecutar(
+            obtener_modificaciones, limite=TAMANO_PAGINA, despues_de_id=self.ultimo_id,
+            al_terminar=self.agregar_nuevas,
+            clave=("modificaciones_nuevas", id(self)))
+
+    def agregar_nuevas(self, modificaciones):
+        """Inserta arriba las modificaciones nuevas, sin recargar el resto."""
+        nuevas = [mod for mod in modificaciones if mod['id'] > (self.ultimo_id or 0)]
+        if not nuevas:
+            return
+        if len(modificaciones) == TAMANO_PAGINA:
+            # Hubo más cambios de los que entran en una página: recargar todo
+            self.cargar_modificaciones()
+            return
+        self.ultimo_id = max(mod['id'] for mod in nuevas)
+        for i, mod in enumerate(nuevas):
+            self.tabla.insertRow(i)
+            self.llenar_fila(i, mod)
+
+    def error_carga(self, error):
+        self.cargando_pagina = False
+        self.btn_actualizar.setEnabled(True)
+
+    def llenar_fila(self, i, mod):
+        argentina_tz = pytz.timezone('America/Argentina/Buenos_Aires')
+
+        # Usuario
+        self.tabla.setItem(i, 0, QTableWidgetItem(mod['usuario']))
+        
+        # Fecha/Hora
+        try:
+            fecha_hora = mod['fecha_hora']
+            if fecha_hora:
+                if isinstance(fecha_hora, str):
+                    fecha_hora = datetime.strptime(fecha_hora, "%Y-%m-%d %H:%M:%S%z")
+                if fecha_hora.tzinfo is None:
+                    fecha_hora = pytz.utc.localize(fecha_hora)
+                fecha_local = fecha_hora.astimezone(argentina_tz)
+                fecha_formateada = fecha_local.strftime("%d/%m/%Y %H:%M")
+                self.tabla.setItem(i, 1, QTableWidgetItem(fecha_formateada))
+            else:
+                self.tabla.setItem(i, 1, QTableWidgetItem(""))
+        except Exception as e:
+            print(f"Error al convertir fecha: {e}")
+            self.tabla.setItem(i, 1, QTableWidgetItem(str(mod['fecha_hora'])))
+
+        # Tipo
+        self.tabla.setItem(i, 2, QTableWidgetItem(mod['tipo_modificacion']))
+        
+        # Producto
+        self.tabla.setItem(i, 3, QTableWidgetItem(mod['producto_nombre']))
+        
+        # Campo (con formato)
+        campo_formateado = self.formatear_nombre_campo(mod['campo_modificado']) if mod['campo_modificado'] else ''
+        self.tabla.setItem(i, 4, QTableWidgetItem(campo_formateado))
+        
+        # Valor anterior
+        self.tabla.setItem(i, 5, QTableWidgetItem(str(mod['valor_anterior'] or '')))
+        
+        # Valor nuevo
+        self.tabla.setItem(i, 6, QTableWidgetItem(str(mod['valor_nuevo'] or '')))
 
     def actualizar_modificaciones(self):
         # Vaciar la tabla
         self.tabla.setRowCount(0)  # Borra todas las filas de la tabla
         self.btn_actualizar.setEnabled(False)  # Deshabilitar el botón de actualización
 
-        # Configurar un temporizador para esperar 1 segundo antes de cargar las modificaciones
-        QTimer.singleShot(1000, self.cargar_modificaciones)  # Esperar 1000 milisegundos (1 segundo)
+        self.cargar_modificaciones()
 
     def mostrar_detalle(self):
         selected = self.tabla.selectedItems()
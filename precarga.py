@@ -0,0 +1,55 @@
+# precarga.py
+import threading
+
+from catalog_index import catalog_index
+from db_executor import db_executor
+import db_postgres
+
+
+def _cargar_catalogo():
+    # A diferencia de obtener_catalogo(), un error llega a quien espera el dato
+    if not catalog_index.esta_vigente():
+        db_postgres.cargar_catalogo()
+    return catalog_index.productos()
+
+
+class PrecargaDatos:
+    """
+    Trae en paralelo, apenas se inicia sesión, los datos que las pestañas
+    necesitan al crearse: catálogo, clientes y usuarios.
+
+    Cada conjunto se pide una sola vez y queda en las cachés de db_postgres
+    (catalog_index y consultas_cache), que se mantienen al día con las
+    escrituras y el change feed. Una pestaña que lo pide mientras la carga
+    sigue en curso espera ese mismo pedido; si ya terminó, se vuelve a leer
+    de la caché en segundo plano, así nunca recibe datos más viejos que los
+    de la caché.
+    """
+
+    CARGAS = {
+        'catalogo': _cargar_catalogo,            # Tuplas en el orden de catalog_index
+        'clientes': db_postgres.obtener_clientes,
+        'usuarios': db_postgres.obtener_usuarios,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pedidos = {}  # clave -> Future de la última carga
+
+    def iniciar(self, claves=None):
+        """Lanza la carga de los conjuntos indicados (todos por defecto)."""
+        with self._lock:
+            for clave in claves or self.CARGAS:
+                self._pedidos[clave] = db_executor.ejecutar(self.CARGAS[clave])
+
+    def al_estar(self, clave, al_terminar, al_fallar=None):
+        """Llama a al_terminar(datos) en el hilo de la interfaz cuando el conjunto está cargado."""
+        with self._lock:
+            pedido = self._pedidos.get(clave)
+            if pedido is None or pedido.done():
+                pedido = self._pedidos[clave] = db_executor.ejecutar(self.CARGAS[clave])
+        db_executor.al_completar(pedido, al_terminar=al_terminar, al_fallar=al_fallar)
+
+
+# Instancia compartida por la ventana principal y las pestañas
+precarga = PrecargaDatos()
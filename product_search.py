@@ -0,0 +1,180 @@
+# product_search.py
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+# Posiciones comunes a las tuplas de buscar_producto() y del índice del catálogo
+ID, CODIGO, NOMBRE = 0, 1, 2
+
+# Niveles de coincidencia, de mejor a peor
+EXACTA, PREFIJO, SUBCADENA, APROXIMADA = range(4)
+
+N = 3  # Tamaño de los n-gramas
+
+
+def normalizar(texto):
+    """Pasa a minúsculas y quita acentos, para que 'Azúcar' y 'azucar' coincidan."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def ngramas(texto):
+    return {texto[i:i + N] for i in range(len(texto) - N + 1)}
+
+
+class ProductSearchIndex:
+    """
+    Índice invertido de trigramas sobre el código y el nombre de los productos.
+
+    Devuelve resultados ordenados por relevancia: código exacto, luego
+    prefijo (del código, del nombre o de una palabra del nombre), luego
+    subcadena y por último coincidencias aproximadas, que toleran errores
+    de tipeo. La búsqueda aproximada se corta al agotar el presupuesto de
+    tiempo, de modo que escribir en el buscador nunca bloquea la interfaz.
+    """
+
+    def __init__(self, presupuesto_ms=15, similitud_minima=0.4, minimo_resultados=10):
+        self.presupuesto_ms = presupuesto_ms
+        self.similitud_minima = similitud_minima
+        self.minimo_resultados = minimo_resultados
+        self._lock = threading.RLock()
+        self._productos = {}  # id -> tupla, en orden de carga
+        self._textos = {}     # id -> (codigo normalizado, nombre normalizado)
+        self._postings = {}   # trigrama -> set de ids
+        self.ultima_duracion_ms = 0.0
+
+    def cargar(self, productos):
+        """Reemplaza el contenido del índice."""
+        with self._lock:
+            self._productos.clear()
+            self._textos.clear()
+            self._postings.clear()
+            for producto in productos:
+                self._indexar(tuple(producto))
+
+    def actualizar(self, producto):
+        """Inserta o reemplaza un producto, conservando su posición si ya existía."""
+        with self._lock:
+            producto = tuple(producto)
+            self._desindexar(producto[ID])
+            self._indexar(producto)
+
+    def eliminar(self, producto_id):
+        with self._lock:
+            self._desindexar(producto_id)
+            self._productos.pop(producto_id, None)
+
+    def productos(self):
+        with self._lock:
+            return list(self._productos.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._productos)
+
+    def _indexar(self, producto):
+        producto_id = producto[ID]
+        codigo = normalizar(producto[CODIGO])
+        nombre = normalizar(producto[NOMBRE])
+        self._productos[producto_id] = producto
+        self._textos[producto_id] = (codigo, nombre)
+        for gram in ngramas(codigo) | ngramas(nombre):
+            self._postings.setdefault(gram, set()).add(producto_id)
+
+    def _desindexar(self, producto_id):
+        textos = self._textos.pop(producto_id, None)
+        if textos is None:
+            return
+        for gram in ngramas(textos[0]) | ngramas(textos[1]):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(producto_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def _nivel(self, consulta, codigo, nombre):
+        """Devuelve (nivel, posición de la coincidencia en el nombre) o None."""
+        if codigo == consulta:
+            return EXACTA, 0
+        posicion = nombre.find(consulta)
+        if codigo.startswith(consulta) or posicion == 0:
+            return PREFIJO, 0
+        if posicion > 0 and nombre[posicion - 1] == ' ':
+            return PREFIJO, posicion  # Comienzo de una palabra del nombre
+        if posicion > 0 or consulta in codigo:
+            return SUBCADENA, max(posicion, 0)
+        return None
+
+    def buscar(self, texto, limite=None, filtro=None):
+        """
+        Busca productos por código o nombre.
+
+        Args:
+            texto: Término ingresado por el usuario. Vacío devuelve todos.
+            limite: Cantidad máxima de resultados (None = sin límite).
+            filtro: Función opcional que recibe la tupla y decide si se incluye.
+
+        Returns:
+            Lista de tuplas de producto ordenada por relevancia.
+        """
+        inicio = time.perf_counter()
+        limite_tiempo = inicio + self.presupuesto_ms / 1000
+        consulta = normalizar(texto).strip()
+
+        with self._lock:
+            if not consulta:
+                resultados = [p for p in self._productos.values() if filtro is None or filtro(p)]
+                self.ultima_duracion_ms = (time.perf_counter() - inicio) * 1000
+                return resultados[:limite] if limite else resultados
+
+            grams = ngramas(consulta)
+            if grams:
+                # Solo los productos con todos los trigramas pueden contener la consulta
+                listas = sorted((self._postings.get(g, set()) for g in grams), key=len)
+                candidatos = set.intersection(*listas) if listas[0] else set()
+            else:
+                # Consultas de 1-2 caracteres: no hay trigramas, se recorre todo
+                candidatos = self._productos.keys()
+
+            puntuados = []
+            for producto_id in candidatos:
+                codigo, nombre = self._textos[producto_id]
+                coincidencia = self._nivel(consulta, codigo, nombre)
+                if coincidencia is None:
+                    continue
+                producto = self._productos[producto_id]
+                if filtro is None or filtro(producto):
+                    nivel, posicion = coincidencia
+                    puntuados.append((nivel, posicion, len(nombre), nombre, producto))
+
+            # La búsqueda aproximada solo completa cuando hay pocas coincidencias
+            # directas; los códigos numéricos solo se buscan exactos o como subcadena
+            if grams and not consulta.isdigit() and len(puntuados) < (limite or self.minimo_resultados):
+                encontrados = {r[-1][ID] for r in puntuados}
+                puntuados.extend(self._aproximados(grams, encontrados, filtro, limite_tiempo))
+
+            puntuados.sort(key=lambda r: r[:-1])
+            resultados = [r[-1] for r in puntuados]
+            self.ultima_duracion_ms = (time.perf_counter() - inicio) * 1000
+            return resultados[:limite] if limite else resultados
+
+    def _aproximados(self, grams, excluir, filtro, limite_tiempo):
+        """Productos que comparten una fracción suficiente de trigramas, sin contener la consulta."""
+        compartidos = Counter()
+        for gram in grams:
+            compartidos.update(self._postings.get(gram, ()))
+            if time.perf_counter() > limite_tiempo:
+                break
+
+        minimo = self.similitud_minima * len(grams)
+        resultados = []
+        for producto_id, cantidad in compartidos.items():
+            if cantidad < minimo or producto_id in excluir:
+                continue
+            producto = self._productos[producto_id]
+            if filtro is None or filtro(producto):
+                nombre = self._textos[producto_id][1]
+                # Más trigramas compartidos = mejor, por eso se ordena por el negativo
+                resultados.append((APROXIMADA, -cantidad, len(nombre), nombre, producto))
+        return resultados
@@ -0,0 +1,204 @@
+# product_table_model.py
+from array import array
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+# Columnas visibles, en el orden de la tabla de ProductosTab
+COLUMNAS = ["ID", "Código", "Nombre", "Cantidad", "Tipo de Venta", "Costo", "Venta", "Margen"]
+
+
+class ProductStore:
+    """
+    Catálogo de productos guardado por columnas (arrays de tipo fijo).
+
+    Cada producto ocupa una posición fija en todas las columnas; los
+    productos eliminados quedan marcados como inactivos hasta la próxima
+    carga completa, así las posiciones nunca se corren.
+
+    Las tuplas de entrada y salida siguen el orden de buscar_producto():
+    (id, codigo_barras, nombre, venta_por_peso, disponible, precio_costo, precio_venta, margen_ganancia)
+    """
+
+    def __init__(self):
+        self.cargar([])
+
+    def cargar(self, productos):
+        self.ids = array('q')
+        self.codigos = []
+        self.nombres = []
+        self.por_peso = array('b')
+        self.disponible = array('d')
+        self.costo = array('d')
+        self.venta = array('d')
+        self.margen = array('d')
+        self.activos = bytearray()
+        self._posicion = {}
+        for producto in productos:
+            self._agregar(producto)
+
+    def _agregar(self, producto):
+        self._posicion[producto[0]] = len(self.ids)
+        self.ids.append(producto[0])
+        self.codigos.append(producto[1] or '')
+        self.nombres.append(producto[2] or '')
+        self.por_peso.append(1 if producto[3] == 1 else 0)
+        self.disponible.append(float(producto[4] or 0))
+        self.costo.append(float(producto[5] or 0))
+        self.venta.append(float(producto[6] or 0))
+        self.margen.append(float(producto[7] or 0))
+        self.activos.append(1)
+
+    def actualizar(self, producto):
+        """
+        Inserta o reemplaza un producto.
+
+        Returns:
+            (posicion, es_nuevo)
+        """
+        posicion = self._posicion.get(producto[0])
+        if posicion is None:
+            self._agregar(producto)
+            return len(self.ids) - 1, True
+        self.codigos[posicion] = producto[1] or ''
+        self.nombres[posicion] = producto[2] or ''
+        self.por_peso[posicion] = 1 if producto[3] == 1 else 0
+        self.disponible[posicion] = float(producto[4] or 0)
+        self.costo[posicion] = float(producto[5] or 0)
+        self.venta[posicion] = float(producto[6] or 0)
+        self.margen[posicion] = float(producto[7] or 0)
+        nuevo = not self.activos[posicion]
+        self.activos[posicion] = 1
+        return posicion, nuevo
+
+    def eliminar(self, producto_id):
+        posicion = self._posicion.get(producto_id)
+        if posicion is not None:
+            self.activos[posicion] = 0
+        return posicion
+
+    def posicion(self, producto_id):
+        posicion = self._posicion.get(producto_id)
+        if posicion is None or not self.activos[posicion]:
+            return None
+        return posicion
+
+    def posiciones_activas(self):
+        return array('l', (i for i, activo in enumerate(self.activos) if activo))
+
+    def producto(self, posicion):
+        return (self.ids[posicion], self.codigos[posicion], self.nombres[posicion],
+                self.por_peso[posicion], self.disponible[posicion], self.costo[posicion],
+                self.venta[posicion], self.margen[posicion])
+
+
+class ProductTableModel(QAbstractTableModel):
+    """
+    Modelo de solo lectura sobre un ProductStore.
+
+    Las filas visibles son un arreglo de posiciones del store: filtrar solo
+    reemplaza ese arreglo y la vista pide el texto de las celdas que está
+    mostrando, sin crear un item por celda.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = ProductStore()
+        self._filas = array('l')
+        self._fila_de = {}  # posición en el store -> fila visible
+
+    # --- API de Qt ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._filas)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNAS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return COLUMNAS[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self.texto(self._filas[index.row()], index.column())
+
+    def texto(self, posicion, columna):
+        """Texto de una celda, con el mismo formato que usaba la tabla anterior."""
+        store = self.store
+        if columna == 0:
+            return str(store.ids[posicion])
+        if columna == 1:
+            return store.codigos[posicion]
+        if columna == 2:
+            return store.nombres[posicion]
+        if columna == 3:
+            cantidad = store.disponible[posicion]
+            return str(cantidad) if store.por_peso[posicion] else str(int(cantidad))
+        if columna == 4:
+            return "Peso" if store.por_peso[posicion] else "Unidad"
+        if columna == 5:
+            return str(store.costo[posicion])
+        if columna == 6:
+            return str(store.venta[posicion])
+        if columna == 7:
+            return str(store.margen[posicion])
+        return None
+
+    # --- Carga, filtro y actualizaciones ---
+
+    def cargar(self, productos):
+        self.beginResetModel()
+        self.store.cargar(productos)
+        self._asignar_filas(self.store.posiciones_activas())
+        self.endResetModel()
+
+    def filtrar(self, producto_ids=None):
+        """Muestra los productos indicados, en ese orden (None = todos)."""
+        if producto_ids is None:
+            posiciones = self.store.posiciones_activas()
+        else:
+            posiciones = array('l')
+            for producto_id in producto_ids:
+                posicion = self.store.posicion(producto_id)
+                if posicion is not None:
+                    posiciones.append(posicion)
+        self.beginResetModel()
+        self._asignar_filas(posiciones)
+        self.endResetModel()
+
+    def _asignar_filas(self, posiciones):
+        self._filas = posiciones
+        self._fila_de = {posicion: fila for fila, posicion in enumerate(posiciones)}
+
+    def actualizar_productos(self, productos):
+        """
+        Aplica productos modificados y avisa a la vista solo de las filas visibles afectadas.
+
+        Returns:
+            True si hubo altas o bajas, que requieren volver a filtrar.
+        """
+        cambia_pertenencia = False
+        ultima_columna = len(COLUMNAS) - 1
+        for producto in productos:
+            posicion, nuevo = self.store.actualizar(producto)
+            cambia_pertenencia |= nuevo
+            fila = self._fila_de.get(posicion)
+            if fila is not None:
+                self.dataChanged.emit(self.index(fila, 0), self.index(fila, ultima_columna))
+        return cambia_pertenencia
+
+    def eliminar_productos(self, producto_ids):
+        for producto_id in producto_ids:
+            self.store.eliminar(producto_id)
+
+    def producto_en_fila(self, fila):
+        if 0 <= fila < len(self._filas):
+            return self.store.producto(self._filas[fila])
+        return None
+
+    def texto_en_fila(self, fila, columna):
+        return self.texto(self._filas[fila], columna)
@@ -1,6 +1,11 @@
-from PyQt6.QtWidgets import QApplication, QDialogButtonBox, QWidget, QFormLayout, QDoubleSpinBox, QVBoxLayout, QDialog ,QAbstractItemView, QPushButton, QHeaderView, QTableWidgetItem, QLineEdit, QTableWidget, QComboBox, QHBoxLayout, QLabel, QMessageBox, QInputDialog
-from db_postgres import agregar_stock_manual_db, agregar_lote_producto, get_db_connection, obtener_lotes_producto, clear_productos_cache, get_cached_productos, obtener_info_lote, marcar_lote_como_vendido, agregar_producto, actualizar_producto, buscar_producto, eliminar_producto, existe_producto, verificar_credenciales
+from PyQt6.QtWidgets import QApplication, QDialogButtonBox, QWidget, QFormLayout, QDoubleSpinBox, QVBoxLayout, QDialog ,QAbstractItemView, QPushButton, QHeaderView, QTableWidgetItem, QLineEdit, QTableWidget, QTableView, QComboBox, QHBoxLayout, QLabel, QMessageBox, QInputDialog, QFileDialog, QCheckBox
+from db_postgres import agregar_stock_manual_db, agregar_lote_producto, get_db_connection, obtener_lotes_producto, clear_productos_cache, get_cached_productos, obtener_info_lote, marcar_lote_como_vendido, agregar_producto, actualizar_producto, buscar_producto, eliminar_producto, existe_producto, verificar_credenciales, importar_productos, exportar_productos, ajustar_precios, generar_codigo_barras_lote
 from signals import signals
+from db_executor import db_executor
+from catalog_index import catalog_index, formato_busqueda
+from precarga import precarga
+from product_search import ProductSearchIndex
+from product_table_model import ProductTableModel
 from PyQt6.QtCore import Qt
 from datetime import datetime
 
@@ -10,6 +15,7 @@ class ProductosTab(QWidget):
         self.usuario_actual = usuario_actual
         self.setObjectName("productos")
         self.producto_actual_id = None
+        self.buscador = ProductSearchIndex()
 
         # Layout principal
         layout = QVBoxLayout()
@@ -20,18 +26,21 @@ class ProductosTab(QWidget):
         self.search_bar.textChanged.connect(self.buscar_productos)
         signals.venta_realizada.connect(self.cargar_productos)
         signals.actualizar_modificaciones.connect(self.cargar_productos)
+        signals.productos_modificados.connect(self.aplicar_cambios_productos)
         layout.addWidget(self.search_bar)
 
         # Tabla de productos
-        self.table = QTableWidget(0, 8)
+        # La vista solo pide al modelo las celdas visibles
+        self.modelo = ProductTableModel(self)
+        self.table = QTableView()
         self.table.setObjectName("productTable")
-        self.table.setHorizontalHeaderLabels(["ID", "Código", "Nombre", "Cantidad", "Tipo de Venta","Costo", "Venta", "Margen"])
+        self.table.setModel(self.modelo)
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setColumnHidden(0, True)  # Ocultar la columna de ID
         self.table.verticalHeader().setVisible(True)
         self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.table.itemSelectionChanged.connect(self.cargar_datos_producto)  # Conectar selección a método
+        self.table.selectionModel().currentRowChanged.connect(lambda *_: self.cargar_datos_producto())  # Conectar selección a método
         layout.addWidget(self.table)
 
         # Formulario para agregar/editar productos
@@ -92,17 +101,59 @@ class ProductosTab(QWidget):
         self.delete_button.setObjectName("deleteButton")
         self.delete_button.clicked.connect(self.eliminar_producto)
         button_layout.addWidget(self.delete_button)
+
+        self.importar_button = QPushButton("Importar Lista")
+        self.importar_button.clicked.connect(self.importar_lista)
+        button_layout.addWidget(self.importar_button)
+
+        self.exportar_button = QPushButton("Exportar Catálogo")
+        self.exportar_button.clicked.connect(self.exportar_catalogo)
+        button_layout.addWidget(self.exportar_button)
+
+        self.ajuste_button = QPushButton("Ajustar Precios")
+        self.ajuste_button.clicked.connect(self.mostrar_ajuste_precios)
+        button_layout.addWidget(self.ajuste_button)
         layout.addLayout(button_layout)
         
         self.setLayout(layout)
 
-        # Cargar todos los productos al iniciar
-        self.cargar_productos()
+        # Carga inicial desde la precarga del login: el catálogo se trae una sola vez
+        precarga.al_estar('catalogo', self.mostrar_catalogo, al_fallar=lambda _: self.cargar_productos())
         
     def cargar_productos(self):
         """Carga todos los productos desde la base de datos y los almacena en memoria."""
-        self.productos = buscar_producto()  # Cargar todos los productos
-        self.actualizar_tabla(self.productos)  # Mostrar todos los productos en la tabla
+        # Consultar en segundo plano; varias recargas seguidas se resuelven con una sola
+        db_executor.ejecutar(buscar_producto, al_terminar=self.mostrar_productos,
+                             clave=("productos", id(self)))
+
+    def mostrar_catalogo(self, productos):
+        self.mostrar_productos([formato_busqueda(producto) for producto in productos])
+
+    def mostrar_productos(self, productos):
+        self.modelo.cargar(productos)
+        self.buscador.cargar(productos)
+        self.buscar_productos()  # Mostrar los productos respetando el filtro actual
+        
+    def aplicar_cambios_productos(self, producto_ids):
+        """Parchea en memoria los productos modificados desde otra terminal."""
+        ids = set(producto_ids)
+        actualizados = {}
+        for producto_id in ids:
+            producto = catalog_index.buscar_por_id(producto_id)
+            if producto is not None:
+                actualizados[producto_id] = formato_busqueda(producto)
+
+        eliminados = ids - actualizados.keys()
+        for producto in actualizados.values():
+            self.buscador.actualizar(producto)
+        for producto_id in eliminados:
+            self.buscador.eliminar(producto_id)
+
+        # Las filas visibles que solo cambiaron de valores se repintan en su lugar
+        hay_altas = self.modelo.actualizar_productos(actualizados.values())
+        self.modelo.eliminar_productos(eliminados)
+        if hay_altas or eliminados or self.search_bar.text().strip():
+            self.buscar_productos()  # Reaplicar el filtro actual
         
     def calcular_margen_o_precio_venta(self):
         """
@@ -218,11 +269,6 @@ class ProductosTab(QWidget):
 
         # Actualizar el producto en la base de datos
         if actualizar_producto(codigo, nombre, costo, venta, margen, cantidad, venta_por_peso, self.usuario_actual, producto_id):
-            clear_productos_cache()
-            get_cached_productos()
-            signals.producto_actualizado.emit()
-            clear_productos_cache()
-            get_cached_productos()
             signals.producto_actualizado.emit()
             QApplication.processEvents()
             QMessageBox.information(self, "Éxito", "Producto actualizado correctamente")
@@ -232,16 +278,16 @@ class ProductosTab(QWidget):
             QMessageBox.warning(self, "Error", "No se pudo actualizar el producto")
             
     def cargar_datos_producto(self):
-        row = self.table.currentRow()
+        row = self.table.currentIndex().row()
         if row < 0:
             return
-        self.producto_actual_id = int(self.table.item(row, 0).text())
-        codigo = self.table.item(row, 1).text()
-        nombre = self.table.item(row, 2).text()
-        cantidad = self.table.item(row, 3).text()
-        costo = self.table.item(row, 5).text()
-        venta = self.table.item(row, 6).text()
-        margen = self.table.item(row, 7).text()
+        self.producto_actual_id = self.modelo.producto_en_fila(row)[0]
+        codigo = self.modelo.texto_en_fila(row, 1)
+        nombre = self.modelo.texto_en_fila(row, 2)
+        cantidad = self.modelo.texto_en_fila(row, 3)
+        costo = self.modelo.texto_en_fila(row, 5)
+        venta = self.modelo.texto_en_fila(row, 6)
+        margen = self.modelo.texto_en_fila(row, 7)
 
         self.codigo_barras.setText(codigo)
         self.nombre.setText(nombre)
@@ -302,52 +348,13 @@ class ProductosTab(QWidget):
         else:
             QMessageBox.warning(self, "Error", message)                
                         
-    def actualizar_tabla(self, productos):
-        # Limpiar la tabla y mostrar los productos
-        self.table.setRowCount(0)
-        for producto in productos:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-
-            # Map database columns to table columns:
-            # Table columns: ["Código", "Nombre", "Cantidad", "Tipo de Venta", "Costo", "Venta", "Margen"]
-            # DB columns:    [id, codigo_barras, nombre, venta_por_peso, disponible, precio_costo, precio_venta, margen_ganancia]
-            self.table.setItem(row, 0, QTableWidgetItem(str(producto[0])))  # ID
-            mapping = {
-                1: 1,  # codigo_barras -> Código
-                2: 2,  # nombre -> Nombre
-                4: 3,  # disponible -> Cantidad
-                3: 4,  # venta_por_peso -> Tipo de Venta
-                5: 5,  # precio_costo -> Costo
-                6: 6,  # precio_venta -> Venta
-                7: 7   # margen_ganancia -> Margen
-            }
-
-            for db_index, table_index in mapping.items():
-                dato = producto[db_index]
-
-                # Convertir "venta_por_peso" a texto "Unidad" o "Peso"
-                if db_index == 3:
-                    dato = "Peso" if dato == 1 else "Unidad"
-
-                # Formatear la columna "Cantidad"
-                if db_index == 4:
-                    cantidad = float(dato)
-                    if producto[3] == 0:  # Si venta_por_peso es 0
-                        dato = int(cantidad)
-                    else:
-                        dato = cantidad
-
-                self.table.setItem(row, table_index, QTableWidgetItem(str(dato)))
-                
     def buscar_productos(self):
         """Filtra los productos según búsqueda en la barra de búsqueda."""
-        term = self.search_bar.text().lower()  # Convertir a minúsculas para comparación
-        productos_filtrados = [
-            producto for producto in self.productos
-            if term in producto[1].lower() or term in producto[2].lower()  # Comparar con nombre y código
-        ]
-        self.actualizar_tabla(productos_filtrados)  # Actualizar la tabla con los productos filtrados 
+        texto = self.search_bar.text()
+        if not texto.strip():
+            self.modelo.filtrar()  # Todos, sin pasar por el índice
+            return
+        self.modelo.filtrar(producto[0] for producto in self.buscador.buscar(texto))
            
     def limpiar_entradas(self):
         # Desconectar señales para evitar cálculos automáticos al limpiar
@@ -606,6 +613,9 @@ class ProductosTab(QWidget):
         
         form_layout.addRow("Fecha Creación:", QLabel(fecha_str))
         form_layout.addRow("Código Único:", QLabel(lote_info[5]))
+        if lote_info[8] is not None:
+            form_layout.addRow("Código de Etiqueta:", QLabel(
+                generar_codigo_barras_lote(lote_info[7], lote_info[8], lote_info[2])))
         form_layout.addRow("Disponible:", QLabel("Sí" if lote_info[4] else "No"))
         
         layout.addLayout(form_layout)
@@ -650,6 +660,213 @@ class ProductosTab(QWidget):
         except Exception as e:
             print(f"Error al actualizar stock: {str(e)}")
 
+    def importar_lista(self):
+        """Importa una lista de productos: primero muestra qué cambiaría y luego la aplica."""
+        if not self.verificar_credenciales_usuario():
+            QMessageBox.warning(self, "Error", "Contraseña incorrecta")
+            return
+        ruta, _ = QFileDialog.getOpenFileName(self, "Importar lista de productos", "",
+                                              "Listas de productos (*.csv *.xlsx)")
+        if not ruta:
+            return
+        self.importar_button.setEnabled(False)
+        db_executor.ejecutar(importar_productos, ruta, self.usuario_actual, simular=True,
+                             al_terminar=lambda resumen: self.confirmar_importacion(ruta, resumen),
+                             al_fallar=self.error_importacion)
+
+    def confirmar_importacion(self, ruta, resumen):
+        if not (resumen['nuevos'] or resumen['modificados']):
+            self.importar_button.setEnabled(True)
+            QMessageBox.information(self, "Importar Lista",
+                                    f"No hay cambios para aplicar ({resumen['invalidos']} filas inválidas).")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Vista previa de la importación")
+        dialog.resize(900, 500)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(
+            f"{resumen['filas']} filas leídas: {resumen['nuevos']} nuevos, "
+            f"{resumen['modificados']} modificados, {resumen['sin_cambios']} sin cambios, "
+            f"{resumen['invalidos']} inválidos, {resumen['duplicados']} repetidos"))
+
+        tabla = QTableWidget(len(resumen['vista_previa']), 7)
+        tabla.setHorizontalHeaderLabels(["Estado", "Línea", "Código", "Nombre", "Costo", "Venta", "Detalle"])
+        tabla.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        for fila, cambio in enumerate(resumen['vista_previa']):
+            anterior, nuevo = cambio['anterior'], cambio['nuevo']
+            valores = [
+                cambio['estado'], str(cambio['linea']), cambio['codigo_barras'] or '',
+                nuevo['nombre'] or '',
+                f"{nuevo['precio_costo']:.2f}" if nuevo['precio_costo'] is not None else '',
+                f"{nuevo['precio_venta']:.2f}" if nuevo['precio_venta'] is not None else '',
+                cambio['motivo'] or (
+                    f"Antes: {anterior['nombre']} ${anterior['precio_venta']:.2f}"
+                    if cambio['estado'] == 'MODIFICADO' else ''),
+            ]
+            for columna, valor in enumerate(valores):
+                tabla.setItem(fila, columna, QTableWidgetItem(valor))
+        tabla.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(tabla)
+
+        botones = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        botones.button(QDialogButtonBox.StandardButton.Ok).setText("Aplicar")
+        botones.accepted.connect(dialog.accept)
+        botones.rejected.connect(dialog.reject)
+        layout.addWidget(botones)
+
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            self.importar_button.setEnabled(True)
+            return
+        db_executor.ejecutar(importar_productos, ruta, self.usuario_actual, simular=False,
+                             al_terminar=self.importacion_terminada,
+                             al_fallar=self.error_importacion)
+
+    def importacion_terminada(self, resumen):
+        self.importar_button.setEnabled(True)
+        QMessageBox.information(self, "Éxito",
+                                f"Importación aplicada: {resumen['nuevos']} productos nuevos, "
+                                f"{resumen['modificados']} modificados.")
+        self.cargar_productos()
+
+    def error_importacion(self, error):
+        self.importar_button.setEnabled(True)
+        QMessageBox.warning(self, "Error", f"No se pudo importar la lista: {error}")
+
+    def exportar_catalogo(self):
+        ruta, _ = QFileDialog.getSaveFileName(self, "Exportar catálogo", "productos.csv",
+                                              "CSV (*.csv);;Excel (*.xlsx)")
+        if not ruta:
+            return
+        self.exportar_button.setEnabled(False)
+        db_executor.ejecutar(exportar_productos, ruta,
+                             al_terminar=self.exportacion_terminada,
+                             al_fallar=self.error_exportacion)
+
+    def exportacion_terminada(self, cantidad):
+        self.exportar_button.setEnabled(True)
+        QMessageBox.information(self, "Éxito", f"Se exportaron {cantidad} productos.")
+
+    def error_exportacion(self, error):
+        self.exportar_button.setEnabled(True)
+        QMessageBox.warning(self, "Error", f"No se pudo exportar el catálogo: {error}")
+
+    def mostrar_ajuste_precios(self):
+        """Diálogo de ajuste masivo de precios sobre los productos filtrados."""
+        if not self.verificar_credenciales_usuario():
+            QMessageBox.warning(self, "Error", "Contraseña incorrecta")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Ajuste de Precios")
+        dialog.resize(900, 550)
+        layout = QVBoxLayout(dialog)
+
+        form = QFormLayout()
+        filtro_nombre = QLineEdit()
+        filtro_nombre.setPlaceholderText("Contiene (vacío = todos)")
+        form.addRow("Nombre:", filtro_nombre)
+        codigos_layout = QHBoxLayout()
+        codigo_desde = QLineEdit()
+        codigo_desde.setPlaceholderText("Desde")
+        codigo_hasta = QLineEdit()
+        codigo_hasta.setPlaceholderText("Hasta")
+        codigos_layout.addWidget(codigo_desde)
+        codigos_layout.addWidget(codigo_hasta)
+        form.addRow("Códigos:", codigos_layout)
+        tipo = QComboBox()
+        tipo.addItems(["Todos", "Por Unidad", "Por Peso"])
+        form.addRow("Tipo de venta:", tipo)
+
+        modos = [("costo", "Aumentar costo % (mantiene margen)"),
+                 ("venta", "Aumentar precio de venta %"),
+                 ("margen", "Fijar margen %")]
+        modo = QComboBox()
+        for clave, texto in modos:
+            modo.addItem(texto, clave)
+        form.addRow("Ajuste:", modo)
+        valor = QDoubleSpinBox()
+        valor.setRange(-99.0, 1000.0)
+        valor.setDecimals(2)
+        valor.setSuffix(" %")
+        form.addRow("Valor:", valor)
+        redondeo = QComboBox()
+        for multiplo in ("0.01", "0.10", "1", "10", "50", "100"):
+            redondeo.addItem(f"${multiplo}", float(multiplo))
+        form.addRow("Redondear venta a:", redondeo)
+        hacia_arriba = QCheckBox("Redondear siempre hacia arriba")
+        form.addRow("", hacia_arriba)
+        layout.addLayout(form)
+
+        resumen = QLabel("Use Vista previa para ver los productos afectados.")
+        layout.addWidget(resumen)
+        tabla = QTableWidget(0, 6)
+        tabla.setHorizontalHeaderLabels(["Código", "Nombre", "Costo", "Costo nuevo", "Venta", "Venta nueva"])
+        tabla.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        tabla.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(tabla)
+
+        botones_layout = QHBoxLayout()
+        btn_vista_previa = QPushButton("Vista previa")
+        btn_aplicar = QPushButton("Aplicar")
+        btn_aplicar.setObjectName("updateButton")
+        btn_cerrar = QPushButton("Cerrar")
+        botones_layout.addWidget(btn_vista_previa)
+        botones_layout.addWidget(btn_aplicar)
+        botones_layout.addWidget(btn_cerrar)
+        layout.addLayout(botones_layout)
+
+        def parametros():
+            return dict(
+                modo=modo.currentData(),
+                valor=valor.value(),
+                nombre=filtro_nombre.text().strip() or None,
+                codigo_desde=codigo_desde.text().strip() or None,
+                codigo_hasta=codigo_hasta.text().strip() or None,
+                venta_por_peso={"Todos": None, "Por Unidad": 0, "Por Peso": 1}[tipo.currentText()],
+                redondeo=redondeo.currentData(),
+                hacia_arriba=hacia_arriba.isChecked(),
+            )
+
+        def mostrar_cambios(cambios, aplicado=False):
+            btn_vista_previa.setEnabled(True)
+            btn_aplicar.setEnabled(True)
+            tabla.setRowCount(len(cambios))
+            for fila, (_, codigo, nombre, costo_a, costo_n, venta_a, venta_n, _) in enumerate(cambios):
+                valores = [codigo or '', nombre, f"{costo_a:.2f}", f"{costo_n:.2f}",
+                           f"{venta_a:.2f}", f"{venta_n:.2f}"]
+                for columna, texto in enumerate(valores):
+                    tabla.setItem(fila, columna, QTableWidgetItem(texto))
+            if aplicado:
+                resumen.setText(f"Se actualizaron {len(cambios)} productos.")
+                self.cargar_productos()
+            else:
+                resumen.setText(f"{len(cambios)} productos cambiarían de precio.")
+
+        def mostrar_error(error):
+            btn_vista_previa.setEnabled(True)
+            btn_aplicar.setEnabled(True)
+            QMessageBox.warning(dialog, "Error", f"No se pudo calcular el ajuste: {error}")
+
+        def ejecutar(simular):
+            btn_vista_previa.setEnabled(False)
+            btn_aplicar.setEnabled(False)
+            db_executor.ejecutar(ajustar_precios, self.usuario_actual, simular=simular,
+                                 al_terminar=lambda cambios: mostrar_cambios(cambios, aplicado=not simular),
+                                 al_fallar=mostrar_error, **parametros())
+
+        def aplicar():
+            respuesta = QMessageBox.question(dialog, "Confirmar",
+                                             "¿Aplicar el ajuste a todos los productos filtrados?",
+                                             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if respuesta == QMessageBox.StandardButton.Yes:
+                ejecutar(simular=False)
+
+        btn_vista_previa.clicked.connect(lambda: ejecutar(simular=True))
+        btn_aplicar.clicked.connect(aplicar)
+        btn_cerrar.clicked.connect(dialog.accept)
+        dialog.exec()
+
     def agregar_stock_manual(self):
         """Muestra diálogo para agregar stock manualmente con comentario"""
         if not self.producto_actual_id:
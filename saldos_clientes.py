@@ -0,0 +1,16 @@
+import sys
+from db_postgres import reconstruir_saldos_clientes, conciliar_saldos_clientes
+
+# Uso:
+#   python saldos_clientes.py reconstruir   -> carga el libro y los saldos desde deudas/pagos
+#   python saldos_clientes.py conciliar     -> compara saldos, libro e historial
+comando = sys.argv[1] if len(sys.argv) > 1 else 'conciliar'
+
+if comando == 'reconstruir':
+    movimientos, clientes = reconstruir_saldos_clientes()
+    print(f"Libro reconstruido: {movimientos} movimientos, {clientes} clientes")
+else:
+    diferencias = conciliar_saldos_clientes()
+    for cliente_id, nombre, campo, valor, esperado in diferencias:
+        print(f"{cliente_id:>5} {nombre:<25} {campo:<13} tabla={valor} esperado={esperado}")
+    print(f"{len(diferencias)} diferencias encontradas")
@@ -5,6 +5,7 @@ class EventSignals(QObject):
     venta_realizada = pyqtSignal()
     cliente_agregado = pyqtSignal()  # Señal para notificar que un cliente fue agregado
     producto_actualizado = pyqtSignal()  # Señal para notificar que un producto fue actualizado
+    productos_modificados = pyqtSignal(list)  # IDs de productos cambiados desde otra terminal
     actualizar_modificaciones = pyqtSignal()
 # Instancia global para manejar señales
 signals = EventSignals()
@@ -0,0 +1,123 @@
+# tickets.py
+import os
+from datetime import datetime
+
+from reportlab.lib.pagesizes import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+import win32api
+
+from db_executor import DbExecutor
+
+DIRECTORIO_TICKETS = "tickets/"
+
+# Márgenes y ancho útil
+MARGEN_HORIZONTAL = 10
+ANCHO_TICKET = 50 * mm
+ANCHO_UTIL = ANCHO_TICKET - (2 * MARGEN_HORIZONTAL)
+
+
+def _texto_linea(nombre, cantidad, precio_unitario, precio_total):
+    if isinstance(cantidad, float):  # Producto a peso variable
+        return f"{nombre} - {cantidad:.2f}kg x ${precio_unitario:.2f}/kg = ${precio_total:.2f}"
+    return f"{nombre} - {cantidad} x ${precio_unitario:.2f} = ${precio_total:.2f}"
+
+
+def generar_ticket(venta_id, lineas, total, metodo_pago, vuelto, monto_pagado):
+    """
+    Genera el PDF del ticket de una venta.
+
+    No consulta la base: las líneas ya traen nombre y precio.
+
+    Args:
+        venta_id: ID de la venta
+        lineas: lista de (nombre, cantidad, precio_unitario, precio_total)
+        total, metodo_pago, vuelto, monto_pagado: datos del pago
+
+    Returns:
+        Ruta absoluta del PDF generado
+    """
+    if not os.path.exists(DIRECTORIO_TICKETS):
+        os.makedirs(DIRECTORIO_TICKETS, exist_ok=True)
+
+    ruta_ticket = os.path.join(DIRECTORIO_TICKETS, f"ticket_{venta_id}.pdf")
+    fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+    # Dividir cada producto en líneas según el ancho disponible
+    textos = [simpleSplit(_texto_linea(*linea), "Helvetica", 8, ANCHO_UTIL) for linea in lineas]
+
+    # Encabezado, separadores y detalles finales, más las líneas de productos
+    cantidad_lineas = 13 + sum(len(texto) for texto in textos)
+    if metodo_pago == "Efectivo":
+        cantidad_lineas += 2  # Líneas extra para "Vuelto" y "Pago"
+
+    # Tamaño de cada línea (10 puntos) y margen adicional
+    ALTURA_TICKET = (cantidad_lineas * 10) + 20
+
+    pdf = canvas.Canvas(ruta_ticket, pagesize=(ANCHO_TICKET, ALTURA_TICKET))
+
+    y_position = ALTURA_TICKET - 10  # Margen superior
+    pdf.setFont("Helvetica-Bold", 10)
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "KIOSCO 25")
+    y_position -= 10
+
+    pdf.setFont("Helvetica", 8)
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
+    y_position -= 10
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, f"Fecha: {fecha_actual}")
+    y_position -= 10
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
+    y_position -= 15
+
+    # Listado de productos
+    pdf.drawString(MARGEN_HORIZONTAL, y_position, "Productos:")
+    y_position -= 10
+    for texto in textos:
+        for linea in texto:
+            pdf.drawString(MARGEN_HORIZONTAL, y_position, linea)
+            y_position -= 10
+
+    # Detalles finales de la venta
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
+    y_position -= 10
+    pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Método de pago: {metodo_pago}")
+    y_position -= 10
+    pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Total: ${total:.2f}")
+
+    if metodo_pago == "Efectivo":
+        y_position -= 10
+        pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Su pago: ${monto_pagado:.2f}")
+        y_position -= 10
+        pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Vuelto: ${vuelto:.2f}")
+    y_position -= 15
+
+    pdf.setFont("Helvetica-Bold", 8)
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "Gracias por su compra")
+    y_position -= 10
+    pdf.setFont("Helvetica", 8)
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
+    pdf.setFont("Helvetica-Oblique", 8)
+    y_position -= 10
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "*NO VÁLIDO COMO FACTURA*")
+    y_position -= 10
+    pdf.setFont("Helvetica", 8)
+    pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
+
+    pdf.save()
+    return os.path.abspath(ruta_ticket)
+
+
+def imprimir_ticket(ruta_ticket):
+    """Envía el ticket a la impresora predeterminada."""
+    if not os.path.exists(ruta_ticket):
+        raise FileNotFoundError(f"El archivo del ticket no existe: {ruta_ticket}")
+    win32api.ShellExecute(0, "print", ruta_ticket, None, ".", 0)
+    return ruta_ticket
+
+
+def generar_e_imprimir(venta_id, lineas, total, metodo_pago, vuelto, monto_pagado):
+    return imprimir_ticket(generar_ticket(venta_id, lineas, total, metodo_pago, vuelto, monto_pagado))
+
+
+# Un solo hilo: los tickets salen en el orden en que se registraron las ventas
+cola_tickets = DbExecutor(max_workers=1)
@@ -1,8 +1,9 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
                            QTableWidgetItem, QPushButton, QDialog, QLineEdit,
                            QLabel, QComboBox, QMessageBox, QHeaderView, QAbstractItemView)
-from PyQt6.QtCore import Qt, QTimer
-from db_postgres import (obtener_usuarios, crear_usuario, eliminar_usuario, modificar_usuario, verificar_credenciales, registrar_desconexion)
+from PyQt6.QtCore import Qt
+from db_postgres import (crear_usuario, eliminar_usuario, modificar_usuario, verificar_credenciales, registrar_desconexion)
+from precarga import precarga
 from datetime import datetime
 import pytz
 
@@ -77,15 +78,11 @@ class UsuariosTab(QWidget):
         self.tabla_usuarios.setRowCount(0)  # Borra todas las filas de la tabla
         self.btn_actualizar.setEnabled(False)  # Deshabilitar el botón de actualización
 
-        # Configurar un temporizador para esperar 2 segundos antes de cargar los usuarios
-        self.timer = QTimer()
-        self.timer.setSingleShot(True)  # Solo se ejecuta una vez
-        self.timer.timeout.connect(self.cargar_usuarios_despues_de_retraso)
-        self.timer.start(1000)  # Esperar 2000 milisegundos (2 segundos)
+        # En segundo plano; la primera vez llega de la precarga del login
+        precarga.al_estar('usuarios', self.mostrar_usuarios,
+                          al_fallar=lambda _: self.btn_actualizar.setEnabled(True))
 
-        
-    def cargar_usuarios_despues_de_retraso(self):
-        usuarios = obtener_usuarios()
+    def mostrar_usuarios(self, usuarios):
         self.tabla_usuarios.setRowCount(len(usuarios))
         
         # Define Argentina timezone
@@ -0,0 +1,19 @@
+import sys
+from db_postgres import reconstruir_ventas_diarias, verificar_ventas_diarias
+
+# Uso:
+#   python ventas_diarias.py reconstruir [desde] [hasta]   -> carga/corrige el resumen
+#   python ventas_diarias.py verificar [desde] [hasta]     -> compara contra un recálculo
+# Las fechas van en formato aaaa-mm-dd; sin fechas se toma todo el historial.
+comando = sys.argv[1] if len(sys.argv) > 1 else 'verificar'
+desde = sys.argv[2] if len(sys.argv) > 2 else None
+hasta = sys.argv[3] if len(sys.argv) > 3 else None
+
+if comando == 'reconstruir':
+    filas = reconstruir_ventas_diarias(desde, hasta)
+    print(f"ventas_diarias reconstruida: {filas} filas")
+else:
+    diferencias = verificar_ventas_diarias(desde, hasta)
+    for fecha, metodo_pago, campo, resumen, recalculado in diferencias:
+        print(f"{fecha} {metodo_pago:<15} {campo:<12} resumen={resumen} recalculado={recalculado}")
+    print(f"{len(diferencias)} diferencias encontradas")
@@ -1,17 +1,24 @@
 from datetime import datetime
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QDialog, QDialogButtonBox, QInputDialog, QPushButton, QHeaderView, QCompleter, QLineEdit, QTableWidget, QTableWidgetItem, QHBoxLayout, QLabel, QMessageBox, QComboBox
-from PyQt6.QtCore import Qt, QStringListModel
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import mm
-from reportlab.lib.utils import simpleSplit
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QDialog, QDialogButtonBox, QInputDialog, QPushButton, QHeaderView, QCompleter, QLineEdit, QTableWidget, QTableWidgetItem, QHBoxLayout, QLabel, QMessageBox, QComboBox, QCheckBox
+from PyQt6.QtCore import Qt, QStringListModel, QTimer
 from config import get_db_path
-from db_postgres import fetch_productos, obtener_lote_por_codigo_barras, obtener_info_lote, obtener_clientes, obtener_producto_por_codigo, obtener_producto_por_id,registrar_venta, buscar_coincidencias_producto
+from db_postgres import obtener_catalogo, obtener_lote_por_codigo_barras, obtener_info_lote, obtener_clientes, obtener_producto_por_codigo, obtener_productos_por_codigos, obtener_producto_por_id,registrar_venta, buscar_coincidencias_producto
 import os
+import re
 from signals import signals
+from db_executor import db_executor
+from product_search import ProductSearchIndex
+from precarga import precarga
+from tickets import cola_tickets, generar_e_imprimir
 import logging
 import win32print
-import win32api
+
+# Códigos que llegan con menos de este intervalo entre sí se procesan juntos
+# (ráfagas del lector o una lista pegada)
+VENTANA_ESCANEO_MS = 80
+
+# Stock restante a partir del cual se avisa después de una venta
+UMBRAL_STOCK_BAJO = 5
 
 # Configuración del logger
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -96,14 +103,24 @@ class VentasTab(QWidget):
         self.product_input = QLineEdit()
         self.product_input.setPlaceholderText("Ingresar código de barras o nombre del producto")
         
-        # Configuración de autocompletado
-        self.completer = QCompleter()
+        # Configuración de autocompletado: las sugerencias ya llegan filtradas
+        # y ordenadas por el índice de búsqueda, el completer solo las muestra
+        self.buscador = ProductSearchIndex()
+        self.modelo_sugerencias = QStringListModel()
+        self.completer = QCompleter(self.modelo_sugerencias)
         self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        self.completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        self.completer.setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
         self.product_input.setCompleter(self.completer)
+        self.product_input.textEdited.connect(self.actualizar_sugerencias)
         self.product_input.returnPressed.connect(self.on_return_pressed)
 
+        # Buffer de escaneos: se vacía cuando pasa VENTANA_ESCANEO_MS sin nuevos códigos
+        self.escaneos_pendientes = []
+        self.timer_escaneos = QTimer(self)
+        self.timer_escaneos.setSingleShot(True)
+        self.timer_escaneos.setInterval(VENTANA_ESCANEO_MS)
+        self.timer_escaneos.timeout.connect(self.procesar_escaneos)
+
         layout.addWidget(self.product_input)
 
         # Tabla de productos en la venta actual
@@ -125,7 +142,7 @@ class VentasTab(QWidget):
         # Selector de cliente
         self.client_selector = QComboBox()
         self.client_selector.setPlaceholderText("-- Seleccionar Cliente --")
-        self.cargar_clientes()  # Método para cargar clientes desde la base de datos
+        precarga.al_estar('clientes', self.mostrar_clientes)
         self.client_selector.hide()  # Ocultar inicialmente
         layout.addWidget(self.client_selector)
         
@@ -161,35 +178,52 @@ class VentasTab(QWidget):
         remove_sale_button.clicked.connect(self.quitar_producto_venta)
         remove_sale_button.setObjectName("quitarProducto")
 
-        register_sale_button = QPushButton("REGISTRAR VENTA")
-        register_sale_button.clicked.connect(self.registrar_venta)
-        register_sale_button.setObjectName("registrarVenta")
+        self.register_sale_button = QPushButton("REGISTRAR VENTA")
+        self.register_sale_button.clicked.connect(self.registrar_venta)
+        self.register_sale_button.setObjectName("registrarVenta")
+
+        # El ticket se genera e imprime en segundo plano si está marcado
+        self.imprimir_ticket_check = QCheckBox("Imprimir ticket")
 
         sale_button_layout = QHBoxLayout()
         sale_button_layout.addWidget(remove_sale_button)
-        sale_button_layout.addWidget(register_sale_button)
+        sale_button_layout.addWidget(self.imprimir_ticket_check)
+        sale_button_layout.addWidget(self.register_sale_button)
         button_widget = QWidget()
         button_widget.setLayout(sale_button_layout)
         layout.addWidget(button_widget)
 
+        # Estado de la última venta y de su ticket (sin ventanas que bloqueen la caja)
+        self.estado_label = QLabel("")
+        layout.addWidget(self.estado_label)
+
+        # Aviso de stock bajo: una sola ventana no modal que acumula productos
+        # hasta que se cierra
+        self.aviso_stock_bajo = None
+        self.productos_stock_bajo = {}
+
 
         self.setLayout(layout)
 
         # Variables para almacenar datos de venta
         self.lista_productos = []
         self.total = 0.0
-        self.inicializar_completers()
+        precarga.al_estar('catalogo', self.buscador.cargar)
         
     def inicializar_completers(self):
-        nombres_productos = fetch_productos()
-        print(f"Nombres de productos: {nombres_productos}")
-        model = self.completer.model()
-        if not model or not isinstance(model, QStringListModel):
-            model = QStringListModel()
-            self.completer.setModel(model)
-        
-        # Update existing model
-        model.setStringList(nombres_productos)
+        self.buscador.cargar(obtener_catalogo())
+
+    def actualizar_sugerencias(self, texto):
+        """Muestra los productos que mejor coinciden con lo escrito."""
+        texto = texto.strip()
+        # Un código escaneado no necesita sugerencias
+        if len(texto) < 2 or texto.isdigit():
+            self.modelo_sugerencias.setStringList([])
+            return
+        resultados = self.buscador.buscar(texto, limite=15)
+        self.modelo_sugerencias.setStringList([producto[2] for producto in resultados])
+        if resultados:
+            self.completer.complete()
 
     def mostrar_selector_cliente(self):
         """Muestra u oculta el selector de cliente según el método de pago."""
@@ -200,18 +234,43 @@ class VentasTab(QWidget):
     
     def cargar_clientes(self):
         """Carga la lista de clientes en el selector."""
+        self.mostrar_clientes(obtener_clientes())  # Función del back-end para obtener clientes
+
+    def mostrar_clientes(self, clientes):
         self.client_selector.clear()
-        clientes = obtener_clientes()  # Función del back-end para obtener clientes
         self.client_selector.addItem("-- Seleccione un cliente --")
         for cliente in clientes:
             self.client_selector.addItem(cliente["nombre"], cliente["id"])
 
     
     def on_return_pressed(self):
-        codigo_o_nombre = self.product_input.text().strip()
-        if not codigo_o_nombre:
+        texto = self.product_input.text().strip()
+        if not texto:
             return
-        
+
+        codigos = re.split(r'[\s,;]+', texto)
+        if all(codigo.isdigit() for codigo in codigos):
+            # Códigos de barras: se acumulan y se procesan juntos al terminar la ráfaga
+            self.escaneos_pendientes.extend(codigos)
+            self.product_input.clear()
+            self.timer_escaneos.start()
+            return
+
+        # Búsqueda por nombre: primero se vuelca lo que estuviera pendiente
+        self.procesar_escaneos()
+        self.procesar_entrada(texto)
+        self.product_input.clear()
+
+    def procesar_escaneos(self):
+        self.timer_escaneos.stop()
+        codigos, self.escaneos_pendientes = self.escaneos_pendientes, []
+        if len(codigos) == 1:
+            # Un código suelto sigue el camino interactivo de siempre
+            self.procesar_entrada(codigos[0])
+        elif codigos:
+            self.agregar_escaneos(codigos)
+
+    def procesar_entrada(self, codigo_o_nombre):
         print(f"Procesando entrada: {codigo_o_nombre}")
 
         # Parsear el código de barras para determinar si es un producto a peso variable
@@ -236,10 +295,87 @@ class VentasTab(QWidget):
         else:
             # Es un producto unitario o búsqueda por nombre
             print("Procesando como producto unitario o búsqueda por nombre")
-            self.agregar_producto()
-        
-        # Limpiar el campo de entrada después de procesar
-        self.product_input.clear()
+            self.agregar_producto(codigo_o_nombre)
+
+    def agregar_escaneos(self, codigos):
+        """
+        Agrega al carrito una ráfaga de códigos escaneados.
+
+        Todos los códigos se resuelven con una sola búsqueda, cada escaneo de
+        un producto por unidad suma una unidad (los repetidos se agrupan en
+        una línea) y la tabla y el total se actualizan una sola vez.
+        """
+        escaneos = [parsear_codigo_producto(codigo) for codigo in codigos]
+        productos = obtener_productos_por_codigos(e["codigo_producto"] for e in escaneos)
+
+        # Cantidades ya en el carrito, para validar el stock de todo junto
+        reservado = {}
+        for producto_id, cantidad, _ in self.lista_productos:
+            reservado[producto_id] = reservado.get(producto_id, 0) + cantidad
+
+        unidades = {}   # id -> [producto, cantidad], en orden de primer escaneo
+        por_peso = []   # (producto, peso_kg), una línea por etiqueta
+        problemas = []
+        for codigo, escaneo in zip(codigos, escaneos):
+            producto = productos.get(escaneo["codigo_producto"])
+            if producto is None:
+                problemas.append(f"{codigo}: producto no encontrado")
+                continue
+            id, nombre, venta_por_peso, disponible = producto[0], producto[2], producto[6], producto[7]
+            if escaneo["tipo"] == "peso_variable":
+                cantidad = escaneo["peso_kg"]
+            elif venta_por_peso == 0:
+                cantidad = 1
+            else:
+                problemas.append(f"{nombre}: se vende por peso, escanear la etiqueta de la balanza")
+                continue
+            if reservado.get(id, 0) + cantidad > disponible:
+                problemas.append(f"{nombre}: stock insuficiente (disponible {float(disponible):g})")
+                continue
+            reservado[id] = reservado.get(id, 0) + cantidad
+            if escaneo["tipo"] == "peso_variable":
+                por_peso.append((producto, cantidad))
+            else:
+                unidades.setdefault(id, [producto, 0])[1] += 1
+
+        # Aplicar todo a la tabla de una vez
+        self.table.itemChanged.disconnect(self.actualizar_cantidad_producto)
+        self.table.setUpdatesEnabled(False)
+        filas_por_id = {linea[0]: fila for fila, linea in enumerate(self.lista_productos)}
+        nuevas = []
+        for id, (producto, cantidad) in unidades.items():
+            precio_venta = producto[4]
+            fila = filas_por_id.get(id)
+            if fila is not None and producto[6] == 0:
+                cantidad += self.lista_productos[fila][1]
+                self.lista_productos[fila] = (id, cantidad, cantidad * precio_venta)
+                self.table.item(fila, 2).setText(str(cantidad))
+                self.table.item(fila, 3).setText(f"${cantidad * precio_venta:.2f}")
+            else:
+                nuevas.append((producto, cantidad, str(cantidad)))
+        nuevas.extend((producto, peso, f"{peso:.3f}") for producto, peso in por_peso)
+
+        fila = self.table.rowCount()
+        self.table.setRowCount(fila + len(nuevas))
+        for producto, cantidad, texto_cantidad in nuevas:
+            precio_total = cantidad * producto[4]
+            self.table.setItem(fila, 0, QTableWidgetItem(producto[1]))
+            self.table.setItem(fila, 1, QTableWidgetItem(producto[2]))
+            self.table.setItem(fila, 2, QTableWidgetItem(texto_cantidad))
+            self.table.setItem(fila, 3, QTableWidgetItem(f"${precio_total:.2f}"))
+            self.table.item(fila, 2).setFlags(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsEnabled)
+            self.lista_productos.append((producto[0], cantidad, precio_total))
+            fila += 1
+
+        self.total = sum(linea[2] for linea in self.lista_productos)
+        self.actualizar_total()
+        self.table.setUpdatesEnabled(True)
+        self.table.itemChanged.connect(self.actualizar_cantidad_producto)
+
+        logging.info(f"Ráfaga de {len(codigos)} códigos: {len(unidades)} productos por unidad, "
+                     f"{len(por_peso)} por peso, {len(problemas)} con problemas")
+        if problemas:
+            QMessageBox.warning(self, "Códigos no agregados", "\n".join(problemas))
     
     def agregar_producto_con_peso(self, producto, peso_kg):
         """Agrega un producto con un peso específico leído del código de barras"""
@@ -277,8 +413,9 @@ class VentasTab(QWidget):
         # Reconectar la señal después de modificar la tabla
         self.table.itemChanged.connect(self.actualizar_cantidad_producto)
     
-    def agregar_producto(self):
-        codigo_o_nombre = self.product_input.text().strip()
+    def agregar_producto(self, codigo_o_nombre=None):
+        if codigo_o_nombre is None:
+            codigo_o_nombre = self.product_input.text().strip()
         logging.debug(f"Intentando agregar producto: {codigo_o_nombre}")
         
         producto = obtener_producto_por_codigo(codigo_o_nombre)
@@ -527,13 +664,7 @@ class VentasTab(QWidget):
                 return
 
             # Registrar la venta sin tomar pago
-            exito, venta_id = registrar_venta(self.lista_productos, self.total, metodo_pago, cliente_id)
-
-            if exito:
-                QMessageBox.information(self, "Venta registrada", "La venta a crédito se ha registrado correctamente.")
-                self.limpiar_datos_venta()
-            else:
-                QMessageBox.warning(self, "Error", "No se pudo registrar la venta a crédito.")
+            self._enviar_venta(self._venta_credito_registrada, metodo_pago, cliente_id)
         else:
             # Para otras formas de pago
             try:
@@ -552,219 +683,95 @@ class VentasTab(QWidget):
                 vuelto = 0
 
             # Registrar la venta con el método de pago
-            exito, venta_id = registrar_venta(self.lista_productos, self.total, metodo_pago)
-
-            if exito:
-
-                mensaje = QMessageBox(self)
-                mensaje.setWindowTitle("Imprimir ticket")
-                mensaje.setText("Desea imprimir el ticket?")
-                mensaje.setIcon(QMessageBox.Icon.Question)
-                
-                # Personalizar los botones
-                btn_si = mensaje.addButton("Sí", QMessageBox.ButtonRole.YesRole)  # Correcto para PyQt6
-                btn_no = mensaje.addButton("No", QMessageBox.ButtonRole.NoRole)  # Correcto para PyQt6
-                
-                # Establecer el botón por defecto
-                mensaje.setDefaultButton(btn_no)
-                
-                # Mostrar el cuadro de diálogo
-                mensaje.exec()
-
-                # Verificar cuál botón fue presionado
-                if mensaje.clickedButton() == btn_si:
-                    # Generar el ticket
-                    ruta_ticket = self.generar_ticket(venta_id, self.lista_productos, self.total, metodo_pago, vuelto, monto_pagado)
-                    if ruta_ticket:
-                        if self.imprimir_ticket(ruta_ticket):
-                            QMessageBox.information(self, "Ticket impreso", "El ticket se ha impreso correctamente.")
-                        else:
-                            QMessageBox.information(self, "Error", "No se pudo imprimir el ticket.")
-                                
-                QMessageBox.information(self, "Venta registrada", "La venta se ha registrado correctamente.")
-                
-                # Verificar stock restante
-                try: # Add try-except block for robustness
-                    for producto_id, _, _ in self.lista_productos: # Iterate through products sold
-                        logging.debug(f"Verificando stock post-venta para producto ID: {producto_id} usando PostgreSQL.")
-                        # Use the existing function to get product details from PostgreSQL
-                        producto_actualizado = obtener_producto_por_id(producto_id)
-
-                        if producto_actualizado is None:
-                            logging.error(f"Producto ID {producto_id} no encontrado en PostgreSQL durante la verificación de stock post-venta.")
-                            continue # Skip if product somehow not found
-
-                        # Assuming index 7 is stock ('disponible') and index 2 is 'nombre'
-                        # Adjust indices if your db_postgres functions return differently
-                        if len(producto_actualizado) > 7:
-                            stock_restante = producto_actualizado[7]
-                            nombre = producto_actualizado[2]
-
-                            # Ensure stock_restante is comparable (e.g., convert Decimal to float/int if needed)
-                            try:
-                                # Example: Convert if stock_restante might be Decimal
-                                from decimal import Decimal
-                                if isinstance(stock_restante, Decimal):
-                                    stock_restante_num = float(stock_restante) # Or int() if always whole numbers
-                                else:
-                                    stock_restante_num = float(stock_restante) # Assume it can be float/int already
-                            except (ValueError, TypeError) as conv_err:
-                                logging.error(f"Error convirtiendo stock restante '{stock_restante}' para producto '{nombre}' (ID: {producto_id}): {conv_err}")
-                                continue # Skip this product if conversion fails
-
-                            logging.debug(f"Stock restante para '{nombre}' (ID: {producto_id}): {stock_restante_num}")
-
-                            # Check if stock is low (e.g., <= 5)
-                            if stock_restante_num <= 5:
-                                logging.warning(f"Alerta de Stock Bajo para '{nombre}'. Restante: {stock_restante_num}")
-                                QMessageBox.warning(self, "Alerta de Stock Bajo", f"El stock del producto {nombre} es bajo. Restante: {stock_restante_num:.2f}.") # Format as needed
-                        else:
-                            logging.warning(f"Datos incompletos recibidos de obtener_producto_por_id para ID {producto_id}. No se pudo verificar stock.")
-
-                except Exception as e:
-                    logging.exception("Error durante la verificación de stock post-venta:")
-                    QMessageBox.critical(self, "Error", f"Ocurrió un error al verificar el stock restante: {e}")
-                # --- Fin de la corrección ---
-                
-                self.limpiar_datos_venta()
-            else:
-                QMessageBox.warning(self, "Error", "No se pudo registrar la venta.")
-
-
-    def generar_ticket(self, venta_id, lista_productos, total, metodo_pago, vuelto, monto_pagado):
-        # Directorio para almacenar los tickets
-        directorio_tickets = "tickets/"
-        if not os.path.exists(directorio_tickets):
-            os.makedirs(directorio_tickets)
-
-        # Nombre y ruta del archivo PDF
-        nombre_archivo = f"ticket_{venta_id}.pdf"
-        ruta_ticket = os.path.join(directorio_tickets, nombre_archivo)
-        ruta_ticket_absoluta = os.path.abspath(ruta_ticket)  # Obtener la ruta absoluta
-        fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        print(ruta_ticket)
-
-        # Márgenes y ancho útil
-        MARGEN_HORIZONTAL = 10
-        ANCHO_TICKET = 50 * mm
-        ANCHO_UTIL = ANCHO_TICKET - (2 * MARGEN_HORIZONTAL)
-
-        # Calcular el número de líneas necesario
-        lineas = 13 # Encabezado, separadores y detalles finales
-        for producto_id, cantidad, precio_total in lista_productos:
-            producto = obtener_producto_por_id(producto_id)
-            if producto is None:
-                continue
-
-            # Preparar texto del producto
-            nombre = producto[2]  # Nombre del producto
-            precio_unitario = producto[4]  # Precio unitario o por kg
-            if isinstance(cantidad, float):  # Producto a peso variable
-                texto_producto = f"{nombre} - {cantidad:.2f}kg x ${precio_unitario:.2f}/kg = ${precio_total:.2f}"
-            else:
-                texto_producto = f"{nombre} - {cantidad} x ${precio_unitario:.2f} = ${precio_total:.2f}"
-
-            # Dividir el texto en líneas según el ancho disponible
-            lineas_producto = simpleSplit(texto_producto, "Helvetica", 8, ANCHO_UTIL)
-            lineas += len(lineas_producto)  # Agregar las líneas requeridas por el producto
-
-        if metodo_pago == "Efectivo":
-            lineas += 2  # Líneas extra para "Vuelto" y "Pago"
-
-        # Tamaño de cada línea (10 puntos) y margen adicional
-        ALTURA_TICKET = (lineas * 10) + 20
-
-        # Crear el canvas con altura dinámica
-        pdf = canvas.Canvas(ruta_ticket, pagesize=(ANCHO_TICKET, ALTURA_TICKET))
-
-        # Configuración inicial del ticket
-        y_position = ALTURA_TICKET - 10  # Margen superior
-        pdf.setFont("Helvetica-Bold", 10)
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "KIOSCO 25")
-        y_position -= 10
-
-        pdf.setFont("Helvetica", 8)
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
-        y_position -= 10
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, f"Fecha: {fecha_actual}")
-        y_position -= 10
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
-        y_position -= 15
-
-        # Listado de productos
-        pdf.drawString(MARGEN_HORIZONTAL, y_position, "Productos:")
-        y_position -= 10
+            self._enviar_venta(
+                lambda resultado: self._venta_registrada(resultado, metodo_pago, vuelto, monto_pagado),
+                metodo_pago)
+
+    def _enviar_venta(self, al_terminar, metodo_pago, cliente_id=None):
+        """Registra la venta en segundo plano, bloqueando la carga hasta que termine."""
+        self.register_sale_button.setEnabled(False)
+        self.product_input.setEnabled(False)
+        # Copia de lo que se envía, para armar el ticket aunque el carrito cambie
+        self.venta_en_curso = (list(self.lista_productos), self.total)
+        db_executor.ejecutar(
+            registrar_venta, self.venta_en_curso[0], self.total, metodo_pago, cliente_id,
+            al_terminar=al_terminar,
+            al_fallar=lambda e: al_terminar((False, None, {})))
+
+    def _desbloquear_venta(self):
+        self.register_sale_button.setEnabled(True)
+        self.product_input.setEnabled(True)
+        self.product_input.setFocus()
+
+    def _venta_credito_registrada(self, resultado):
+        self._desbloquear_venta()
+        exito, venta_id, productos = resultado
+        if exito:
+            self.estado_label.setText(f"Venta a crédito #{venta_id} registrada.")
+            self.limpiar_datos_venta()
+            self.avisar_stock_bajo(productos)
+        else:
+            QMessageBox.warning(self, "Error", "No se pudo registrar la venta a crédito.")
 
-        for producto_id, cantidad, precio_total in lista_productos:
-            producto = obtener_producto_por_id(producto_id)
-            if producto is None:
-                QMessageBox.warning(self, "Error", f"Producto con ID {producto_id} no encontrado.")
-                continue
+    def _venta_registrada(self, resultado, metodo_pago, vuelto, monto_pagado):
+        self._desbloquear_venta()
+        exito, venta_id, productos = resultado
+        if not exito:
+            QMessageBox.warning(self, "Error", "No se pudo registrar la venta.")
+            return
 
-            nombre = producto[2]  # Nombre del producto
-            precio_unitario = producto[4]  # Precio unitario o por kg
-            if isinstance(cantidad, float):  # Producto a peso variable
-                texto_producto = f"{nombre} - {cantidad:.2f}kg x ${precio_unitario:.2f}/kg = ${precio_total:.2f}"
-            else:
-                texto_producto = f"{nombre} - {cantidad} x ${precio_unitario:.2f} = ${precio_total:.2f}"
-
-            # Dividir el texto en líneas según el ancho disponible
-            lineas_producto = simpleSplit(texto_producto, "Helvetica", 8, ANCHO_UTIL)
-            for linea in lineas_producto:
-                pdf.drawString(MARGEN_HORIZONTAL, y_position, linea)
-                y_position -= 10
-
-        # Detalles finales de la venta
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
-        y_position -= 10
-        pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Método de pago: {metodo_pago}")
-        y_position -= 10
-        pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Total: ${total:.2f}")
-
-        if metodo_pago == "Efectivo":
-            y_position -= 10
-            pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Su pago: ${monto_pagado:.2f}")
-            y_position -= 10
-            pdf.drawString(MARGEN_HORIZONTAL, y_position, f"Vuelto: ${vuelto:.2f}")
-            y_position -= 15
+        lista_productos, total = self.venta_en_curso
+        if self.imprimir_ticket_check.isChecked():
+            # Nombres y precios vienen del RETURNING de la venta: el ticket no consulta la base
+            lineas = []
+            for producto_id, cantidad, precio_total in lista_productos:
+                nombre, _, precio_venta = productos[producto_id]
+                lineas.append((nombre, cantidad, float(precio_venta or 0), precio_total))
+            cola_tickets.ejecutar(
+                generar_e_imprimir, venta_id, lineas, total, metodo_pago, vuelto, monto_pagado,
+                al_terminar=lambda ruta: self.estado_label.setText(
+                    f"Ticket de la venta #{venta_id} enviado a la impresora."),
+                al_fallar=lambda e: self.estado_label.setText(
+                    f"No se pudo imprimir el ticket de la venta #{venta_id}: {e}"))
+            self.estado_label.setText(f"Venta #{venta_id} registrada. Imprimiendo ticket...")
         else:
-            y_position -=15
-            
-        pdf.setFont("Helvetica-Bold", 8)
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "Gracias por su compra")
-        y_position -= 10
-        pdf.setFont("Helvetica", 8)
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
-        pdf.setFont("Helvetica-Oblique", 8)
-        y_position -= 10
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "*NO VÁLIDO COMO FACTURA*")
-        y_position -= 10
-        pdf.setFont("Helvetica", 8)
-        pdf.drawCentredString(ANCHO_TICKET / 2, y_position, "=" * 30)
-        y_position -= 10
-
-        # Guardar el archivo PDF
-        pdf.save()
-                        
-        QMessageBox.information(self, "Ticket Generado", f"El ticket de venta ha sido guardado en {ruta_ticket}")
-
-        return ruta_ticket_absoluta  # Retornar la ruta absoluta    
-        
+            self.estado_label.setText(f"Venta #{venta_id} registrada.")
+
+        self.limpiar_datos_venta()
+        self.avisar_stock_bajo(productos)
+
+    def avisar_stock_bajo(self, productos):
+        """
+        Muestra en una única ventana no modal los productos vendidos que
+        quedaron con poco stock.
+
+        Args:
+            productos: dict producto_id -> (nombre, disponible, precio_venta)
+                devuelto por registrar_venta
+        """
+        bajos = {producto_id: (nombre, float(disponible))
+                 for producto_id, (nombre, disponible, _) in productos.items()
+                 if float(disponible) <= UMBRAL_STOCK_BAJO}
+        if not bajos:
+            return
+        for nombre, disponible in bajos.values():
+            logging.warning(f"Alerta de Stock Bajo para '{nombre}'. Restante: {disponible}")
+
+        if self.aviso_stock_bajo is None:
+            self.aviso_stock_bajo = QMessageBox(self)
+            self.aviso_stock_bajo.setWindowTitle("Alerta de Stock Bajo")
+            self.aviso_stock_bajo.setIcon(QMessageBox.Icon.Warning)
+            self.aviso_stock_bajo.setModal(False)
+            # Sin robar el foco: el cajero sigue escaneando
+            self.aviso_stock_bajo.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
+            self.aviso_stock_bajo.finished.connect(lambda _: self.productos_stock_bajo.clear())
+
+        self.productos_stock_bajo.update(bajos)
+        texto = "\n".join(f"{nombre}: quedan {disponible:.2f}"
+                          for nombre, disponible in sorted(self.productos_stock_bajo.values()))
+        self.aviso_stock_bajo.setText(f"Productos con stock bajo:\n{texto}")
+        self.aviso_stock_bajo.show()
 
-    def imprimir_ticket(self, ruta_ticket):
-        # Imprimir el ticket usando la impresora predeterminada
-        try:
-            if os.path.exists(ruta_ticket):  # Verificar que el archivo existe
-                win32api.ShellExecute(0, "print", ruta_ticket, None, ".", 0)
-                return True  # Impresión exitosa
-            else:
-                QMessageBox.warning(self, "Error", "El archivo del ticket no existe.")
-                return False  # Archivo no encontrado
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"No se pudo imprimir el ticket: {e}")
-            return False  # Error en la impresión
-    
-    
     def agregar_lote_a_venta(self, info_lote):
         """Agrega un lote específico a la venta actual"""
         producto_id = info_lote['producto_id']